@@ -7,16 +7,170 @@
 import sys
 import os
 import json
+import socket
+from typing import Any, BinaryIO, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+
+def _strip_option(argv: List[str], option: str) -> List[str]:
+    """Removes an option and its value from an argument list."""
+    stripped: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == option:
+            skip = True
+        elif not arg.startswith(option + "="):
+            stripped.append(arg)
+    return stripped
+
+
+def _request_server(socket_path: str, argv: List[str]) -> Dict[str, Any]:
+    """Sends a command line to the resident server and returns its response.
+
+    Args:
+        socket_path (str): Unix socket of the server.
+        argv (List[str]): Command-line arguments to run.
+
+    Returns:
+        Dict[str, Any]: The command's exit code and captured stdout/stderr.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+        with sock.makefile("rb") as response_f:
+            return json.loads(response_f.readline().decode())
+
+
+def _forwarding_target(argv: List[str]) -> Optional[str]:
+    """Finds the server a command line should be forwarded to, without building the full parser.
+
+    Only the global options ahead of the sub-command are scanned; anything this misses is
+    still forwarded by main() after full argument parsing.
+
+    Args:
+        argv (List[str]): Command-line arguments.
+
+    Returns:
+        Optional[str]: The server's socket path, or None if the command must run locally.
+    """
+    socket_path = os.environ.get("CUPRJ_SERVER")
+    position = 0
+    while position < len(argv):
+        arg = argv[position]
+        if arg in ("--server", "--cache-dir", "--cache-ttl"):
+            if arg == "--server" and position + 1 < len(argv):
+                socket_path = argv[position + 1]
+            position += 2
+        elif arg.startswith("--server="):
+            socket_path = arg[len("--server="):]
+            position += 1
+        elif arg.startswith("-"):
+            position += 1
+        else:
+            # 'serve' is the server itself, and a watch never finishes.
+            if arg == "serve" or "--watch" in argv[position:]:
+                return None
+            return socket_path or None
+    return None
+
+
+# A client of a resident server only relays the command, so it forwards before paying for
+# the generator's imports; main() warns and runs locally if the server cannot be reached.
+if __name__ == "__main__":
+    _socket_path = _forwarding_target(sys.argv[1:])
+    if _socket_path:
+        try:
+            _response = _request_server(_socket_path, _strip_option(sys.argv[1:], "--server"))
+        except (OSError, ValueError):
+            pass
+        else:
+            sys.stdout.write(_response["stdout"])
+            sys.stderr.write(_response["stderr"])
+            sys.exit(_response["exit_code"])
+
+import io
+import time
+import signal
+import threading
+import socketserver
+import codecs
+import pickle
+import shutil
+import hashlib
+import tempfile
+import weakref
+import glob
+import concurrent.futures
+import multiprocessing
+import urllib.error
+import urllib.parse
 import urllib.request
 import yaml
+import re
+import math
+import bisect
 import argparse
 import logging
-from typing import Any, Dict, List, Optional, Union
 from dataclasses import dataclass, field
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
 DEFAULT_IPS_URL: str = "https://raw.githubusercontent.com/shalan/cuprj-cli/refs/heads/main/ip-lib.json"
+IP_LIBRARY_ARG_HELP: str = ("Paths or URLs for IP library JSON files; later libraries override earlier ones "
+                            "(default: GitHub URL, which can also be given as 'default').")
+DEFAULT_CACHE_DIR: str = os.environ.get("CUPRJ_CACHE_DIR",
+                                        os.path.join(os.path.expanduser("~"), ".cache", "cuprj-cli"))
+DEFAULT_CACHE_TTL: int = 3600
+DEFAULT_FETCH_TIMEOUT: int = 30
+# The entries the tool creates in the cache directory; 'cache purge' removes only these.
+CACHE_SUBDIRECTORIES: List[str] = ["libraries", "snapshots", "search", "generated"]
+STREAM_CHUNK_SIZE: int = 64 * 1024
+# Bump whenever the library dataclasses change so stale snapshots are ignored.
+SNAPSHOT_VERSION: int = 4
+SEARCH_INDEX_VERSION: int = 1
+OFFSET_INDEX_FORMAT: str = "cuprj-offset-index"
+OFFSET_INDEX_VERSION: int = 1
+SHARDED_LIBRARY_FORMAT: str = "cuprj-sharded-library"
+SHARDED_LIBRARY_VERSION: int = 1
+SLAVE_ADDR_SIZE: int = 0x10000
+DEFAULT_BACKEND: str = "classic"
+BACKENDS: Tuple[str, ...] = ("classic", "pipelined")
+# Depth of the in-order queue of outstanding requests of the pipelined backend.
+PIPELINED_OUTSTANDING: int = 4
+MUX_STYLES: Tuple[str, ...] = ("priority", "onehot", "tree")
+DECODER_STYLES: Tuple[str, ...] = ("range", "mask", "auto")
+# Estimated cells of one chip select: two 32-bit magnitude comparators against constants (the
+# base + size adder folds away) for a range decoder, about one cell per compared bit for a mask.
+RANGE_DECODER_CELLS: int = 2 * 32 + 1
+MAX_DECODE_STAGES: int = 2
+MAX_RESPONSE_STAGES: int = 4
+
+
+@dataclass
+class CacheConfig:
+    """Settings for the on-disk cache of remote IP libraries.
+
+    Attributes:
+        directory (str): Root directory of the cache.
+        ttl (int): Seconds a cached copy is used without revalidating it with the server.
+        enabled (bool): If False, remote libraries are always downloaded and never stored.
+    """
+    directory: str = DEFAULT_CACHE_DIR
+    ttl: int = DEFAULT_CACHE_TTL
+    enabled: bool = True
+
+
+def _env_int(name: str, default: int) -> int:
+    """Reads an integer from the environment, falling back to a default."""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logging.warning(f"Ignoring invalid value for {name}: '{os.environ.get(name)}'.")
+        return default
+
+
+cache_config = CacheConfig(ttl=_env_int("CUPRJ_CACHE_TTL", DEFAULT_CACHE_TTL))
 
 @dataclass
 class ExternalInterface:
@@ -47,11 +201,15 @@ class IPInfo:
         description (str): Description of the IP.
         bus (List[str]): Supported bus types.
         cell_count (List[Dict[str, Union[str, int]]]): List of cell count entries.
+        category (str): IP category (e.g. "digital").
+        tags (List[str]): Free-form tags.
     """
     name: str
     description: str = "No description provided."
     bus: List[str] = field(default_factory=list)
     cell_count: List[Dict[str, Union[str, int]]] = field(default_factory=list)
+    category: str = ""
+    tags: List[str] = field(default_factory=list)
 
 
 @dataclass
@@ -70,19 +228,383 @@ class IPLibraryEntry:
     fifos: Optional[List[Dict[str, Any]]] = None
 
 
+def wb_cell_count(cell_count: List[Dict[str, Union[str, int]]]) -> Optional[int]:
+    """Returns the WB cell count from an IP's cell count entries.
+
+    Args:
+        cell_count (List[Dict[str, Union[str, int]]]): The 'cell_count' list of an IP.
+
+    Returns:
+        Optional[int]: The WB cell count, or None if it is missing or not a number (e.g. "TBD").
+    """
+    for entry in cell_count:
+        if "WB" in entry:
+            return int(entry["WB"]) if str(entry["WB"]).isdigit() else None
+    return None
+
+
 @dataclass
+class IPSummary:
+    """Holds the fields of an IP that the catalogue indexes.
+
+    Attributes:
+        name (str): The name of the IP.
+        bus (List[str]): Supported bus types.
+        category (str): IP category.
+        tags (List[str]): Free-form tags.
+        interrupts (bool): True if the IP has interrupt flags.
+        fifos (bool): True if the IP has FIFOs.
+        wb_cell_count (Optional[int]): WB cell count, if known.
+    """
+    name: str
+    bus: List[str] = field(default_factory=list)
+    category: str = ""
+    tags: List[str] = field(default_factory=list)
+    interrupts: bool = False
+    fifos: bool = False
+    wb_cell_count: Optional[int] = None
+
+    @classmethod
+    def from_entry(cls, entry: IPLibraryEntry) -> "IPSummary":
+        """Builds a summary from a library entry."""
+        return cls(
+            name=entry.info.name,
+            bus=entry.info.bus,
+            category=entry.info.category,
+            tags=entry.info.tags,
+            interrupts=entry.flags is not None,
+            fifos=bool(entry.fifos),
+            wb_cell_count=wb_cell_count(entry.info.cell_count),
+        )
+
+
+class IPCatalogue:
+    """Secondary indexes over an IP library for the query commands.
+
+    The indexes are built once: by name, by supported bus, by category and
+    tag, by interrupt and FIFO capability, and a sorted index on the WB cell
+    count for range queries.
+    """
+
+    def __init__(self, summaries: Iterable[IPSummary]) -> None:
+        """
+        Args:
+            summaries (Iterable[IPSummary]): One summary per IP, in library order.
+        """
+        self.by_name: Dict[str, IPSummary] = {}
+        self.by_bus: Dict[str, Set[str]] = {}
+        self.by_category: Dict[str, Set[str]] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        self.with_interrupts: Set[str] = set()
+        self.with_fifos: Set[str] = set()
+        for summary in summaries:
+            self.by_name[summary.name] = summary
+            for bus in summary.bus:
+                self.by_bus.setdefault(bus.upper(), set()).add(summary.name)
+            if summary.category:
+                self.by_category.setdefault(summary.category.lower(), set()).add(summary.name)
+            for tag in summary.tags:
+                self.by_tag.setdefault(str(tag).lower(), set()).add(summary.name)
+            if summary.interrupts:
+                self.with_interrupts.add(summary.name)
+            if summary.fifos:
+                self.with_fifos.add(summary.name)
+        self._order = {name: position for position, name in enumerate(self.by_name)}
+        by_cells = sorted((s.wb_cell_count, s.name) for s in self.by_name.values() if s.wb_cell_count is not None)
+        self._cell_counts = [count for count, _ in by_cells]
+        self._cell_names = [name for _, name in by_cells]
+
+    def supporting_bus(self, bus: str) -> Set[str]:
+        """Returns the IPs that support a bus; 'generic' IPs support every bus."""
+        return self.by_bus.get(bus.upper(), set()) | self.by_bus.get("GENERIC", set())
+
+    def in_cell_range(self, min_cells: Optional[int] = None, max_cells: Optional[int] = None) -> Set[str]:
+        """Returns the IPs whose WB cell count lies in [min_cells, max_cells]."""
+        lo = 0 if min_cells is None else bisect.bisect_left(self._cell_counts, min_cells)
+        hi = len(self._cell_counts) if max_cells is None else bisect.bisect_right(self._cell_counts, max_cells)
+        return set(self._cell_names[lo:hi])
+
+    def query(self, bus: Optional[str] = None, category: Optional[str] = None, tags: Iterable[str] = (),
+              interrupts: Optional[bool] = None, fifos: Optional[bool] = None,
+              min_cells: Optional[int] = None, max_cells: Optional[int] = None) -> List[IPSummary]:
+        """Returns the IPs matching every given criterion, in library order.
+
+        Args:
+            bus (Optional[str]): Required bus support.
+            category (Optional[str]): Required category.
+            tags (Iterable[str]): Tags that must all be present.
+            interrupts (Optional[bool]): Required interrupt capability, or None for either.
+            fifos (Optional[bool]): Required FIFO capability, or None for either.
+            min_cells (Optional[int]): Minimum WB cell count.
+            max_cells (Optional[int]): Maximum WB cell count.
+
+        Returns:
+            List[IPSummary]: Matching IPs.
+        """
+        candidates: List[Set[str]] = []
+        if bus:
+            candidates.append(self.supporting_bus(bus))
+        if category:
+            candidates.append(self.by_category.get(category.lower(), set()))
+        for tag in tags:
+            candidates.append(self.by_tag.get(tag.lower(), set()))
+        if interrupts is True:
+            candidates.append(self.with_interrupts)
+        if fifos is True:
+            candidates.append(self.with_fifos)
+        if min_cells is not None or max_cells is not None:
+            candidates.append(self.in_cell_range(min_cells, max_cells))
+        if candidates:
+            candidates.sort(key=len)
+            names = set(candidates[0]).intersection(*candidates[1:])
+        else:
+            names = set(self.by_name)
+        if interrupts is False:
+            names -= self.with_interrupts
+        if fifos is False:
+            names -= self.with_fifos
+        return [self.by_name[name] for name in sorted(names, key=self._order.__getitem__)]
+
+
 class IPLibrary:
     """Represents the entire IP library.
 
-    Attributes:
-        slaves (List[IPLibraryEntry]): List of library entries.
+    Raw entries are indexed by IP name when the library is loaded, but an
+    IPLibraryEntry is only built the first time it is looked up. Commands that
+    need a few IPs therefore never pay for the rest of the catalogue.
     """
-    slaves: List[IPLibraryEntry] = field(default_factory=list)
+
+    def __init__(self, slaves: Optional[List[IPLibraryEntry]] = None,
+                 raw_entries: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """
+        Args:
+            slaves (Optional[List[IPLibraryEntry]]): Already built library entries.
+            raw_entries (Optional[Dict[str, Dict[str, Any]]]): Raw JSON entries keyed by IP name.
+        """
+        self._raw: Dict[str, Optional[Dict[str, Any]]] = dict(raw_entries or {})
+        self._entries: Dict[str, IPLibraryEntry] = {}
+        self._catalogue: Optional[IPCatalogue] = None
+        # SHA-256 of the library source, set by load_ip_library; keys derived caches such as the search index.
+        self.content_hash: Optional[str] = None
+        for entry in slaves or []:
+            self._raw.setdefault(entry.info.name, None)
+            self._entries[entry.info.name] = entry
+
+    def names(self) -> List[str]:
+        """Returns the IP names in library order."""
+        return list(self._raw)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._raw
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def raw_entry(self, name: str) -> Optional[Dict[str, Any]]:
+        """Returns the raw JSON entry of an IP, or None if it is unknown."""
+        if name not in self._raw:
+            return None
+        return self._raw[name]
+
+    def get(self, name: str) -> Optional[IPLibraryEntry]:
+        """Returns the entry of an IP, building it on first access.
+
+        Args:
+            name (str): The IP name.
+
+        Returns:
+            Optional[IPLibraryEntry]: The entry, or None if the IP is unknown.
+        """
+        entry = self._entries.get(name)
+        if entry is None and name in self._raw:
+            entry = parse_ip_library_entry(self.raw_entry(name))
+            self._entries[name] = entry
+        return entry
+
+    def summary(self, name: str) -> IPSummary:
+        """Returns the indexed fields of an IP."""
+        return IPSummary.from_entry(self.get(name))
+
+    @property
+    def catalogue(self) -> IPCatalogue:
+        """Returns the secondary indexes over the library, built on first access."""
+        if self._catalogue is None:
+            self._catalogue = IPCatalogue(self.summary(name) for name in self._raw)
+        return self._catalogue
 
     @property
-    def ip_dict(self) -> Dict[str, IPLibraryEntry]:
-        """Returns a dictionary mapping IP names to their entries."""
-        return {entry.info.name: entry for entry in self.slaves}
+    def ip_dict(self) -> Mapping[str, IPLibraryEntry]:
+        """Returns a read-only mapping of IP names to their entries, built on access."""
+        return _LazyEntryMap(self)
+
+    @property
+    def slaves(self) -> List[IPLibraryEntry]:
+        """Returns all library entries, building any that were not used yet."""
+        return [self.get(name) for name in self._raw]
+
+
+class ShardedIPLibrary(IPLibrary):
+    """An IP library stored as a manifest plus one JSON shard per IP.
+
+    The manifest ('index.json') lists every IP with its name, bus list, WB cell
+    count and shard path. Shards are fetched, relative to the manifest, only
+    when an IP is first looked up; remote shards go through the on-disk cache.
+    """
+
+    def __init__(self, manifest_entries: List[Dict[str, Any]], manifest_source: str) -> None:
+        """
+        Args:
+            manifest_entries (List[Dict[str, Any]]): The 'slaves' rows of the manifest.
+            manifest_source (str): File path or URL of the manifest.
+        """
+        super().__init__(raw_entries={row["name"]: None for row in manifest_entries})
+        self.manifest: Dict[str, Dict[str, Any]] = {row["name"]: row for row in manifest_entries}
+        self.manifest_source = manifest_source
+
+    def shard_source(self, name: str) -> str:
+        """Returns the file path or URL of an IP's shard."""
+        shard = self.manifest[name]["shard"]
+        if os.path.exists(self.manifest_source):
+            return os.path.join(os.path.dirname(os.path.abspath(self.manifest_source)), shard)
+        return urllib.parse.urljoin(self.manifest_source, shard)
+
+    def summary(self, name: str) -> IPSummary:
+        """Returns the indexed fields of an IP from the manifest, reading the shard only for old manifests."""
+        row = self.manifest[name]
+        if not {"category", "tags", "interrupts", "fifos"} <= row.keys():
+            return super().summary(name)
+        return IPSummary(
+            name=name,
+            bus=row.get("bus", []),
+            category=row["category"],
+            tags=row["tags"],
+            interrupts=row["interrupts"],
+            fifos=row["fifos"],
+            wb_cell_count=row.get("wb_cell_count"),
+        )
+
+    def raw_entry(self, name: str) -> Optional[Dict[str, Any]]:
+        if name not in self._raw:
+            return None
+        if self._raw[name] is None:
+            source = self.shard_source(name)
+            try:
+                self._raw[name] = json.loads(read_source_bytes(source).decode())
+            except Exception as e:
+                logging.error(f"Error decoding IP library shard '{source}': {e}")
+                sys.exit(1)
+        return self._raw[name]
+
+
+class IndexedIPLibrary(IPLibrary):
+    """A single-file IP library read through a byte-offset sidecar index.
+
+    The sidecar ('<library>.offsets.json') maps each IP name to the byte
+    range of its entry in the library file. An entry is decoded from its own
+    byte range on first lookup: with a seek for local files (including the
+    cached copy of a remote library), or with an HTTP Range request for URLs
+    when caching is disabled. If the library no longer matches the sidecar,
+    the whole library is loaded instead, as it is when the server does not
+    support Range requests.
+    """
+
+    def __init__(self, source: str, offset_index: Dict[str, Any]) -> None:
+        """
+        Args:
+            source (str): File path or URL of the library.
+            offset_index (Dict[str, Any]): The decoded sidecar index.
+        """
+        self.offsets: Dict[str, List[int]] = offset_index["entries"]
+        super().__init__(raw_entries={name: None for name in self.offsets})
+        self.source = source
+        self.size: int = offset_index["size"]
+        self._fallback: Optional[IPLibrary] = None
+
+    def raw_entry(self, name: str) -> Optional[Dict[str, Any]]:
+        if name not in self._raw:
+            return None
+        if self._fallback is not None:
+            return self._fallback.raw_entry(name)
+        if self._raw[name] is None:
+            start, end = self.offsets[name]
+            try:
+                raw = read_source_range(self.source, start, end, self.size)
+            except (urllib.error.URLError, OSError) as e:
+                logging.error(f"Error fetching '{name}' from IP library '{self.source}': {e}")
+                sys.exit(1)
+            except RangeNotSupportedError:
+                logging.info(f"'{self.source}' does not support range requests; loading the whole library.")
+                self._fallback = load_ip_library(self.source)
+                return self._fallback.raw_entry(name)
+            except ValueError as e:
+                logging.warning(f"Offset index of '{self.source}' is out of date ({e}); loading the whole library.")
+                self._fallback = load_ip_library(self.source)
+                return self._fallback.raw_entry(name)
+            try:
+                entry = json.loads(raw.decode())
+                if entry.get("info", {}).get("name") != name:
+                    raise ValueError(f"range {start}-{end} does not hold '{name}'")
+            except Exception as e:
+                logging.warning(f"Offset index of '{self.source}' is out of date ({e}); loading the whole library.")
+                self._fallback = load_ip_library(self.source)
+                return self._fallback.raw_entry(name)
+            self._raw[name] = entry
+        return self._raw[name]
+
+
+class MergedIPLibrary(IPLibrary):
+    """Several IP libraries layered in order, later layers taking precedence.
+
+    An IP defined in more than one layer is taken as a whole from the last
+    layer that defines it; entries are never merged field by field. IPs keep
+    the position where they first appear.
+    """
+
+    def __init__(self, layers: List[IPLibrary]) -> None:
+        """
+        Args:
+            layers (List[IPLibrary]): The libraries, lowest precedence first.
+        """
+        self.layers = layers
+        self._owner: Dict[str, IPLibrary] = {}
+        for layer in layers:
+            for name in layer.names():
+                self._owner[name] = layer
+        super().__init__(raw_entries={name: None for name in self._owner})
+
+    def owner(self, name: str) -> Optional[IPLibrary]:
+        """Returns the layer an IP is taken from."""
+        return self._owner.get(name)
+
+    def summary(self, name: str) -> IPSummary:
+        return self._owner[name].summary(name)
+
+    def raw_entry(self, name: str) -> Optional[Dict[str, Any]]:
+        if name not in self._owner:
+            return None
+        return self._owner[name].raw_entry(name)
+
+
+class _LazyEntryMap(Mapping):
+    """Mapping view over an IPLibrary that builds entries on lookup."""
+
+    def __init__(self, library: IPLibrary) -> None:
+        self._library = library
+
+    def __getitem__(self, name: str) -> IPLibraryEntry:
+        entry = self._library.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._library
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._library.names())
+
+    def __len__(self) -> int:
+        return len(self._library)
 
 
 @dataclass
@@ -147,31 +669,258 @@ class ProcessedSlave:
     external_interface: List[ExternalInterface]
 
 
-def load_json_file(source: str) -> Dict[str, Any]:
-    """Loads JSON data from a file or URL.
+@dataclass
+class BusOptions:
+    """Interconnect options given at the top level of the bus YAML.
+
+    Attributes:
+        backend (str): The bus backend: "classic" (Wishbone B4 classic) or "pipelined" (Wishbone B4
+            pipelined, with stall and in-order outstanding requests).
+        mux (str): Structure of the read-data/ack multiplexer: "priority" (if/else chain),
+            "onehot" (AND-OR reduction) or "tree" (balanced tree of 2:1 multiplexers).
+        decoder (str): Chip select decoding: "range" (comparators), "mask" (compare the upper
+            address bits of aligned regions) or "auto" (mask where aligned, range elsewhere).
+        decode_stages (int): Register stages between the master and the slaves (0-2); the
+            second one registers the chip selects.
+        response_stages (int): Register stages between the read-data mux and the master.
+        clusters (List[List[str]]): Names of the slaves of each cluster (sub-bus).
+        cluster_size (int): If set, the slaves are grouped into clusters of this many slaves in
+            address order.
+    """
+    backend: str = DEFAULT_BACKEND
+    mux: str = "priority"
+    decoder: str = "range"
+    decode_stages: int = 0
+    response_stages: int = 0
+    clusters: List[List[str]] = field(default_factory=list)
+    cluster_size: int = 0
+
+
+@dataclass(frozen=True)
+class RequestSignals:
+    """The request signals that drive the slaves.
+
+    `{idx}` in a signal stands for the index of the slave.
+    """
+    adr: str
+    dat: str
+    we: str
+    stb: str
+    cyc: str
+
+    def slave(self, idx: int) -> "RequestSignals":
+        """Returns the signals that drive one slave."""
+        return RequestSignals(*(signal.format(idx=idx) for signal in
+                                (self.adr, self.dat, self.we, self.stb, self.cyc)))
+
+
+WB_REQUEST = RequestSignals("wb_adr", "wb_dat_i", "wb_we", "wb_stb & cs{idx}", "wb_cyc & cs{idx}")
+REGISTERED_REQUEST = RequestSignals("req_adr", "req_dat", "req_we", "req_stb & cs{idx}", "wb_cyc & cs{idx}")
+BRIDGE_REQUEST = RequestSignals("bridge{idx}_adr", "bridge{idx}_dat", "bridge{idx}_we", "bridge{idx}_stb",
+                                "bridge{idx}_cyc")
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Writes bytes to a file through a temporary file and a rename.
+
+    Readers never observe a partially written file, even if several
+    processes write the same path concurrently.
+
+    Args:
+        path (str): Destination file path.
+        data (bytes): File content.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as tmp_f:
+            tmp_f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _library_cache_paths(url: str) -> Tuple[str, str]:
+    """Returns the (data, metadata) cache file paths for a remote library URL."""
+    key = hashlib.sha256(url.encode()).hexdigest()
+    base = os.path.join(cache_config.directory, "libraries", key)
+    return base + ".json", base + ".meta.json"
+
+
+def _read_cache_meta(meta_path: str) -> Dict[str, Any]:
+    """Reads a cache metadata file, returning an empty dict if it is missing or corrupt."""
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(meta, dict) or not isinstance(meta.get("fetched_at", 0), (int, float)):
+        return {}
+    return meta
+
+
+def _write_cache_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    try:
+        atomic_write(meta_path, json.dumps(meta, indent=2).encode())
+    except OSError as e:
+        logging.warning(f"Could not update cache metadata '{meta_path}': {e}")
+
+
+def fetch_remote_file(url: str) -> str:
+    """Brings the cached copy of a remote file up to date and returns its path.
+
+    A cached copy younger than the configured TTL is used without any network
+    access. Older copies are revalidated with a conditional request
+    (If-None-Match / If-Modified-Since), and if the server cannot be reached
+    the stale copy is used with a warning. Downloads are streamed to disk in
+    chunks, so the file is never held in memory as a whole.
+
+    Args:
+        url (str): URL of the file.
+
+    Returns:
+        str: Path of the cached copy.
+    """
+    data_path, meta_path = _library_cache_paths(url)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    meta = _read_cache_meta(meta_path)
+    cached = bool(meta) and os.path.exists(data_path)
+    if cached and time.time() - meta.get("fetched_at", 0) < cache_config.ttl:
+        return data_path
+
+    request = urllib.request.Request(url)
+    if cached:
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(data_path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_f, \
+                urllib.request.urlopen(request, timeout=DEFAULT_FETCH_TIMEOUT) as response:
+            shutil.copyfileobj(response, tmp_f, STREAM_CHUNK_SIZE)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        os.replace(tmp_path, data_path)
+    except urllib.error.HTTPError as e:
+        os.unlink(tmp_path)
+        if e.code == 304 and cached:
+            meta["fetched_at"] = time.time()
+            _write_cache_meta(meta_path, meta)
+            return data_path
+        if cached:
+            logging.warning(f"Server returned HTTP {e.code} for '{url}'; using cached copy.")
+            return data_path
+        raise
+    except (urllib.error.URLError, OSError) as e:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        if cached:
+            logging.warning(f"Could not reach '{url}' ({e}); using stale cached copy.")
+            return data_path
+        raise
+
+    _write_cache_meta(meta_path, {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": time.time(),
+    })
+    return data_path
+
+
+_cache_warning_shown = False
+
+
+def _cache_is_writable() -> bool:
+    """Checks that the cache directory can be used, warning once if it cannot."""
+    global _cache_warning_shown
+    try:
+        os.makedirs(cache_config.directory, exist_ok=True)
+        if os.access(cache_config.directory, os.W_OK):
+            return True
+    except OSError:
+        pass
+    if not _cache_warning_shown:
+        logging.warning(f"Cache directory '{cache_config.directory}' is not writable; caching is disabled.")
+        _cache_warning_shown = True
+    return False
+
+
+def open_remote_source(url: str) -> BinaryIO:
+    """Opens a remote file for reading, through the on-disk cache when it is enabled.
+
+    Args:
+        url (str): URL of the file.
+
+    Returns:
+        BinaryIO: A binary file object; the caller closes it.
+    """
+    if cache_config.enabled and _cache_is_writable():
+        return open(fetch_remote_file(url), "rb")
+    return urllib.request.urlopen(url, timeout=DEFAULT_FETCH_TIMEOUT)
+
+
+def fetch_remote_source(url: str) -> bytes:
+    """Fetches the content of a remote file through the on-disk cache.
+
+    Args:
+        url (str): URL of the file.
+
+    Returns:
+        bytes: Raw file content.
+    """
+    with open_remote_source(url) as f:
+        return f.read()
+
+
+def read_source_bytes(source: str) -> bytes:
+    """Reads the raw content of a file or URL.
+
+    Remote sources are fetched through the on-disk cache (see fetch_remote_source).
 
     Args:
         source (str): File path or URL.
 
     Returns:
-        Dict[str, Any]: Parsed JSON data.
+        bytes: Raw file content.
     """
     if os.path.exists(source):
         try:
-            with open(source, "r") as f:
-                return json.load(f)
+            with open(source, "rb") as f:
+                return f.read()
         except Exception as e:
             logging.error(f"Error reading local JSON file '{source}': {e}")
             sys.exit(1)
     else:
         try:
-            with urllib.request.urlopen(source) as response:
-                return json.loads(response.read().decode())
+            return fetch_remote_source(source)
         except Exception as e:
             logging.error(f"Error fetching JSON file '{source}': {e}")
             sys.exit(1)
 
 
+def load_json_file(source: str) -> Dict[str, Any]:
+    """Loads JSON data from a file or URL.
+
+    Args:
+        source (str): File path or URL.
+
+    Returns:
+        Dict[str, Any]: Parsed JSON data.
+    """
+    raw = read_source_bytes(source)
+    try:
+        return json.loads(raw.decode())
+    except Exception as e:
+        logging.error(f"Error decoding JSON file '{source}': {e}")
+        sys.exit(1)
+
+
 def load_yaml_file(filename: str) -> Dict[str, Any]:
     """Loads YAML data from a file.
 
@@ -189,106 +938,2016 @@ def load_yaml_file(filename: str) -> Dict[str, Any]:
         sys.exit(1)
 
 
-def parse_ip_library(data: Dict[str, Any]) -> IPLibrary:
-    """Parses raw JSON data into an IPLibrary.
+def parse_ip_library_entry(entry: Dict[str, Any]) -> IPLibraryEntry:
+    """Parses one raw JSON library entry into an IPLibraryEntry.
 
     Args:
-        data (Dict[str, Any]): Raw JSON data.
+        entry (Dict[str, Any]): Raw JSON entry.
 
     Returns:
-        IPLibrary: Parsed IP library.
+        IPLibraryEntry: Parsed library entry.
     """
     try:
-        entries = []
         allowed_keys = {"name", "port", "direction", "width", "description", "output_control"}
-        for entry in data.get("slaves", []):
-            info_data = entry.get("info", {})
-            ext_if_data = entry.get("external_interface", [])
-            info = IPInfo(
-                name=info_data.get("name", ""),
-                description=info_data.get("description", "No description provided."),
-                bus=info_data.get("bus", []),
-                cell_count=info_data.get("cell_count", [])
-            )
-            flags = entry.get("flags")
-            fifos = entry.get("fifos")
-            interfaces = [ExternalInterface(**{k: v for k, v in iface.items() if k in allowed_keys})
-                          for iface in ext_if_data]
-            entries.append(IPLibraryEntry(info=info, external_interface=interfaces, flags=flags, fifos=fifos))
-        return IPLibrary(slaves=entries)
+        info_data = entry.get("info", {})
+        ext_if_data = entry.get("external_interface", [])
+        info = IPInfo(
+            name=info_data.get("name", ""),
+            description=info_data.get("description", "No description provided."),
+            bus=info_data.get("bus", []),
+            cell_count=info_data.get("cell_count", []),
+            category=info_data.get("category", ""),
+            tags=info_data.get("tags", [])
+        )
+        flags = entry.get("flags")
+        fifos = entry.get("fifos")
+        interfaces = [ExternalInterface(**{k: v for k, v in iface.items() if k in allowed_keys})
+                      for iface in ext_if_data]
+        return IPLibraryEntry(info=info, external_interface=interfaces, flags=flags, fifos=fifos)
     except Exception as e:
         logging.error(f"Error parsing IP library: {e}")
         sys.exit(1)
 
 
-def parse_bus_slaves(data: Dict[str, Any]) -> BusSlaves:
-    """Parses raw YAML data into BusSlaves.
+def parse_ip_library(data: Dict[str, Any], source: str = "") -> IPLibrary:
+    """Indexes raw JSON data into a lazily built IPLibrary.
 
     Args:
-        data (Dict[str, Any]): Raw YAML data.
+        data (Dict[str, Any]): Raw JSON data, either a full library or a sharded library manifest.
+        source (str): File path or URL the data was read from; shard paths are relative to it.
 
     Returns:
-        BusSlaves: Parsed bus slave configuration.
+        IPLibrary: Parsed IP library.
     """
     try:
-        slaves = [BusSlave(**slave) for slave in data.get("slaves", [])]
-        return BusSlaves(slaves=slaves)
+        if data.get("format") == SHARDED_LIBRARY_FORMAT:
+            if data.get("version", 1) > SHARDED_LIBRARY_VERSION:
+                raise ValueError(f"unsupported sharded library version {data.get('version')}")
+            return ShardedIPLibrary(data.get("slaves", []), source)
+        raw_entries = {entry.get("info", {}).get("name", ""): entry for entry in data.get("slaves", [])}
+        return IPLibrary(raw_entries=raw_entries)
     except Exception as e:
-        logging.error(f"Error parsing bus YAML: {e}")
+        logging.error(f"Error parsing IP library: {e}")
         sys.exit(1)
 
 
-class BusGenerator:
-    """Generates Verilog code for the Wishbone bus module."""
+def _snapshot_path(digest: str) -> str:
+    """Returns the snapshot file path for a library content hash."""
+    return os.path.join(cache_config.directory, "snapshots", f"{digest}.pickle")
 
-    def __init__(self, bus_slaves: BusSlaves, ip_library: IPLibrary, has_pic:bool) -> None:
-        """
-        Args:
-            bus_slaves (BusSlaves): Parsed bus slaves configuration.
-            ip_library (IPLibrary): Parsed IP library.
-        """
-        self.bus_slaves = bus_slaves.slaves
-        self.ip_library = ip_library
-        self.has_pic = has_pic
-        self.processed_slaves: List[ProcessedSlave] = []
-        self._process_slaves()
 
-    def _process_slaves(self) -> None:
-        base_addr_start = 0x10000000
-        base_addr_offset = 0x10000
-        ip_dict = self.ip_library.ip_dict
-        for idx, slave in enumerate(self.bus_slaves):
-            if slave.type not in ip_dict and slave.type != "wb_pic_8":
-                logging.error(f"Slave type '{slave.type}' for slave '{slave.name}' not found in IP library.")
-                sys.exit(1)
-            if slave.type != "wb_pic_8":
-                lib_entry = ip_dict[slave.type]
-                info = lib_entry.info
-                if not any(b.upper() in {"WB", "GENERIC"} for b in info.bus):
-                    logging.warning(f"IP '{slave.type}' (for slave '{slave.name}') does not support WB (bus: {info.bus}). Using 0 cell count.")
-                    cell_count = 0
-                else:
-                    cell_count = 0
-                    for entry in info.cell_count:
-                        if "WB" in entry:
-                            try:
-                                cell_count = int(entry["WB"]) if str(entry["WB"]).isdigit() else 0
-                            except Exception:
-                                cell_count = 0
-                            break
-                if slave.irq is not None and lib_entry.flags is None:
-                    logging.error(f"Slave '{slave.name}' of type '{slave.type}' specifies IRQ but library entry lacks 'flags'.")
-                    sys.exit(1)
-                external_interface=lib_entry.external_interface
-            else:
-                cell_count = 500
-                external_interface = None
+def _load_snapshot(digest: str) -> Optional[IPLibrary]:
+    """Loads a parsed IPLibrary snapshot, or returns None if there is no usable one."""
+    try:
+        with open(_snapshot_path(digest), "rb") as f:
+            version, library = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable library snapshot {digest[:12]}: {e}")
+        return None
+    if version != SNAPSHOT_VERSION or not isinstance(library, IPLibrary):
+        return None
+    return library
 
-            base_address = slave.base_address or f"32'h{hex(base_addr_start + idx * base_addr_offset)[2:].upper()}"
-            io_pins_converted = slave.convert_io_pins()
-            processed = ProcessedSlave(
-                name=slave.name,
-                type=slave.type,
+
+def _store_snapshot(digest: str, library: IPLibrary) -> None:
+    """Stores a parsed IPLibrary snapshot keyed by the library content hash."""
+    path = _snapshot_path(digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, pickle.dumps((SNAPSHOT_VERSION, library), protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as e:
+        logging.warning(f"Could not write library snapshot '{path}': {e}")
+
+
+class _JSONStreamReader:
+    """Minimal pull reader that decodes JSON values from a binary stream chunk by chunk.
+
+    Only the text of the value being decoded is held in memory, which keeps
+    the memory use of walking a large array flat.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Appends the next chunk to the buffer, dropping consumed text. Returns False at EOF."""
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        self._eof = not chunk
+        self._buf = self._buf[self._pos:] + self._text_decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        """Consumes the next non-whitespace character, which must be `char`."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'end of input'}'.")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buf, self._pos)
+                # A number that reaches the end of the decoded text may continue in the next chunk.
+                if self._eof or (end < len(self._buf) and self._buf[end] not in "0123456789+-.eE"):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_library_entries(stream: BinaryIO, header: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Yields the entries of the top-level 'slaves' array of a library one at a time.
+
+    Args:
+        stream (BinaryIO): Binary stream holding the library JSON.
+        header (Optional[Dict[str, Any]]): If given, receives the other top-level keys as they are read.
+
+    Yields:
+        Dict[str, Any]: Raw JSON entries.
+    """
+    reader = _JSONStreamReader(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "slaves":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.peek() == "]":
+                        reader.expect("]")
+                        break
+                    reader.expect(",")
+        else:
+            value = reader.value()
+            if header is not None:
+                header[key] = value
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+# Fields of a library entry that the CLI reads; streaming mode drops everything else.
+# Of the register map, only the register names are kept (for the search index).
+RUNTIME_INFO_KEYS = ("name", "description", "bus", "cell_count", "category", "tags")
+RUNTIME_ENTRY_KEYS = ("external_interface", "flags", "fifos")
+
+
+def prune_library_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a copy of a raw library entry holding only the fields the CLI reads.
+
+    Args:
+        entry (Dict[str, Any]): Raw JSON entry.
+
+    Returns:
+        Dict[str, Any]: The pruned entry.
+    """
+    info = entry.get("info", {})
+    pruned: Dict[str, Any] = {"info": {k: info[k] for k in RUNTIME_INFO_KEYS if k in info}}
+    for key in RUNTIME_ENTRY_KEYS:
+        if key in entry:
+            pruned[key] = entry[key]
+    if entry.get("registers"):
+        pruned["registers"] = [{"name": reg["name"]} for reg in entry["registers"]
+                               if isinstance(reg, dict) and "name" in reg]
+    return pruned
+
+
+def open_library_source(source: str) -> BinaryIO:
+    """Opens a library file or URL as a binary stream.
+
+    Args:
+        source (str): File path or URL.
+
+    Returns:
+        BinaryIO: A binary file object; the caller closes it.
+    """
+    if os.path.exists(source):
+        return open(source, "rb")
+    return open_remote_source(source)
+
+
+def _stream_ip_library(source: str, manifest_source: str, only: Optional[Set[str]] = None) -> IPLibrary:
+    """Parses a library incrementally, keeping only the fields the CLI reads.
+
+    `source` is where the bytes are read from (possibly a cached copy) and
+    `manifest_source` the original location that shard paths are relative to.
+    If `only` is given, the entries of all other IPs are dropped as they stream past.
+    """
+    try:
+        with open_library_source(source) as stream:
+            header: Dict[str, Any] = {}
+            raw_entries = {}
+            manifest_entries = []
+            for entry in iter_library_entries(stream, header):
+                # Manifests write their 'format' key first and are small, so keep their rows as they are.
+                if header.get("format") == SHARDED_LIBRARY_FORMAT:
+                    manifest_entries.append(entry)
+                    continue
+                name = entry.get("info", {}).get("name", "")
+                if only is None or name in only:
+                    raw_entries[name] = prune_library_entry(entry)
+        if header.get("format") == SHARDED_LIBRARY_FORMAT:
+            return parse_ip_library(dict(header, slaves=manifest_entries), manifest_source)
+        return IPLibrary(raw_entries=raw_entries)
+    except Exception as e:
+        logging.error(f"Error streaming IP library '{source}': {e}")
+        sys.exit(1)
+
+
+def _file_sha256(path: str) -> str:
+    """Hashes a file in chunks."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def load_ip_library(source: str, streaming: bool = False, random_access: bool = False,
+                    only: Optional[Set[str]] = None) -> IPLibrary:
+    """Loads and parses an IP library from a file or URL.
+
+    The parsed library is snapshotted in the cache directory, keyed by the
+    SHA-256 of the source bytes. When the content has not changed, the
+    snapshot is loaded directly and JSON decoding and parsing are skipped.
+
+    Args:
+        source (str): File path or URL.
+        streaming (bool): If True, walk the library one entry at a time and keep
+            only the fields the CLI reads. Peak memory is that of the pruned
+            entries that are kept.
+        random_access (bool): If True and the library has a byte-offset sidecar,
+            decode only the entries that are looked up (see IndexedIPLibrary).
+            A remote library is first brought into the cache as a whole, so
+            later runs need no network access; only with caching disabled are
+            its entries fetched with HTTP Range requests.
+        only (Optional[Set[str]]): When streaming, keep only the entries of these IPs,
+            so peak memory does not grow with the size of the library. The result
+            has no content hash, since it does not stand for the whole library.
+
+    Returns:
+        IPLibrary: Parsed IP library.
+    """
+    use_cache = cache_config.enabled and _cache_is_writable()
+    if random_access:
+        path = source
+        if use_cache and not os.path.exists(source):
+            try:
+                path = fetch_remote_file(source)
+            except Exception as e:
+                logging.error(f"Error fetching JSON file '{source}': {e}")
+                sys.exit(1)
+        offset_index = _load_offset_index(source)
+        if offset_index is not None and not os.path.exists(path):
+            # Entries fetched with Range requests are checked one by one, and there is no
+            # content hash to key derived caches on.
+            return IndexedIPLibrary(path, offset_index)
+        if offset_index is not None:
+            # A local file or the cached copy: only trust the sidecar if it describes these bytes.
+            content_hash = _file_sha256(path)
+            if os.path.getsize(path) == offset_index.get("size") and content_hash == offset_index.get("sha256"):
+                library = IndexedIPLibrary(path, offset_index)
+                library.content_hash = content_hash
+                return library
+            logging.warning(f"Offset index of '{source}' is out of date; loading the whole library.")
+    if streaming and not use_cache:
+        return _stream_ip_library(source, source, only)
+    if streaming:
+        try:
+            path = source if os.path.exists(source) else fetch_remote_file(source)
+            content_hash = _file_sha256(path)
+        except Exception as e:
+            logging.error(f"Error fetching JSON file '{source}': {e}")
+            sys.exit(1)
+        suffix = "-stream"
+        if only is not None:
+            suffix += "-" + hashlib.sha256("\0".join(sorted(only)).encode()).hexdigest()[:16]
+        library = _load_snapshot(content_hash + suffix)
+        if library is None:
+            library = _stream_ip_library(path, source, only)
+            _store_snapshot(content_hash + suffix, library)
+    else:
+        raw = read_source_bytes(source)
+        content_hash = hashlib.sha256(raw).hexdigest()
+        library = _load_snapshot(content_hash) if use_cache else None
+        if library is None:
+            try:
+                data = json.loads(raw.decode())
+            except Exception as e:
+                logging.error(f"Error decoding JSON file '{source}': {e}")
+                sys.exit(1)
+            library = parse_ip_library(data, source)
+            if use_cache:
+                _store_snapshot(content_hash, library)
+    if isinstance(library, ShardedIPLibrary):
+        library.manifest_source = source
+    library.content_hash = content_hash if only is None or not streaming else None
+    return library
+
+
+# Relative weight of one term occurrence in each indexed field of an IP.
+SEARCH_FIELD_WEIGHTS: Dict[str, float] = {"name": 5.0, "tags": 3.0, "registers": 2.0, "flags": 1.5, "description": 1.0}
+# BM25 term-frequency saturation.
+SEARCH_TF_SATURATION: float = 1.2
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lower-case alphanumeric search terms, folding simple plurals.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        List[str]: Search terms.
+    """
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class SearchIndex:
+    """Tokenized inverted index over IP names, descriptions, tags, register names and flag descriptions.
+
+    Postings map each term to the IPs containing it and the field-weighted
+    number of occurrences. Ranking uses BM25-style term-frequency saturation
+    and inverse document frequency.
+    """
+
+    def __init__(self, postings: Dict[str, Dict[str, float]], num_documents: int) -> None:
+        """
+        Args:
+            postings (Dict[str, Dict[str, float]]): Term -> IP name -> weighted term frequency.
+            num_documents (int): Number of indexed IPs.
+        """
+        self.postings = postings
+        self.num_documents = num_documents
+
+    @classmethod
+    def build(cls, library: IPLibrary) -> "SearchIndex":
+        """Indexes every entry of a library."""
+        postings: Dict[str, Dict[str, float]] = {}
+        for name in library.names():
+            raw = library.raw_entry(name) or {}
+            info = raw.get("info", {})
+            fields = {
+                "name": [name],
+                "tags": [str(tag) for tag in info.get("tags", []) or []],
+                "description": [str(info.get("description", ""))],
+                "registers": [str(reg.get("name", "")) for reg in raw.get("registers", []) or []
+                              if isinstance(reg, dict)],
+                "flags": [f"{flag.get('name', '')} {flag.get('description', '')}" for flag in raw.get("flags", []) or []
+                          if isinstance(flag, dict)],
+            }
+            for field_name, texts in fields.items():
+                weight = SEARCH_FIELD_WEIGHTS[field_name]
+                for text in texts:
+                    for token in tokenize(text):
+                        postings.setdefault(token, {})
+                        postings[token][name] = postings[token].get(name, 0.0) + weight
+        return cls(postings, len(library))
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Ranks the IPs matching any term of a query.
+
+        Args:
+            text (str): Query text.
+            limit (Optional[int]): Maximum number of results.
+
+        Returns:
+            List[Tuple[str, float]]: (IP name, score) pairs, best first.
+        """
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(text)):
+            matches = self.postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1.0 + self.num_documents / len(matches))
+            for name, tf in matches.items():
+                score = idf * tf * (SEARCH_TF_SATURATION + 1.0) / (tf + SEARCH_TF_SATURATION)
+                scores[name] = scores.get(name, 0.0) + score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"version": SEARCH_INDEX_VERSION, "num_documents": self.num_documents, "postings": self.postings}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> Optional["SearchIndex"]:
+        """Restores an index, or returns None if it was written by another index version."""
+        if data.get("version") != SEARCH_INDEX_VERSION:
+            return None
+        return cls(data["postings"], data["num_documents"])
+
+
+def load_search_index(library: IPLibrary) -> SearchIndex:
+    """Returns the search index of a library, building it once per library content hash.
+
+    Args:
+        library (IPLibrary): The IP library.
+
+    Returns:
+        SearchIndex: The search index.
+    """
+    if library.content_hash is None or not (cache_config.enabled and _cache_is_writable()):
+        return SearchIndex.build(library)
+    path = os.path.join(cache_config.directory, "search", f"{library.content_hash}.json")
+    try:
+        with open(path, "r") as f:
+            index = SearchIndex.from_json(json.load(f))
+        if index is not None:
+            return index
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable search index '{path}': {e}")
+    index = SearchIndex.build(library)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps(index.to_json(), separators=(",", ":")).encode())
+    except OSError as e:
+        logging.warning(f"Could not write search index '{path}': {e}")
+    return index
+
+
+def offset_index_source(source: str) -> str:
+    """Returns the path or URL of a library's byte-offset sidecar ('<name>.offsets.json')."""
+    if os.path.exists(source):
+        return os.path.splitext(source)[0] + ".offsets.json"
+    parts = urllib.parse.urlsplit(source)
+    return urllib.parse.urlunsplit(parts._replace(path=os.path.splitext(parts.path)[0] + ".offsets.json"))
+
+
+class RangeNotSupportedError(Exception):
+    """Raised when a server answers a Range request with the whole file."""
+
+
+def read_source_range(source: str, start: int, end: int, expected_size: int) -> bytes:
+    """Reads bytes [start, end) of a file or URL.
+
+    Local files are read with a seek; URLs with an HTTP Range request.
+
+    Args:
+        source (str): File path or URL.
+        start (int): First byte.
+        end (int): End byte (exclusive).
+        expected_size (int): Total size the file must have; guards against reading a changed file.
+
+    Returns:
+        bytes: The requested bytes.
+
+    Raises:
+        RangeNotSupportedError: If the server ignores the Range header.
+        ValueError: If the file is not the size the offset index was built for.
+    """
+    if os.path.exists(source):
+        if os.path.getsize(source) != expected_size:
+            raise ValueError("library size differs from the offset index")
+        with open(source, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+    request = urllib.request.Request(source, headers={"Range": f"bytes={start}-{end - 1}"})
+    with urllib.request.urlopen(request, timeout=DEFAULT_FETCH_TIMEOUT) as response:
+        if response.status != 206:
+            raise RangeNotSupportedError(source)
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        if total != str(expected_size):
+            raise ValueError("library size differs from the offset index")
+        return response.read()
+
+
+def _load_offset_index(source: str) -> Optional[Dict[str, Any]]:
+    """Loads the byte-offset sidecar of a library, or returns None if there is no usable one.
+
+    A missing remote sidecar is remembered for the cache TTL, so libraries
+    without one do not cost a request on every run.
+    """
+    sidecar = offset_index_source(source)
+    try:
+        if os.path.exists(source):
+            if not os.path.exists(sidecar):
+                return None
+            with open(sidecar, "rb") as f:
+                raw = f.read()
+        elif cache_config.enabled and _cache_is_writable():
+            _, meta_path = _library_cache_paths(sidecar)
+            meta = _read_cache_meta(meta_path)
+            if meta.get("missing") and time.time() - meta.get("fetched_at", 0) < cache_config.ttl:
+                return None
+            try:
+                raw = fetch_remote_source(sidecar)
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    _write_cache_meta(meta_path, {"url": sidecar, "missing": True, "fetched_at": time.time()})
+                return None
+        else:
+            raw = fetch_remote_source(sidecar)
+        index = json.loads(raw.decode())
+    except Exception as e:
+        logging.debug(f"No usable offset index for '{source}': {e}")
+        return None
+    if index.get("format") != OFFSET_INDEX_FORMAT or index.get("version") != OFFSET_INDEX_VERSION:
+        return None
+    if os.path.exists(source) and os.path.getsize(source) != index.get("size"):
+        return None
+    return index
+
+
+def library_sources(args: argparse.Namespace) -> List[str]:
+    """Returns the IP library sources of a command, lowest precedence first.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+
+    Returns:
+        List[str]: File paths or URLs; 'default' stands for the GitHub URL.
+    """
+    sources = args.ip_library or [DEFAULT_IPS_URL]
+    return [DEFAULT_IPS_URL if s == "default" and not os.path.exists(s) else s for s in sources]
+
+
+def _source_content_hash(source: str) -> str:
+    """Hashes the current content of a library file or (cached) URL."""
+    return _file_sha256(source if os.path.exists(source) else fetch_remote_file(source))
+
+
+# In-memory memo of loaded libraries; enabled by the resident server (see serve_command).
+_library_memo: Optional[Dict[Tuple[Tuple[str, ...], bool, bool, Optional[FrozenSet[str]]],
+                             Tuple[Tuple[Any, ...], float, IPLibrary]]] = None
+_library_memo_lock = threading.Lock()
+
+
+def _sources_stamp(sources: List[str]) -> Tuple[Any, ...]:
+    """Returns the modification time and size of every local source."""
+    stamp = []
+    for source in sources:
+        try:
+            st = os.stat(source)
+            stamp.append((source, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((source, None, None))
+    return tuple(stamp)
+
+
+def load_ip_libraries(sources: List[str], streaming: bool = False, random_access: bool = False,
+                      only: Optional[Set[str]] = None) -> IPLibrary:
+    """Loads several IP libraries and layers them, later sources taking precedence.
+
+    In the resident server, loaded libraries are also kept in memory. They
+    are reused until a local source changes or, for remote sources, until the
+    cache TTL expires.
+
+    Args:
+        sources (List[str]): File paths or URLs, lowest precedence first.
+        streaming (bool): Passed on to load_ip_library.
+        random_access (bool): Passed on to load_ip_library.
+        only (Optional[Set[str]]): The IPs the command looks up; with random access,
+            passed on to load_ip_library. Other IPs may be missing from the result.
+
+    Returns:
+        IPLibrary: The merged IP library.
+    """
+    if _library_memo is None:
+        return _load_layered_libraries(sources, streaming, random_access, only)
+    key = (tuple(sources), streaming, random_access, frozenset(only) if only is not None else None)
+    stamp = _sources_stamp(sources)
+    has_remote = any(not os.path.exists(source) for source in sources)
+    with _library_memo_lock:
+        memo = _library_memo.get(key)
+    if memo is not None and memo[0] == stamp and (not has_remote or time.time() - memo[1] < cache_config.ttl):
+        return memo[2]
+    library = _load_layered_libraries(sources, streaming, random_access, only)
+    with _library_memo_lock:
+        _library_memo[key] = (stamp, time.time(), library)
+    return library
+
+
+def _load_layered_libraries(sources: List[str], streaming: bool = False, random_access: bool = False,
+                            only: Optional[Set[str]] = None) -> IPLibrary:
+    """Loads several IP libraries and layers them, later sources taking precedence.
+
+    The merged library is snapshotted under a hash of all sources and their
+    contents, so an unchanged combination is loaded from a single snapshot
+    without loading and merging the individual libraries.
+
+    Args:
+        sources (List[str]): File paths or URLs, lowest precedence first.
+        streaming (bool): Passed on to load_ip_library.
+        random_access (bool): Passed on to load_ip_library. The merged snapshot
+            is not used, since computing its key reads every library in full.
+        only (Optional[Set[str]]): With random access, passed on to load_ip_library.
+
+    Returns:
+        IPLibrary: The merged IP library.
+    """
+    if random_access:
+        libraries = [load_ip_library(source, streaming=streaming, random_access=True, only=only)
+                     for source in sources]
+        return libraries[0] if len(libraries) == 1 else MergedIPLibrary(libraries)
+    if len(sources) == 1:
+        return load_ip_library(sources[0], streaming=streaming)
+    combined_hash: Optional[str] = None
+    if cache_config.enabled and _cache_is_writable():
+        try:
+            combined = hashlib.sha256()
+            for source in sources:
+                combined.update(f"{source}\0{_source_content_hash(source)}\0".encode())
+            combined_hash = combined.hexdigest()
+        except Exception as e:
+            logging.error(f"Error fetching JSON file: {e}")
+            sys.exit(1)
+        suffix = "-merged-stream" if streaming else "-merged"
+        library = _load_snapshot(combined_hash + suffix)
+        if library is not None:
+            library.content_hash = combined_hash
+            return library
+    library = MergedIPLibrary([load_ip_library(source, streaming=streaming) for source in sources])
+    if combined_hash is not None:
+        _store_snapshot(combined_hash + suffix, library)
+    library.content_hash = combined_hash
+    return library
+
+
+def parse_bus_slaves(data: Dict[str, Any]) -> BusSlaves:
+    """Parses raw YAML data into BusSlaves.
+
+    Args:
+        data (Dict[str, Any]): Raw YAML data.
+
+    Returns:
+        BusSlaves: Parsed bus slave configuration.
+    """
+    try:
+        slaves = [BusSlave(**slave) for slave in data.get("slaves", [])]
+        return BusSlaves(slaves=slaves)
+    except Exception as e:
+        logging.error(f"Error parsing bus YAML: {e}")
+        sys.exit(1)
+
+
+def parse_bus_options(data: Dict[str, Any]) -> BusOptions:
+    """Reads the interconnect options from raw YAML data.
+
+    Args:
+        data (Dict[str, Any]): Raw YAML data.
+
+    Returns:
+        BusOptions: The options, with defaults for the keys that are absent.
+    """
+    backend = data.get("backend", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        logging.error(f"Invalid backend '{backend}' in bus YAML; expected one of: {', '.join(BACKENDS)}.")
+        sys.exit(1)
+    mux = data.get("mux", "onehot" if backend == "pipelined" else "priority")
+    if mux not in MUX_STYLES:
+        logging.error(f"Invalid mux '{mux}' in bus YAML; expected one of: {', '.join(MUX_STYLES)}.")
+        sys.exit(1)
+    decoder = data.get("decoder", "range")
+    if decoder not in DECODER_STYLES:
+        logging.error(f"Invalid decoder '{decoder}' in bus YAML; expected one of: {', '.join(DECODER_STYLES)}.")
+        sys.exit(1)
+    pipeline = data.get("pipeline") or {}
+    if not isinstance(pipeline, dict) or set(pipeline) - {"decode", "response"}:
+        logging.error("Invalid pipeline in bus YAML; expected a mapping with 'decode' and/or 'response' stages.")
+        sys.exit(1)
+    stages: Dict[str, int] = {}
+    for stage, limit in (("decode", MAX_DECODE_STAGES), ("response", MAX_RESPONSE_STAGES)):
+        value = pipeline.get(stage, 0)
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= limit:
+            logging.error(f"Invalid pipeline {stage} stages '{value}' in bus YAML; expected 0 to {limit}.")
+            sys.exit(1)
+        stages[stage] = value
+    if backend == "pipelined":
+        # Responses come back through per-slave bridges, in request order.
+        if mux != "onehot":
+            logging.error(f"backend: pipelined returns responses through a one-hot mux; mux: {mux} is not supported.")
+            sys.exit(1)
+        if stages["decode"] or stages["response"]:
+            logging.error("backend: pipelined already registers every request and response in its slave bridges; "
+                          "remove the pipeline option.")
+            sys.exit(1)
+    clusters = data.get("clusters") or []
+    if not isinstance(clusters, list) or not all(
+            isinstance(cluster, list) and cluster and all(isinstance(name, str) for name in cluster)
+            for cluster in clusters):
+        logging.error("Invalid clusters in bus YAML; expected a list of lists of slave names.")
+        sys.exit(1)
+    cluster_size = data.get("cluster_size", 0)
+    if not isinstance(cluster_size, int) or isinstance(cluster_size, bool) or cluster_size == 1 or cluster_size < 0:
+        logging.error(f"Invalid cluster_size '{cluster_size}' in bus YAML; expected an integer of at least 2.")
+        sys.exit(1)
+    if clusters or cluster_size:
+        if clusters and cluster_size:
+            logging.error("clusters and cluster_size cannot both be given in bus YAML.")
+            sys.exit(1)
+        if backend != DEFAULT_BACKEND:
+            logging.error(f"Clusters are not supported with backend: {backend}.")
+            sys.exit(1)
+        if stages["decode"] or stages["response"]:
+            logging.error("Clusters already register the request in their bridges; they cannot be combined with "
+                          "the pipeline option.")
+            sys.exit(1)
+    return BusOptions(backend=backend, mux=mux, decoder=decoder, decode_stages=stages["decode"],
+                      response_stages=stages["response"], clusters=clusters, cluster_size=cluster_size)
+
+
+def address_value(address: str) -> Optional[int]:
+    """Returns the numeric value of a base address.
+
+    Args:
+        address (str): A Verilog literal (e.g. 32'h3000_0000), C hex or decimal number.
+
+    Returns:
+        Optional[int]: The value, or None if the address is not a plain number.
+    """
+    text = address.strip().replace("_", "")
+    match = re.fullmatch(r"(?:\d+)?'([hHdDbBoO])([0-9a-fA-F]+)", text)
+    try:
+        if match:
+            return int(match.group(2), {"h": 16, "d": 10, "b": 2, "o": 8}[match.group(1).lower()])
+        return int(text, 0)
+    except ValueError:
+        return None
+
+
+def mask_match(address: str, signal: str = "wb_adr", size: int = SLAVE_ADDR_SIZE) -> Optional[str]:
+    """Builds the mask decoder comparison of an address region.
+
+    Args:
+        address (str): The base address of the region.
+        signal (str): The address signal that is decoded.
+        size (int): Size of the region.
+
+    Returns:
+        Optional[str]: A comparison of the upper address bits, e.g. "wb_adr[31:16] == 16'h3000",
+        or None if the size is not a power of two, the region is not aligned to its size or the
+        address is not a plain number.
+    """
+    value = address_value(address)
+    if value is None or size & (size - 1) or value % size or not 0 <= value < 1 << 32:
+        return None
+    low = size.bit_length() - 1
+    bits = 32 - low
+    return f"{signal}[31:{low}] == {bits}'h{value >> low:0{(bits + 3) // 4}X}"
+
+
+def decoder_cells(address_match: str) -> int:
+    """Estimates the cells of one chip select.
+
+    Args:
+        address_match (str): The mask comparison of the region, or "" for a range decoder.
+
+    Returns:
+        int: The estimated number of cells.
+    """
+    if not address_match:
+        return RANGE_DECODER_CELLS
+    low = int(re.search(r"\[31:(\d+)\]", address_match).group(1))
+    return 32 - low
+
+
+def mux_logic_depth(style: str, inputs: int) -> int:
+    """Estimates the logic depth of the read-data multiplexer.
+
+    The depth is counted in 2-input gate or 2:1 multiplexer levels from the chip selects to
+    wb_dat_o/wb_ack.
+
+    Args:
+        style (str): The mux style.
+        inputs (int): Number of slaves.
+
+    Returns:
+        int: The number of levels.
+    """
+    if inputs <= 1:
+        return 1
+    if style == "priority":
+        return inputs
+    # One AND (onehot) or final gating (tree) level plus a balanced OR/multiplexer tree.
+    return 1 + (inputs - 1).bit_length()
+
+
+TEMPLATE_FLUSH_PIECES: int = 512
+
+
+class TemplateError(Exception):
+    """Raised when a template cannot be compiled or rendered."""
+
+
+_TEMPLATE_TAG_RE = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}|\{#.*?#\}", re.DOTALL)
+_TEMPLATE_TRAILING_SPACE_RE = re.compile(r"[ \t]*\n")
+
+
+def compile_template(source: str, name: str) -> Any:
+    """Compiles a template into a Python generator function.
+
+    The syntax is a small subset of Jinja: `{{ expr }}` inserts the value of a Python
+    expression, `{% for x in expr %}...{% endfor %}`, `{% if expr %}...{% elif expr %}...
+    {% else %}...{% endif %}` and `{% set name = expr %}` control the output, and `{# ... #}`
+    is a comment. The rendered design is available as `design`. A statement tag on a line
+    of its own does not emit that line.
+
+    Args:
+        source (str): The template text.
+        name (str): The template name, used in error messages.
+
+    Returns:
+        Any: A function that takes the design and yields chunks of output text.
+
+    Raises:
+        TemplateError: If the template is malformed.
+    """
+    code: List[str] = ["def _render(design):", " _buf = []", " _emit = _buf.append"]
+    code_lines: List[int] = [1, 1, 1]
+    blocks: List[str] = []
+    pos = 0
+    # Adjacent text and expressions are merged into a single %-format per output run.
+    run_format: List[str] = []
+    run_args: List[str] = []
+    run_line = 1
+
+    def emit(statement: str, line: int) -> None:
+        code.append(" " * (len(blocks) + 1) + statement)
+        code_lines.append(line)
+
+    def add_to_run(text: Optional[str], expression: Optional[str], line: int) -> None:
+        nonlocal run_line
+        if not run_format:
+            run_line = line
+        if text is not None:
+            run_format.append(text.replace("%", "%%"))
+        else:
+            run_format.append("%s")
+            run_args.append(f"({expression}),")
+
+    def flush_run() -> None:
+        if run_format:
+            text = "".join(run_format)
+            emit(f"_emit({text!r} % ({''.join(run_args)}))" if run_args else f"_emit({text!r})", run_line)
+            run_format.clear()
+            run_args.clear()
+
+    def line_of(offset: int) -> int:
+        return source.count("\n", 0, offset) + 1
+
+    for match in _TEMPLATE_TAG_RE.finditer(source):
+        line = line_of(match.start())
+        text_end, next_pos = match.start(), match.end()
+        if match.group(1) is None:
+            # A statement or comment tag alone on its line produces no output, not even the line break.
+            line_start = source.rfind("\n", 0, match.start()) + 1
+            trailing = _TEMPLATE_TRAILING_SPACE_RE.match(source, match.end())
+            if pos <= line_start and not source[line_start:match.start()].strip(" \t") and trailing:
+                text_end, next_pos = line_start, trailing.end()
+        if text_end > pos:
+            add_to_run(source[pos:text_end], None, line)
+        pos = next_pos
+        expression, statement = match.group(1), match.group(2)
+        if expression is not None:
+            add_to_run(None, expression.strip(), line)
+            continue
+        if statement is None:
+            continue
+        flush_run()
+        keyword, _, rest = statement.strip().partition(" ")
+        rest = rest.strip()
+        if keyword in ("for", "if"):
+            emit(f"{keyword} {rest}:", line)
+            blocks.append(keyword)
+            emit("pass", line)
+        elif keyword in ("elif", "else"):
+            if not blocks or blocks[-1] != "if":
+                raise TemplateError(f"{name}:{line}: '{keyword}' outside of an if block")
+            blocks.pop()
+            emit(f"elif {rest}:" if keyword == "elif" else "else:", line)
+            blocks.append("if")
+            emit("pass", line)
+        elif keyword in ("endfor", "endif"):
+            if not blocks or blocks[-1] != keyword[3:]:
+                raise TemplateError(f"{name}:{line}: unexpected '{keyword}'")
+            if keyword == "endfor":
+                # Hand the output over in bounded chunks so that large designs are streamed.
+                emit(f"if len(_buf) > {TEMPLATE_FLUSH_PIECES}:", line)
+                emit(" yield ''.join(_buf)", line)
+                emit(" _buf.clear()", line)
+            blocks.pop()
+        elif keyword == "set":
+            emit(rest, line)
+        else:
+            raise TemplateError(f"{name}:{line}: unknown statement '{keyword}'")
+    if pos < len(source):
+        add_to_run(source[pos:], None, line_of(pos))
+    flush_run()
+    if blocks:
+        raise TemplateError(f"{name}: unclosed '{blocks[-1]}' block")
+    emit("yield ''.join(_buf)", line_of(len(source)))
+    try:
+        namespace: Dict[str, Any] = {}
+        exec(compile("\n".join(code), f"<template {name}>", "exec"), namespace)
+    except SyntaxError as e:
+        line = code_lines[e.lineno - 1] if e.lineno and e.lineno <= len(code_lines) else "?"
+        raise TemplateError(f"{name}:{line}: invalid expression: {e.msg}") from None
+    return namespace["_render"]
+
+
+_compiled_templates: Dict[Tuple[str, str, str], "Template"] = {}
+
+
+def template_source(backend: str, name: str, directory: Optional[str] = None) -> Tuple[str, str]:
+    """Finds the source of a template.
+
+    A user template directory is searched for `<backend>/<name>.tmpl`, then (for the default
+    backend only) `<name>.tmpl`, before falling back to the built-in template of the backend.
+
+    Args:
+        backend (str): The bus backend.
+        name (str): The template name, e.g. "wb_bus.v".
+        directory (Optional[str]): Directory of user templates; only the built-in templates
+            are used if None.
+
+    Returns:
+        Tuple[str, str]: The template text and a description of where it came from.
+
+    Raises:
+        TemplateError: If the backend has no such template.
+    """
+    if directory:
+        paths = [os.path.join(directory, backend, name + ".tmpl")]
+        if backend == DEFAULT_BACKEND:
+            paths.append(os.path.join(directory, name + ".tmpl"))
+        for path in paths:
+            if os.path.isfile(path):
+                with open(path, "r", newline="") as f:
+                    return f.read(), path
+    try:
+        return BUILTIN_TEMPLATES[backend][name], f"{backend}/{name}"
+    except KeyError:
+        raise TemplateError(f"No template '{name}' for backend '{backend}'") from None
+
+
+class Template:
+    """A compiled template.
+
+    Attributes:
+        source (str): The template text.
+        origin (str): Where the template came from, used in error messages.
+    """
+
+    def __init__(self, source: str, origin: str) -> None:
+        self.source = source
+        self.origin = origin
+        self._render = compile_template(source, origin)
+
+    def render(self, design: Any) -> Iterator[str]:
+        """Renders the template.
+
+        Args:
+            design (Any): The context object, available to the template as `design`.
+
+        Returns:
+            Iterator[str]: Chunks of output text.
+
+        Raises:
+            TemplateError: If rendering fails.
+        """
+        try:
+            yield from self._render(design)
+        except Exception as e:
+            raise TemplateError(f"{self.origin}: {type(e).__name__}: {e}") from e
+
+
+def load_template(backend: str, name: str, directory: Optional[str] = None) -> Template:
+    """Returns a template, compiling it on first use.
+
+    Compiled templates are cached per backend, name and source text.
+
+    Args:
+        backend (str): The bus backend.
+        name (str): The template name.
+        directory (Optional[str]): Directory of user templates.
+
+    Returns:
+        Template: The compiled template.
+
+    Raises:
+        TemplateError: If the template cannot be found or compiled.
+    """
+    source, origin = template_source(backend, name, directory)
+    key = (backend, name, source)
+    template = _compiled_templates.get(key)
+    if template is None:
+        template = Template(source, origin)
+        _compiled_templates[key] = template
+    return template
+
+
+def render_template(backend: str, name: str, design: Any, directory: Optional[str] = None) -> Iterator[str]:
+    """Renders a template, compiling it on first use.
+
+    Args:
+        backend (str): The bus backend.
+        name (str): The template name.
+        design (Any): The context object, available to the template as `design`.
+        directory (Optional[str]): Directory of user templates.
+
+    Returns:
+        Iterator[str]: Chunks of output text.
+
+    Raises:
+        TemplateError: If the template cannot be compiled or fails while rendering.
+    """
+    return load_template(backend, name, directory).render(design)
+
+
+def templates_fingerprint(directory: Optional[str]) -> str:
+    """Returns a hash of the user templates in a directory, or an empty string if there are none."""
+    if not directory or not os.path.isdir(directory):
+        return ""
+    digest = hashlib.sha256()
+    for root, _, names in sorted(os.walk(directory)):
+        for template_name in sorted(names):
+            if template_name.endswith(".tmpl"):
+                path = os.path.join(root, template_name)
+                digest.update(os.path.relpath(path, directory).encode() + b"\0")
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+@dataclass
+class SlaveInstance:
+    """A bus slave as seen by the templates.
+
+    Attributes:
+        index (int): Position of the slave on the bus.
+        name (str): Slave name.
+        type (str): IP type.
+        base_address (str): Base address as a Verilog literal.
+        connections (List[str]): Port connections of the instance, e.g. ".clk_i(wb_clk)".
+        is_pic (bool): Whether this is the built-in PIC.
+        block (str): The rendered instantiation block (empty for the PIC).
+        address_match (str): Comparison of the upper address bits that selects the slave, or ""
+            when it is selected by range comparators.
+        cluster (Optional[int]): The cluster the slave belongs to, if any.
+        local_index (int): Position of the slave in its cluster.
+    """
+    index: int
+    name: str
+    type: str
+    base_address: str
+    connections: List[str]
+    is_pic: bool = False
+    block: str = ""
+    address_match: str = ""
+    cluster: Optional[int] = None
+    local_index: int = 0
+
+
+@dataclass
+class PinAssignment:
+    """Default drive of one user I/O pad.
+
+    Attributes:
+        pin (int): Pad number.
+        oen (Optional[str]): Value assigned to io_oen, or None if an instance drives it.
+        out (Optional[str]): Value assigned to io_out, or None if an instance drives it.
+    """
+    pin: int
+    oen: Optional[str]
+    out: Optional[str]
+
+
+@dataclass
+class MuxSignals:
+    """Names of the select, data and ack signals of one multiplexer input or output."""
+    sel: str
+    dat: str
+    ack: str
+
+
+@dataclass
+class MuxNode:
+    """A 2:1 multiplexer of the read-data tree; the first input wins when both are selected."""
+    out: MuxSignals
+    first: MuxSignals
+    second: MuxSignals
+
+
+def build_mux_tree(inputs: List[MuxSignals]) -> Tuple[List[MuxNode], Optional[MuxSignals]]:
+    """Pairs the multiplexer inputs into a balanced tree of 2:1 multiplexers.
+
+    Inputs are paired in order and the first of each pair wins, so the tree keeps the
+    priority of the if/else chain with a logarithmic depth.
+
+    Args:
+        inputs (List[MuxSignals]): The inputs, highest priority first.
+
+    Returns:
+        Tuple[List[MuxNode], Optional[MuxSignals]]: The nodes, leaves first, and the root
+        (None without inputs).
+    """
+    level = list(inputs)
+    nodes: List[MuxNode] = []
+    depth = 0
+    while len(level) > 1:
+        depth += 1
+        next_level: List[MuxSignals] = []
+        for pos in range(0, len(level) - 1, 2):
+            prefix = f"mux_l{depth}_{pos // 2}"
+            out = MuxSignals(f"{prefix}_sel", f"{prefix}_dat", f"{prefix}_ack")
+            nodes.append(MuxNode(out, level[pos], level[pos + 1]))
+            next_level.append(out)
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return nodes, level[0] if level else None
+
+
+@dataclass
+class MuxDesign:
+    """Everything the read-data multiplexer template renders.
+
+    Attributes:
+        style (str): Structure of the multiplexer.
+        depth (int): Estimated logic depth.
+        ports (List[MuxSignals]): The inputs, highest priority first; the output is
+            selected_dat/selected_ack.
+        tree (List[MuxNode]): The 2:1 multiplexers of a "tree" mux, leaves first.
+        root (Optional[MuxSignals]): The output of a "tree" mux.
+    """
+    style: str
+    depth: int
+    ports: List[MuxSignals]
+    tree: List[MuxNode] = field(default_factory=list)
+    root: Optional[MuxSignals] = None
+
+    @classmethod
+    def build(cls, style: str, ports: List[MuxSignals]) -> "MuxDesign":
+        """Lays out a multiplexer of the given style over the ports."""
+        tree, root = build_mux_tree(ports) if style == "tree" else ([], None)
+        return cls(style=style, depth=mux_logic_depth(style, len(ports)), ports=ports, tree=tree, root=root)
+
+
+@dataclass
+class ClusterDesign:
+    """A cluster of slaves behind its own bridge, decoder and multiplexer.
+
+    Attributes:
+        index (int): Position of the cluster.
+        members (List[SlaveInstance]): The slaves of the cluster, in local order.
+        base (str): First address of the cluster, as a Verilog literal.
+        last (str): Last address of the cluster, as a Verilog literal.
+        address_match (str): Mask comparison that selects the cluster on the top-level bus, or ""
+            when it is selected by range comparators.
+        mux (MuxDesign): The local multiplexer.
+        mux_block (str): The rendered local multiplexer.
+        module (str): The rendered cluster module.
+    """
+    index: int
+    members: List[SlaveInstance]
+    base: str
+    last: str
+    address_match: str
+    mux: MuxDesign
+    mux_block: str = ""
+    module: str = ""
+
+    @property
+    def width(self) -> int:
+        """Number of slaves in the cluster."""
+        return len(self.members)
+
+    @property
+    def slave_dat(self) -> str:
+        """Concatenation of the read data of the members, last member first."""
+        return "{" + ", ".join(f"slave{member.index}_dat" for member in reversed(self.members)) + "}"
+
+    @property
+    def slave_ack(self) -> str:
+        """Concatenation of the acks of the members, last member first."""
+        return "{" + ", ".join(f"slave{member.index}_ack" for member in reversed(self.members)) + "}"
+
+
+@dataclass
+class BusDesign:
+    """Everything the wb_bus and wrapper templates render.
+
+    Attributes:
+        backend (str): The bus backend.
+        has_pic (bool): Whether the bus includes the PIC.
+        total_wb_cell_count (int): Sum of the WB cell counts of the slaves.
+        slaves (List[SlaveInstance]): All slaves, in bus order.
+        instances (List[SlaveInstance]): The slaves instantiated from the IP library (all but the PIC).
+        pins (List[PinAssignment]): Default assignments of the 38 user I/O pads.
+        mux (str): Structure of the read-data multiplexer.
+        mux_depth (int): Estimated logic depth of the multiplexer.
+        ports (List[MuxSignals]): The inputs of the multiplexer: the slaves outside clusters and
+            the clusters.
+        mux_block (str): The rendered multiplexer.
+        clusters (List[ClusterDesign]): The clusters.
+        decoder (str): Chip select decoding.
+        decode_stages (int): Register stages between the master and the slaves.
+        response_stages (int): Register stages between the read-data mux and the master.
+        request (RequestSignals): The request signals that drive the slaves.
+        outstanding (int): Depth of the queue of outstanding requests (pipelined backend).
+        index_bits (int): Width of a slave index (pipelined backend).
+        template_dir (Optional[str]): Directory of user templates the design is rendered with.
+    """
+    backend: str
+    has_pic: bool
+    total_wb_cell_count: int
+    slaves: List[SlaveInstance]
+    instances: List[SlaveInstance]
+    pins: List[PinAssignment]
+    mux: str = "priority"
+    mux_depth: int = 0
+    ports: List[MuxSignals] = field(default_factory=list)
+    mux_block: str = ""
+    clusters: List[ClusterDesign] = field(default_factory=list)
+    decoder: str = "range"
+    decode_stages: int = 0
+    response_stages: int = 0
+    request: RequestSignals = WB_REQUEST
+    outstanding: int = 0
+    index_bits: int = 1
+    template_dir: Optional[str] = None
+
+    @property
+    def pipelined(self) -> bool:
+        """Whether the interconnect has register stages."""
+        return bool(self.decode_stages or self.response_stages)
+
+
+def interconnect_report(design: BusDesign) -> List[str]:
+    """Describes the fan-out, multiplexer width and depth of each level and the address decoder.
+
+    Args:
+        design (BusDesign): The generated design.
+
+    Returns:
+        List[str]: Report lines.
+    """
+    count = len(design.slaves)
+    lines: List[str] = []
+    if design.clusters:
+        direct = len(design.ports) - len(design.clusters)
+        lines.append(f"Top level: {len(design.clusters)} cluster(s) and {direct} direct slave(s); "
+                     f"mux: {design.mux}, {len(design.ports)} input(s), logic depth {design.mux_depth} level(s); "
+                     f"wb_adr fan-out: {len(design.ports)} decoder(s), {len(design.ports)} cluster/slave port(s)")
+        for cluster in design.clusters:
+            lines.append(f"Cluster {cluster.index} ({cluster.members[0].name}..{cluster.members[-1].name}): "
+                         f"mux: {cluster.mux.style}, {cluster.width} input(s), logic depth {cluster.mux.depth} "
+                         f"level(s); req_adr fan-out: {cluster.width} decoder(s), {cluster.width} slave port(s)")
+        lines.append("Cluster bridges register the request: +1 cycle per transfer to a clustered slave")
+    else:
+        line = f"Read-data mux: {design.mux}, {count} slave(s), logic depth {design.mux_depth} level(s)"
+        if design.mux == "priority" and design.mux_depth > mux_logic_depth("onehot", count) + 2:
+            line += f" (mux: onehot or tree would need {mux_logic_depth('onehot', count)})"
+        lines.append(line)
+    masked = sum(1 for slave in design.slaves if slave.address_match)
+    selects = [slave.address_match for slave in design.slaves]
+    selects += [cluster.address_match for cluster in design.clusters]
+    cells = sum(decoder_cells(address_match) for address_match in selects)
+    saved = len(selects) * RANGE_DECODER_CELLS - cells
+    line = f"Address decoder: {design.decoder}, {masked} of {count} slave(s) mask-decoded, ~{cells} cells"
+    if saved:
+        share = f", {100 * saved / design.total_wb_cell_count:.1f}%" if design.total_wb_cell_count else ""
+        line += f" (saves ~{saved} cells{share} of TOTAL_WB_CELL_COUNT {design.total_wb_cell_count})"
+    lines.append(line)
+    if design.decoder == "auto" and masked < count:
+        unaligned = ", ".join(slave.name for slave in design.slaves if not slave.address_match)
+        lines.append(f"Range-decoded slave(s), not aligned to {SLAVE_ADDR_SIZE:#x}: {unaligned}")
+    if design.backend == "pipelined":
+        lines.append(f"Backend: pipelined, up to {design.outstanding} outstanding request(s), 2 cycles from request "
+                     f"to ack for a single-cycle slave, one transfer per cycle to a streaming slave")
+    if design.pipelined:
+        latency = design.decode_stages + design.response_stages
+        lines.append(f"Pipeline: {design.decode_stages} decode and {design.response_stages} response stage(s), "
+                     f"+{latency} cycle(s) per transfer")
+    return lines
+
+
+WB_BUS_TEMPLATE: str = r"""// Generated Wishbone Bus Verilog Code with Bus Splitter, External Interface Mapping, IRQ Checkers, and Total WB Cell Count
+
+module wb_bus(
+    input         wb_clk,
+    input         wb_rst,
+    input  [31:0] wb_adr,
+    inout  [31:0] wb_dat_i,
+    input         wb_we,
+    input         wb_stb,
+    input         wb_cyc,
+    input  [31:0] wb_dat_o,
+    output        wb_ack,
+    input  [37:0] io_in,
+    output [37:0] io_out,
+    output [37:0] io_oen,
+    output [2:0]  user_irq
+);
+
+    localparam SLAVE_ADDR_SIZE = 32'h0001_0000;
+    localparam TOTAL_WB_CELL_COUNT = {{ design.total_wb_cell_count }};
+
+{% for slave in design.slaves %}
+    // Wires for slave {{ slave.index }}: {{ slave.name }}
+    wire [31:0] slave{{ slave.index }}_dat;
+    wire        slave{{ slave.index }}_ack;
+{% if slave.cluster is not None %}
+{% elif design.decode_stages == 2 %}
+    wire        dec{{ slave.index }};
+    reg         cs{{ slave.index }};
+{% else %}
+    wire        cs{{ slave.index }};
+{% endif %}
+
+{% endfor %}
+{% if design.pipelined %}
+    // Request as seen by the slaves ({{ design.decode_stages }} register stage(s)); one transfer is in flight at a time
+    reg         busy;
+{% if design.decode_stages == 0 %}
+    wire [31:0] req_adr = wb_adr;
+    wire [31:0] req_dat = wb_dat_i;
+    wire        req_we = wb_we;
+    wire        req_stb = wb_cyc & wb_stb & ~busy;
+{% else %}
+    reg  [31:0] req_adr;
+    reg  [31:0] req_dat;
+    reg         req_we;
+    reg         req_stb;
+{% endif %}
+{% if design.decode_stages == 2 %}
+    reg         dec_valid;
+{% endif %}
+
+{% endif %}
+{% for slave in design.slaves %}
+{% set cs = ("dec" if design.decode_stages == 2 else "cs") + str(slave.index) %}
+{% if slave.cluster is not None %}
+{% elif slave.address_match %}
+    assign {{ cs }} = ({{ slave.address_match }}) ? 1'b1 : 1'b0;
+{% else %}
+    assign {{ cs }} = (({{ design.request.adr }} >= {{ slave.base_address }}) && ({{ design.request.adr }} < ({{ slave.base_address }} + SLAVE_ADDR_SIZE))) ? 1'b1 : 1'b0;
+{% endif %}
+{% endfor %}
+{% for cluster in design.clusters %}
+{% if cluster.index or len(design.ports) > len(design.clusters) %}
+
+{% endif %}
+    // Cluster {{ cluster.index }}: {{ ", ".join(member.name for member in cluster.members) }}
+    wire        cluster{{ cluster.index }}_sel;
+    wire [31:0] cluster{{ cluster.index }}_rdat;
+    wire        cluster{{ cluster.index }}_ack;
+    wire [31:0] cluster{{ cluster.index }}_adr;
+    wire [31:0] cluster{{ cluster.index }}_dat;
+    wire        cluster{{ cluster.index }}_we;
+    wire [{{ cluster.width - 1 }}:0] cluster{{ cluster.index }}_stb;
+    wire [{{ cluster.width - 1 }}:0] cluster{{ cluster.index }}_cyc;
+{% if cluster.address_match %}
+    assign cluster{{ cluster.index }}_sel = ({{ cluster.address_match }}) ? 1'b1 : 1'b0;
+{% else %}
+    assign cluster{{ cluster.index }}_sel = ((wb_adr >= {{ cluster.base }}) && (wb_adr <= {{ cluster.last }})) ? 1'b1 : 1'b0;
+{% endif %}
+    wb_cluster{{ cluster.index }} u_cluster{{ cluster.index }} (
+        .wb_clk(wb_clk),
+        .wb_rst(wb_rst),
+        .wb_adr(wb_adr),
+        .wb_dat_i(wb_dat_i),
+        .wb_we(wb_we),
+        .wb_stb(wb_stb & cluster{{ cluster.index }}_sel),
+        .wb_cyc(wb_cyc & cluster{{ cluster.index }}_sel),
+        .wb_dat_o(cluster{{ cluster.index }}_rdat),
+        .wb_ack(cluster{{ cluster.index }}_ack),
+        .req_adr(cluster{{ cluster.index }}_adr),
+        .req_dat(cluster{{ cluster.index }}_dat),
+        .req_we(cluster{{ cluster.index }}_we),
+        .slave_stb(cluster{{ cluster.index }}_stb),
+        .slave_cyc(cluster{{ cluster.index }}_cyc),
+        .slave_dat({{ cluster.slave_dat }}),
+        .slave_ack({{ cluster.slave_ack }})
+    );
+{% endfor %}
+
+{% if design.has_pic %}
+    wire [9:0] pic_irq;
+    assign pic_irq[1:0] = user_irq[1:0];
+
+    // Instantiate the PIC
+    wb_pic_8 PIC (
+          .clk(wb_clk),
+          .rst(wb_rst),
+          .wb_addr({{ design.request.adr }}),
+          .wb_wdata({{ design.request.dat }}),
+          .wb_we({{ design.request.we }}),
+          .wb_stb({{ "req_stb" if design.pipelined else "wb_stb" }}),
+          .wb_rdata(slave0_dat),
+          .wb_ack(slave0_ack),
+          .int_in(pic_irq[9:2]),
+          .irq(user_irq[2])
+    );
+{% endif %}
+{% for slave in design.instances %}
+{{ slave.block }}
+{% endfor %}
+{{ design.mux_block }}
+{% if design.pipelined %}
+    // Pipeline control: accept a request when idle and block the next one until the master has seen the ack
+    wire        slave_ack = selected_ack & req_stb;
+{% if design.decode_stages %}
+    wire        accept = wb_cyc & wb_stb & ~busy;
+{% endif %}
+    always @(posedge wb_clk) begin
+        if (wb_rst || !wb_cyc) begin
+            busy <= 1'b0;
+{% if design.decode_stages %}
+            req_stb <= 1'b0;
+{% endif %}
+{% if design.decode_stages == 2 %}
+            dec_valid <= 1'b0;
+{% endif %}
+        end else begin
+{% if design.decode_stages == 0 %}
+            if (wb_ack)
+                busy <= 1'b0;
+            else if (slave_ack)
+                busy <= 1'b1;
+{% else %}
+            if (accept) begin
+                busy <= 1'b1;
+                req_adr <= wb_adr;
+                req_dat <= wb_dat_i;
+                req_we <= wb_we;
+                {{ "req_stb" if design.decode_stages == 1 else "dec_valid" }} <= 1'b1;
+            end else if (wb_ack) begin
+                busy <= 1'b0;
+            end
+{% if design.decode_stages == 2 %}
+            if (dec_valid) begin
+                dec_valid <= 1'b0;
+                req_stb <= 1'b1;
+{% for slave in design.slaves %}
+                cs{{ slave.index }} <= dec{{ slave.index }};
+{% endfor %}
+            end
+{% endif %}
+            if (slave_ack)
+                req_stb <= 1'b0;
+{% endif %}
+        end
+    end
+
+{% if design.response_stages %}
+    // Response pipeline: {{ design.response_stages }} register stage(s) between the mux and the master
+{% for stage in range(design.response_stages) %}
+    reg  [31:0] resp_dat{{ stage }};
+    reg         resp_ack{{ stage }};
+{% endfor %}
+    always @(posedge wb_clk) begin
+        if (wb_rst || !wb_cyc) begin
+{% for stage in range(design.response_stages) %}
+            resp_ack{{ stage }} <= 1'b0;
+{% endfor %}
+        end else begin
+            resp_ack0 <= slave_ack;
+{% for stage in range(1, design.response_stages) %}
+            resp_ack{{ stage }} <= resp_ack{{ stage - 1 }};
+{% endfor %}
+        end
+        resp_dat0 <= selected_dat;
+{% for stage in range(1, design.response_stages) %}
+        resp_dat{{ stage }} <= resp_dat{{ stage - 1 }};
+{% endfor %}
+    end
+
+    assign wb_dat_o = resp_dat{{ design.response_stages - 1 }};
+    assign wb_ack = resp_ack{{ design.response_stages - 1 }} & wb_stb;
+{% else %}
+    assign wb_dat_o = selected_dat;
+    assign wb_ack = slave_ack & wb_stb;
+{% endif %}
+{% else %}
+    assign wb_dat_o = selected_dat;
+    assign wb_ack = selected_ack;
+{% endif %}
+
+{% for pin in design.pins %}
+{% if pin.oen is not None %}
+    assign io_oen[{{ pin.pin }}] = {{ pin.oen }};
+{% endif %}
+{% if pin.out is not None %}
+    assign io_out[{{ pin.pin }}] = {{ pin.out }};
+{% endif %}
+{% endfor %}
+
+endmodule{% for cluster in design.clusters %}
+
+{{ cluster.module }}{% endfor %}"""
+
+WB_SLAVE_TEMPLATE: str = r"""    // Instantiate slave {{ design.name }} of type {{ design.type }}_WB
+    {{ design.type }}_WB {{ design.name }} (
+        {{ ",\n        ".join(design.connections) }}
+    );
+"""
+
+WB_MUX_TEMPLATE: str = r"""{% if design.style == "onehot" %}
+    // Bus splitter: one-hot AND-OR multiplexer for slave outputs ({{ design.depth }} logic levels)
+    wire [31:0] selected_dat =
+{% for port in design.ports %}
+{% set mask = "{32{" + port.sel + "}" + "}" %}
+        ({{ mask }} & {{ port.dat }}) |
+{% endfor %}
+        32'h0;
+    wire        selected_ack =
+{% for port in design.ports %}
+        ({{ port.sel }} & {{ port.ack }}) |
+{% endfor %}
+        1'b0;
+{% elif design.style == "tree" %}
+    // Bus splitter: balanced tree of 2:1 multiplexers for slave outputs, lower index first ({{ design.depth }} logic levels)
+{% for node in design.tree %}
+    wire        {{ node.out.sel }} = {{ node.first.sel }} | {{ node.second.sel }};
+    wire [31:0] {{ node.out.dat }} = {{ node.first.sel }} ? {{ node.first.dat }} : {{ node.second.dat }};
+    wire        {{ node.out.ack }} = {{ node.first.sel }} ? {{ node.first.ack }} : {{ node.second.ack }};
+{% endfor %}
+{% if design.root %}
+    wire [31:0] selected_dat = {{ design.root.sel }} ? {{ design.root.dat }} : 32'h0;
+    wire        selected_ack = {{ design.root.sel }} & {{ design.root.ack }};
+{% else %}
+    wire [31:0] selected_dat = 32'h0;
+    wire        selected_ack = 1'b0;
+{% endif %}
+{% else %}
+    // Bus splitter: Multiplexer for slave outputs
+    reg [31:0] selected_dat;
+    reg        selected_ack;
+    always @(*) begin
+{% for position, port in enumerate(design.ports) %}
+        {{ "if" if position == 0 else "else if" }} ({{ port.sel }}) begin
+            selected_dat = {{ port.dat }};
+            selected_ack = {{ port.ack }};
+        end
+{% endfor %}
+        else begin
+            selected_dat = 32'h0;
+            selected_ack = 1'b0;
+        end
+    end
+{% endif %}
+"""
+
+WB_CLUSTER_TEMPLATE: str = r"""// Cluster {{ design.index }}: {{ ", ".join(member.name for member in design.members) }}
+module wb_cluster{{ design.index }} (
+    input         wb_clk,
+    input         wb_rst,
+    input  [31:0] wb_adr,
+    input  [31:0] wb_dat_i,
+    input         wb_we,
+    input         wb_stb,
+    input         wb_cyc,
+    output [31:0] wb_dat_o,
+    output        wb_ack,
+    output reg [31:0] req_adr,
+    output reg [31:0] req_dat,
+    output reg        req_we,
+    output [{{ design.width - 1 }}:0] slave_stb,
+    output [{{ design.width - 1 }}:0] slave_cyc,
+    input  [{{ 32 * design.width - 1 }}:0] slave_dat,
+    input  [{{ design.width - 1 }}:0] slave_ack
+);
+
+    localparam SLAVE_ADDR_SIZE = 32'h0001_0000;
+
+    // Bridge to the top-level bus: the request is registered and one transfer is in flight at a time
+    reg         busy;
+    reg         req_stb;
+
+    // Local decoder
+{% for member in design.members %}
+    wire        cs{{ member.local_index }};
+{% if member.address_match %}
+    assign cs{{ member.local_index }} = ({{ member.address_match }}) ? 1'b1 : 1'b0;
+{% else %}
+    assign cs{{ member.local_index }} = ((req_adr >= {{ member.base_address }}) && (req_adr < ({{ member.base_address }} + SLAVE_ADDR_SIZE))) ? 1'b1 : 1'b0;
+{% endif %}
+    assign slave_stb[{{ member.local_index }}] = req_stb & cs{{ member.local_index }};
+    assign slave_cyc[{{ member.local_index }}] = wb_cyc & cs{{ member.local_index }};
+{% endfor %}
+
+{{ design.mux_block }}
+    wire        slave_done = selected_ack & req_stb;
+    always @(posedge wb_clk) begin
+        if (wb_rst || !wb_cyc) begin
+            busy <= 1'b0;
+            req_stb <= 1'b0;
+        end else begin
+            if (wb_stb & ~busy) begin
+                busy <= 1'b1;
+                req_adr <= wb_adr;
+                req_dat <= wb_dat_i;
+                req_we <= wb_we;
+                req_stb <= 1'b1;
+            end else if (wb_ack) begin
+                busy <= 1'b0;
+            end
+            if (slave_done)
+                req_stb <= 1'b0;
+        end
+    end
+
+    assign wb_dat_o = selected_dat;
+    assign wb_ack = slave_done & wb_stb;
+
+endmodule"""
+
+USER_PROJECT_WRAPPER_TEMPLATE: str = r"""module user_project_wrapper #(
+    parameter BITS = 32
+) (
+`ifdef USE_POWER_PINS
+    inout vdda1,
+    inout vdda2,
+    inout vssa1,
+    inout vssa2,
+    inout vccd1,
+    inout vccd2,
+    inout vssd1,
+    inout vssd2,
+`endif
+    input wb_clk_i,
+    input wb_rst_i,
+    input wbs_stb_i,
+    input wbs_cyc_i,
+    input wbs_we_i,
+    input [3:0] wbs_sel_i,
+    input [31:0] wbs_dat_i,
+    input [31:0] wbs_adr_i,
+    output wbs_ack_o,
+    output [31:0] wbs_dat_o,
+    input  [127:0] la_data_in,
+    output [127:0] la_data_out,
+    input  [127:0] la_oenb,
+    input  [`MPRJ_IO_PADS-1:0] io_in,
+    output [`MPRJ_IO_PADS-1:0] io_out,
+    output [`MPRJ_IO_PADS-1:0] io_oeb,
+    inout [`MPRJ_IO_PADS-10:0] analog_io,
+    input   user_clock2,
+    output [2:0] user_irq
+);
+    wire [31:0] wb_dat_bus;
+{# assign wb_dat_bus = (wbs_we_i) ? wbs_dat_i : 32'bz; #}
+{# assign wbs_dat_o = wb_dat_bus; #}
+    wire [`MPRJ_IO_PADS-1:0] internal_io_oen;
+    wb_bus u_wb_bus (
+        .wb_clk(wb_clk_i),
+        .wb_rst(wb_rst_i),
+        .wb_adr(wbs_adr_i),
+        .wb_dat_o(wbs_dat_o),
+        .wb_dat_i(wbs_dat_i),
+        .wb_we(wbs_we_i),
+        .wb_stb(wbs_stb_i),
+        .wb_cyc(wbs_cyc_i),
+        .wb_ack(wbs_ack_o),
+        .io_in(io_in),
+        .io_out(io_out),
+        .io_oen(internal_io_oen),
+        .user_irq(user_irq)
+    );
+    assign io_oeb = ~internal_io_oen;
+endmodule"""
+
+WB_BUS_PIPELINED_TEMPLATE: str = r"""// Generated Wishbone B4 Pipelined Bus Verilog Code with Per-Slave Classic Bridges, External Interface Mapping, IRQ Checkers, and Total WB Cell Count
+
+module wb_bus(
+    input         wb_clk,
+    input         wb_rst,
+    input  [31:0] wb_adr,
+    input  [31:0] wb_dat_i,
+    input         wb_we,
+    input         wb_stb,
+    input         wb_cyc,
+    output [31:0] wb_dat_o,
+    output        wb_ack,
+    output        wb_stall,
+    input  [37:0] io_in,
+    output [37:0] io_out,
+    output [37:0] io_oen,
+    output [2:0]  user_irq
+);
+
+    localparam SLAVE_ADDR_SIZE = 32'h0001_0000;
+    localparam TOTAL_WB_CELL_COUNT = {{ design.total_wb_cell_count }};
+    localparam OUTSTANDING = {{ design.outstanding }};
+
+{% for slave in design.slaves %}
+    // Wires for slave {{ slave.index }}: {{ slave.name }}
+    wire [31:0] slave{{ slave.index }}_dat;
+    wire        slave{{ slave.index }}_ack;
+    wire        cs{{ slave.index }};
+
+{% endfor %}
+{% for slave in design.slaves %}
+{% if slave.address_match %}
+    assign cs{{ slave.index }} = ({{ slave.address_match }}) ? 1'b1 : 1'b0;
+{% else %}
+    assign cs{{ slave.index }} = ((wb_adr >= {{ slave.base_address }}) && (wb_adr < ({{ slave.base_address }} + SLAVE_ADDR_SIZE))) ? 1'b1 : 1'b0;
+{% endif %}
+{% endfor %}
+
+    // Outstanding requests, oldest first: the index of the slave that answers each one
+{% set ptr_bits = max(1, (design.outstanding - 1).bit_length()) %}
+    reg  [{{ design.index_bits - 1 }}:0] order [0:OUTSTANDING-1];
+    reg  [{{ ptr_bits - 1 }}:0] order_wr;
+    reg  [{{ ptr_bits - 1 }}:0] order_rd;
+    reg  [{{ ptr_bits }}:0] order_count;
+    wire [{{ design.index_bits - 1 }}:0] head = order[order_rd];
+    wire        order_full = (order_count == OUTSTANDING);
+    wire        order_empty = (order_count == 0);
+{% for slave in design.slaves %}
+    wire        head_sel{{ slave.index }} = ~order_empty & (head == {{ design.index_bits }}'d{{ slave.index }});
+{% endfor %}
+    wire        accept;
+
+{% for slave in design.slaves %}
+    // Classic bridge for slave {{ slave.index }}: holds its request until the slave acks, then holds the response until it is returned
+    reg         bridge{{ slave.index }}_pend;
+    reg  [31:0] bridge{{ slave.index }}_adr;
+    reg  [31:0] bridge{{ slave.index }}_dat;
+    reg         bridge{{ slave.index }}_we;
+    reg         bridge{{ slave.index }}_resp_valid;
+    reg  [31:0] bridge{{ slave.index }}_resp_dat;
+    wire        bridge{{ slave.index }}_cyc = bridge{{ slave.index }}_pend;
+    wire        bridge{{ slave.index }}_stb = bridge{{ slave.index }}_pend & (~bridge{{ slave.index }}_resp_valid | head_sel{{ slave.index }});
+    wire        bridge{{ slave.index }}_done = bridge{{ slave.index }}_stb & slave{{ slave.index }}_ack;
+    wire        bridge{{ slave.index }}_free = ~bridge{{ slave.index }}_pend | bridge{{ slave.index }}_done;
+    always @(posedge wb_clk) begin
+        if (wb_rst || !wb_cyc) begin
+            bridge{{ slave.index }}_pend <= 1'b0;
+            bridge{{ slave.index }}_resp_valid <= 1'b0;
+        end else begin
+            if (accept & cs{{ slave.index }}) begin
+                bridge{{ slave.index }}_pend <= 1'b1;
+                bridge{{ slave.index }}_adr <= wb_adr;
+                bridge{{ slave.index }}_dat <= wb_dat_i;
+                bridge{{ slave.index }}_we <= wb_we;
+            end else if (bridge{{ slave.index }}_done) begin
+                bridge{{ slave.index }}_pend <= 1'b0;
+            end
+            if (bridge{{ slave.index }}_done) begin
+                bridge{{ slave.index }}_resp_valid <= 1'b1;
+                bridge{{ slave.index }}_resp_dat <= slave{{ slave.index }}_dat;
+            end else if (head_sel{{ slave.index }}) begin
+                bridge{{ slave.index }}_resp_valid <= 1'b0;
+            end
+        end
+    end
+
+{% endfor %}
+{% if design.has_pic %}
+    wire [9:0] pic_irq;
+    assign pic_irq[1:0] = user_irq[1:0];
+
+    // Instantiate the PIC
+    wb_pic_8 PIC (
+          .clk(wb_clk),
+          .rst(wb_rst),
+          .wb_addr(bridge0_adr),
+          .wb_wdata(bridge0_dat),
+          .wb_we(bridge0_we),
+          .wb_stb(bridge0_stb),
+          .wb_rdata(slave0_dat),
+          .wb_ack(slave0_ack),
+          .int_in(pic_irq[9:2]),
+          .irq(user_irq[2])
+    );
+{% endif %}
+{% for slave in design.instances %}
+{{ slave.block }}
+{% endfor %}
+    // Responses are returned in request order through a one-hot AND-OR multiplexer
+    assign wb_dat_o =
+{% for slave in design.slaves %}
+        ({32{head_sel{{ slave.index }}}} & bridge{{ slave.index }}_resp_dat) |
+{% endfor %}
+        32'h0;
+    assign wb_ack =
+{% for slave in design.slaves %}
+        (head_sel{{ slave.index }} & bridge{{ slave.index }}_resp_valid) |
+{% endfor %}
+        1'b0;
+
+    // Accept a request when the order queue has room and the bridge of the addressed slave is free
+    reg  [{{ design.index_bits - 1 }}:0] target;
+    always @(*) begin
+        target = {{ design.index_bits }}'d0;
+{% for slave in design.slaves %}
+        if (cs{{ slave.index }}) target = {{ design.index_bits }}'d{{ slave.index }};
+{% endfor %}
+    end
+    wire        target_free =
+{% for slave in design.slaves %}
+        (cs{{ slave.index }} & bridge{{ slave.index }}_free) |
+{% endfor %}
+        1'b0;
+    assign wb_stall = order_full | ~target_free;
+    assign accept = wb_cyc & wb_stb & ~wb_stall;
+
+    always @(posedge wb_clk) begin
+        if (wb_rst || !wb_cyc) begin
+            order_wr <= 0;
+            order_rd <= 0;
+            order_count <= 0;
+        end else begin
+            if (accept) begin
+                order[order_wr] <= target;
+                order_wr <= order_wr + 1'b1;
+            end
+            if (wb_ack)
+                order_rd <= order_rd + 1'b1;
+            order_count <= order_count + accept - wb_ack;
+        end
+    end
+
+{% for pin in design.pins %}
+{% if pin.oen is not None %}
+    assign io_oen[{{ pin.pin }}] = {{ pin.oen }};
+{% endif %}
+{% if pin.out is not None %}
+    assign io_out[{{ pin.pin }}] = {{ pin.out }};
+{% endif %}
+{% endfor %}
+
+endmodule"""
+
+USER_PROJECT_WRAPPER_PIPELINED_TEMPLATE: str = r"""module user_project_wrapper #(
+    parameter BITS = 32
+) (
+`ifdef USE_POWER_PINS
+    inout vdda1,
+    inout vdda2,
+    inout vssa1,
+    inout vssa2,
+    inout vccd1,
+    inout vccd2,
+    inout vssd1,
+    inout vssd2,
+`endif
+    input wb_clk_i,
+    input wb_rst_i,
+    input wbs_stb_i,
+    input wbs_cyc_i,
+    input wbs_we_i,
+    input [3:0] wbs_sel_i,
+    input [31:0] wbs_dat_i,
+    input [31:0] wbs_adr_i,
+    output wbs_ack_o,
+    output [31:0] wbs_dat_o,
+    input  [127:0] la_data_in,
+    output [127:0] la_data_out,
+    input  [127:0] la_oenb,
+    input  [`MPRJ_IO_PADS-1:0] io_in,
+    output [`MPRJ_IO_PADS-1:0] io_out,
+    output [`MPRJ_IO_PADS-1:0] io_oeb,
+    inout [`MPRJ_IO_PADS-10:0] analog_io,
+    input   user_clock2,
+    output [2:0] user_irq
+);
+    wire [31:0] wb_dat_bus;
+{# assign wb_dat_bus = (wbs_we_i) ? wbs_dat_i : 32'bz; #}
+{# assign wbs_dat_o = wb_dat_bus; #}
+    wire [`MPRJ_IO_PADS-1:0] internal_io_oen;
+
+    // Classic-to-pipelined shim: the classic master holds its strobe until the ack, so the
+    // request is issued once and the strobe is masked until the ack arrives.
+    wire        wb_stall;
+    reg         issued;
+    wire        bus_stb = wbs_stb_i & ~issued;
+    always @(posedge wb_clk_i) begin
+        if (wb_rst_i || !wbs_cyc_i || wbs_ack_o)
+            issued <= 1'b0;
+        else if (bus_stb & ~wb_stall)
+            issued <= 1'b1;
+    end
+
+    wb_bus u_wb_bus (
+        .wb_clk(wb_clk_i),
+        .wb_rst(wb_rst_i),
+        .wb_adr(wbs_adr_i),
+        .wb_dat_o(wbs_dat_o),
+        .wb_dat_i(wbs_dat_i),
+        .wb_we(wbs_we_i),
+        .wb_stb(bus_stb),
+        .wb_cyc(wbs_cyc_i),
+        .wb_ack(wbs_ack_o),
+        .wb_stall(wb_stall),
+        .io_in(io_in),
+        .io_out(io_out),
+        .io_oen(internal_io_oen),
+        .user_irq(user_irq)
+    );
+    assign io_oeb = ~internal_io_oen;
+endmodule"""
+
+BUILTIN_TEMPLATES: Dict[str, Dict[str, str]] = {
+    DEFAULT_BACKEND: {
+        "wb_bus.v": WB_BUS_TEMPLATE,
+        "wb_slave.v": WB_SLAVE_TEMPLATE,
+        "wb_mux.v": WB_MUX_TEMPLATE,
+        "wb_cluster.v": WB_CLUSTER_TEMPLATE,
+        "user_project_wrapper.v": USER_PROJECT_WRAPPER_TEMPLATE,
+    },
+    "pipelined": {
+        "wb_bus.v": WB_BUS_PIPELINED_TEMPLATE,
+        "wb_slave.v": WB_SLAVE_TEMPLATE,
+        "user_project_wrapper.v": USER_PROJECT_WRAPPER_PIPELINED_TEMPLATE,
+    },
+}
+
+
+class BusGenerator:
+    """Generates Verilog code for the Wishbone bus module."""
+
+    def __init__(self, bus_slaves: BusSlaves, ip_library: IPLibrary, has_pic:bool,
+                 options: Optional[BusOptions] = None, template_dir: Optional[str] = None) -> None:
+        """
+        Args:
+            bus_slaves (BusSlaves): Parsed bus slaves configuration.
+            ip_library (IPLibrary): Parsed IP library.
+            options (Optional[BusOptions]): Interconnect options (default: the classic flat bus).
+            template_dir (Optional[str]): Directory of user templates (default: built-in only).
+        """
+        self.bus_slaves = bus_slaves.slaves
+        self.ip_library = ip_library
+        self.has_pic = has_pic
+        self.options = options or BusOptions()
+        self.template_dir = template_dir
+        self.processed_slaves: List[ProcessedSlave] = []
+        self._process_slaves()
+        if self.options.mux == "onehot":
+            self._check_disjoint_regions()
+        if self.options.decoder == "mask":
+            self._check_aligned_regions()
+        self.clusters = self._partition_clusters()
+
+    def _process_slaves(self) -> None:
+        base_addr_start = 0x10000000
+        base_addr_offset = 0x10000
+        ip_dict = self.ip_library.ip_dict
+        for idx, slave in enumerate(self.bus_slaves):
+            if slave.type not in ip_dict and slave.type != "wb_pic_8":
+                logging.error(f"Slave type '{slave.type}' for slave '{slave.name}' not found in IP library.")
+                sys.exit(1)
+            if slave.type != "wb_pic_8":
+                lib_entry = ip_dict[slave.type]
+                info = lib_entry.info
+                if not any(b.upper() in {"WB", "GENERIC"} for b in info.bus):
+                    logging.warning(f"IP '{slave.type}' (for slave '{slave.name}') does not support WB (bus: {info.bus}). Using 0 cell count.")
+                    cell_count = 0
+                else:
+                    cell_count = wb_cell_count(info.cell_count) or 0
+                if slave.irq is not None and lib_entry.flags is None:
+                    logging.error(f"Slave '{slave.name}' of type '{slave.type}' specifies IRQ but library entry lacks 'flags'.")
+                    sys.exit(1)
+                external_interface=lib_entry.external_interface
+            else:
+                cell_count = 500
+                external_interface = None
+
+            base_address = slave.base_address or f"32'h{hex(base_addr_start + idx * base_addr_offset)[2:].upper()}"
+            io_pins_converted = slave.convert_io_pins()
+            processed = ProcessedSlave(
+                name=slave.name,
+                type=slave.type,
                 base_address=base_address,
                 io_pins=io_pins_converted,
                 irq=slave.irq,
@@ -297,333 +2956,1135 @@ class BusGenerator:
             )
             self.processed_slaves.append(processed)
 
-    def generate_verilog(self, has_pic) -> str:
-        total_wb_cell_count = sum(slave.cell_count for slave in self.processed_slaves)
-        io_oen_assignments: Dict[int, int] = {}
-        lines: List[str] = []
-        lines.append("// Generated Wishbone Bus Verilog Code with Bus Splitter, External Interface Mapping, IRQ Checkers, and Total WB Cell Count")
-        lines.append("")
-        lines.append("module wb_bus(")
-        lines.append("    input         wb_clk,")
-        lines.append("    input         wb_rst,")
-        lines.append("    input  [31:0] wb_adr,")
-        lines.append("    inout  [31:0] wb_dat_i,")
-        lines.append("    input         wb_we,")
-        lines.append("    input         wb_stb,")
-        lines.append("    input         wb_cyc,")
-        lines.append("    input  [31:0] wb_dat_o,")
-        lines.append("    output        wb_ack,")
-        lines.append("    input  [37:0] io_in,")
-        lines.append("    output [37:0] io_out,")
-        lines.append("    output [37:0] io_oen,")
-        lines.append("    output [2:0]  user_irq")
-        lines.append(");")
-        lines.append("")
-        lines.append("    localparam SLAVE_ADDR_SIZE = 32'h0001_0000;")
-        lines.append(f"    localparam TOTAL_WB_CELL_COUNT = {total_wb_cell_count};")
-        lines.append("")
-        for idx, slave in enumerate(self.processed_slaves):
-            lines.append(f"    // Wires for slave {idx}: {slave.name}")
-            lines.append(f"    wire [31:0] slave{idx}_dat;")
-            lines.append(f"    wire        slave{idx}_ack;")
-            lines.append(f"    wire        cs{idx};")
-            lines.append("")
-        for idx, slave in enumerate(self.processed_slaves):
-            lines.append(f"    assign cs{idx} = ((wb_adr >= {slave.base_address}) && (wb_adr < ({slave.base_address} + SLAVE_ADDR_SIZE))) ? 1'b1 : 1'b0;")
-        lines.append("")
-        if has_pic:
-            lines.append(f"    wire [9:0] pic_irq;")
-            lines.append(f"    assign pic_irq[1:0] = user_irq[1:0];\n")
-            
-            lines.append(f"    // Instantiate the PIC")
-            lines.append(f"    wb_pic_8 PIC (")
-            lines.append(f"          .clk(wb_clk),")
-            lines.append(f"          .rst(wb_rst),")
-            lines.append(f"          .wb_addr(wb_adr),")
-            lines.append(f"          .wb_wdata(wb_dat_i),")
-            lines.append(f"          .wb_we(wb_we),")
-            lines.append(f"          .wb_stb(wb_stb),")
-            lines.append(f"          .wb_rdata(slave0_dat),")
-            lines.append(f"          .wb_ack(slave0_ack),")
-            lines.append(f"          .int_in(pic_irq[9:2]),")
-            lines.append(f"          .irq(user_irq[2])")
-            lines.append(f"    );")
+    def _check_disjoint_regions(self) -> None:
+        """Exits with an error if two slave address regions overlap.
+
+        A one-hot mux ORs the outputs of all selected slaves, so at most one may be selected.
+        """
+        regions: List[Tuple[int, ProcessedSlave]] = []
+        for slave in self.processed_slaves:
+            address = address_value(slave.base_address)
+            if address is None:
+                logging.error(f"mux: {self.options.mux} needs numeric base addresses, but slave '{slave.name}' "
+                              f"has '{slave.base_address}'.")
+                sys.exit(1)
+            regions.append((address, slave))
+        regions.sort(key=lambda region: region[0])
+        for (address, slave), (next_address, next_slave) in zip(regions, regions[1:]):
+            if next_address < address + SLAVE_ADDR_SIZE:
+                logging.error(f"mux: {self.options.mux} needs disjoint address regions, but slaves '{slave.name}' "
+                              f"({slave.base_address}) and '{next_slave.name}' ({next_slave.base_address}) overlap.")
+                sys.exit(1)
+
+    def _check_aligned_regions(self) -> None:
+        """Exits with an error if a slave region cannot be mask-decoded."""
+        for slave in self.processed_slaves:
+            if mask_match(slave.base_address) is None:
+                logging.error(f"decoder: mask needs base addresses aligned to the {SLAVE_ADDR_SIZE:#x} byte "
+                              f"slave region, but slave '{slave.name}' is at '{slave.base_address}' "
+                              f"(use decoder: auto to fall back to range decoding).")
+                sys.exit(1)
+
+    def _partition_clusters(self) -> List[List[int]]:
+        """Groups the slaves into clusters, as listed in the YAML or by cluster_size.
+
+        With cluster_size, a single slave left over stays on the top-level bus. The address
+        span of every cluster, from its lowest to its highest slave region, must not
+        contain slaves of other clusters or slaves outside clusters, so that the top-level bus
+        can select the cluster with a single decoder.
+
+        Returns:
+            List[List[int]]: The positions of the slaves of each cluster.
+        """
+        if not self.options.clusters and not self.options.cluster_size:
+            return []
+        addresses: List[int] = []
+        for slave in self.processed_slaves:
+            address = address_value(slave.base_address)
+            if address is None:
+                logging.error(f"Clusters need numeric base addresses, but slave '{slave.name}' has "
+                              f"'{slave.base_address}'.")
+                sys.exit(1)
+            addresses.append(address)
+        if self.options.cluster_size:
+            candidates = sorted((idx for idx, slave in enumerate(self.processed_slaves) if slave.type != "wb_pic_8"),
+                                key=lambda idx: addresses[idx])
+            size = self.options.cluster_size
+            # A single slave left over stays on the top-level bus rather than behind its own bridge.
+            groups = [candidates[start:start + size] for start in range(0, len(candidates), size)
+                      if len(candidates) - start > 1]
+        else:
+            positions = {slave.name: idx for idx, slave in enumerate(self.processed_slaves)}
+            seen: Set[int] = set()
+            groups = []
+            for names in self.options.clusters:
+                if len(names) < 2:
+                    logging.error(f"Cluster {', '.join(names)} needs at least two slaves.")
+                    sys.exit(1)
+                group: List[int] = []
+                for name in names:
+                    idx = positions.get(name)
+                    if idx is None:
+                        logging.error(f"Cluster slave '{name}' is not defined in the bus YAML.")
+                        sys.exit(1)
+                    if self.processed_slaves[idx].type == "wb_pic_8":
+                        logging.error(f"The PIC '{name}' stays on the top-level bus and cannot be part of a cluster.")
+                        sys.exit(1)
+                    if idx in seen:
+                        logging.error(f"Slave '{name}' is listed in more than one cluster.")
+                        sys.exit(1)
+                    seen.add(idx)
+                    group.append(idx)
+                groups.append(group)
+        for number, group in enumerate(groups):
+            low = min(addresses[idx] for idx in group)
+            high = max(addresses[idx] for idx in group) + SLAVE_ADDR_SIZE
+            for idx, slave in enumerate(self.processed_slaves):
+                if idx not in group and addresses[idx] < high and addresses[idx] + SLAVE_ADDR_SIZE > low:
+                    logging.error(f"Cluster {number} spans {low:#010x}-{high - 1:#010x}, which overlaps slave "
+                                  f"'{slave.name}' outside the cluster.")
+                    sys.exit(1)
+        return groups
+
+    def _build_cluster(self, number: int, members: List[SlaveInstance]) -> ClusterDesign:
+        """Lays out one cluster and renders its module.
+
+        Args:
+            number (int): Position of the cluster.
+            members (List[SlaveInstance]): The slaves of the cluster, in local order.
+
+        Returns:
+            ClusterDesign: The cluster.
+        """
+        addresses = [address_value(member.base_address) or 0 for member in members]
+        low, high = min(addresses), max(addresses) + SLAVE_ADDR_SIZE
+        base = f"32'h{low:08X}"
+        address_match = ""
+        if self.options.decoder != "range":
+            address_match = mask_match(base, "wb_adr", high - low) or ""
+        ports = [MuxSignals(f"cs{member.local_index}",
+                            f"slave_dat[{32 * member.local_index + 31}:{32 * member.local_index}]",
+                            f"slave_ack[{member.local_index}]") for member in members]
+        mux = MuxDesign.build(self.options.mux, ports)
+        cluster = ClusterDesign(index=number, members=members, base=base, last=f"32'h{high - 1:08X}",
+                                address_match=address_match, mux=mux)
+        cluster.mux_block = "".join(render_template(self.options.backend, "wb_mux.v", mux, self.template_dir))
+        cluster.module = "".join(render_template(self.options.backend, "wb_cluster.v", cluster, self.template_dir))
+        return cluster
+
+    def generate_verilog(self, has_pic) -> str:
+        return "".join(self.iter_verilog(has_pic))
+
+    def iter_verilog(self, has_pic) -> Iterator[str]:
+        """Emits the wb_bus module as a sequence of text chunks.
+
+        The design is validated and turned into a BusDesign first, then rendered through the
+        wb_bus template of the backend, so it never has to be held in memory as text;
+        concatenating the chunks gives the complete module.
+
+        Args:
+            has_pic (bool): Whether the bus includes the PIC.
+
+        Returns:
+            Iterator[str]: Chunks of Verilog text.
+        """
+        return render_template(self.options.backend, "wb_bus.v", self.build_design(has_pic), self.template_dir)
+
+    def build_design(self, has_pic, block_cache: Optional["BlockCache"] = None) -> BusDesign:
+        """Resolves the connections of every slave into the template context.
+
+        The instantiation block of every slave is rendered here. With a block cache, a slave
+        whose inputs are unchanged reuses its cached block and pad drives instead of being
+        resolved and rendered again.
+
+        Args:
+            has_pic (bool): Whether the bus includes the PIC.
+            block_cache (Optional[BlockCache]): Cache of rendered slave blocks.
+
+        Returns:
+            BusDesign: The design to render.
+        """
+        total_wb_cell_count = sum(slave.cell_count for slave in self.processed_slaves)
+        io_oen_assignments: Dict[int, int] = {}
+        slaves: List[SlaveInstance] = []
+        backend = self.options.backend
+        if backend == "pipelined":
+            request, decode_adr = BRIDGE_REQUEST, "wb_adr"
+        elif self.options.decode_stages or self.options.response_stages:
+            request, decode_adr = REGISTERED_REQUEST, REGISTERED_REQUEST.adr
+        else:
+            request, decode_adr = WB_REQUEST, WB_REQUEST.adr
+        placements = {idx: (number, position) for number, group in enumerate(self.clusters)
+                      for position, idx in enumerate(group)}
+        block_template = load_template(backend, "wb_slave.v", self.template_dir)
+        if block_cache is not None:
+            block_cache.begin(block_template.source)
+        for idx, slave in enumerate(self.processed_slaves):
+            instance = SlaveInstance(index=idx, name=slave.name, type=slave.type,
+                                     base_address=slave.base_address, connections=[],
+                                     is_pic=slave.type == "wb_pic_8")
+            slave_request, slave_decode_adr = request, decode_adr
+            if idx in placements:
+                instance.cluster, instance.local_index = placements[idx]
+                prefix = f"cluster{instance.cluster}"
+                slave_request = RequestSignals(f"{prefix}_adr", f"{prefix}_dat", f"{prefix}_we",
+                                               f"{prefix}_stb[{instance.local_index}]",
+                                               f"{prefix}_cyc[{instance.local_index}]")
+                slave_decode_adr = "req_adr"
+            if self.options.decoder != "range":
+                instance.address_match = mask_match(slave.base_address, slave_decode_adr) or ""
+            slaves.append(instance)
+            if instance.is_pic:
+                continue
+            key = None
+            cached = None
+            if block_cache is not None:
+                key = block_cache.key(idx, slave, has_pic, slave_request, self.ip_library)
+                cached = block_cache.get(key)
+            if cached is not None:
+                connections, instance.block, pin_drives = cached
+                instance.connections = list(connections)
+            else:
+                instance.connections, pin_drives = self._resolve_connections(idx, slave, has_pic, slave_request)
+                instance.block = "".join(block_template.render(instance))
+                if block_cache is not None:
+                    block_cache.put(key, instance.connections, instance.block, pin_drives)
+            for pin, drive, force in pin_drives:
+                if force:
+                    io_oen_assignments[pin] = drive
+                else:
+                    io_oen_assignments.setdefault(pin, drive)
+        pins: List[PinAssignment] = []
+        # Only assign default values to io_oen and io_out if the pin is not connected by an external interface.
+        for pin in range(0, 38):
+            if pin not in io_oen_assignments:
+                pins.append(PinAssignment(pin, "1'b1", "1'b0"))
+            elif io_oen_assignments[pin] == 0:
+                pins.append(PinAssignment(pin, "1'b0", None))
+            elif io_oen_assignments[pin] == 1:
+                pins.append(PinAssignment(pin, "1'b1", None))
+            else:
+                pins.append(PinAssignment(pin, None, None))
+        clusters = [self._build_cluster(number, [slaves[idx] for idx in group])
+                    for number, group in enumerate(self.clusters)]
+        # The slaves outside clusters and the clusters share the top-level mux, in bus order.
+        ports: List[MuxSignals] = []
+        for instance in slaves:
+            if instance.cluster is None:
+                ports.append(MuxSignals(f"cs{instance.index}", f"slave{instance.index}_dat",
+                                        f"slave{instance.index}_ack"))
+            elif instance is min(clusters[instance.cluster].members, key=lambda member: member.index):
+                prefix = f"cluster{instance.cluster}"
+                ports.append(MuxSignals(f"{prefix}_sel", f"{prefix}_rdat", f"{prefix}_ack"))
+        mux = MuxDesign.build(self.options.mux, ports)
+        mux_block = "".join(render_template(backend, "wb_mux.v", mux, self.template_dir)) \
+            if backend == DEFAULT_BACKEND else ""
+        return BusDesign(backend=backend, has_pic=has_pic, total_wb_cell_count=total_wb_cell_count,
+                         slaves=slaves, instances=[slave for slave in slaves if not slave.is_pic], pins=pins,
+                         mux=mux.style, mux_depth=mux.depth, ports=ports, mux_block=mux_block,
+                         clusters=clusters, decoder=self.options.decoder,
+                         decode_stages=self.options.decode_stages, response_stages=self.options.response_stages,
+                         request=request, outstanding=PIPELINED_OUTSTANDING if backend == "pipelined" else 0,
+                         index_bits=max(1, (len(slaves) - 1).bit_length()), template_dir=self.template_dir)
+
+
+
+    def _resolve_connections(self, idx: int, slave: ProcessedSlave, has_pic: bool,
+                             request: RequestSignals = WB_REQUEST) -> Tuple[List[str], List[Tuple[int, int, bool]]]:
+        """Resolves the port connections of one slave instance.
+
+        Args:
+            idx (int): Position of the slave on the bus.
+            slave (ProcessedSlave): The slave.
+            has_pic (bool): Whether the bus includes the PIC.
+            request (RequestSignals): The request signals that drive the slave.
+
+        Returns:
+            Tuple[List[str], List[Tuple[int, int, bool]]]: The port connections, and the pad
+            drives as (pin, drive, force) in order: drive 0 is an input, 1 an output and 2 an
+            output enable; a forced drive overrides earlier ones, the others apply only to
+            pins not driven yet.
+        """
+        inst_lines: List[str] = []
+        pin_drives: List[Tuple[int, int, bool]] = []
+        inst_lines.append(f".clk_i(wb_clk)")
+        inst_lines.append(f".rst_i(wb_rst)")
+        request = request.slave(idx)
+        inst_lines.append(f".adr_i({request.adr})")
+        inst_lines.append(f".dat_o(slave{idx}_dat)")
+        inst_lines.append(f".dat_i({request.dat})")
+        inst_lines.append(f".we_i({request.we})")
+        inst_lines.append(f".stb_i({request.stb})")
+        inst_lines.append(f".cyc_i({request.cyc})")
+        inst_lines.append(f".ack_o(slave{idx}_ack)")
+        # Connect external interfaces based on width and output_control property.
+        for iface in slave.external_interface:
+            iface_name: str = iface.name
+            port_name: str = iface.port
+            direction: str = iface.direction.lower()
+            skip_port = False
+            if iface_name not in slave.io_pins:
+                if direction == "input":
+                    inst_lines.append(f".{port_name}(1'b0)")
+                    skip_port = True
+                else:
+                    logging.error(f"Slave '{slave.name}' requires external interface '{iface_name}' but no mapping provided in io_pins.")
+                    sys.exit(1)
+            if not skip_port:
+                try:
+                    pin_start: int = int(slave.io_pins[iface_name])
+                except ValueError:
+                    logging.error(f"I/O pin for interface '{iface_name}' in slave '{slave.name}' must be an integer.")
+                    sys.exit(1)
+                pin_end: int = pin_start + iface.width - 1
+                if not all(0 <= p <= 37 for p in range(pin_start, pin_end + 1)):
+                    logging.error(f"I/O pins from {pin_start} to {pin_end} for interface '{iface_name}' in slave '{slave.name}' are out of range (0-37).")
+                    sys.exit(1)
+                if direction == "input":
+                    inst_lines.append(f".{port_name}(io_in[{pin_end}:{pin_start}])")
+                    for p in range(pin_start, pin_end + 1):
+                        pin_drives.append((p, 0, False))
+                elif direction == "output":
+                    if iface.output_control is True:
+                        inst_lines.append(f".{port_name}(io_oen[{pin_end}:{pin_start}])")
+                        for p in range(pin_start, pin_end + 1):
+                            pin_drives.append((p, 2, True))
+                    else:
+                        inst_lines.append(f".{port_name}(io_out[{pin_end}:{pin_start}])")
+                        for p in range(pin_start, pin_end + 1):
+                            pin_drives.append((p, 1, False))
+                else:
+                    logging.error(f"Unknown direction '{direction}' for interface '{iface_name}' in slave '{slave.name}'.")
+                    sys.exit(1)
+        if slave.irq is not None:
+            if has_pic == True:
+                if not (0 <= slave.irq <= 9):
+                    logging.error(f"IRQ {slave.irq} for slave '{slave.name}' out of range (0-9).")
+                    sys.exit(1)
+                inst_lines.append(f".IRQ(pic_irq[{slave.irq}])")
+            else:
+                if not (0 <= slave.irq <= 2):
+                    logging.error(f"IRQ {slave.irq} for slave '{slave.name}' out of range (0-2).")
+                    sys.exit(1)
+                inst_lines.append(f".IRQ(user_irq[{slave.irq}])")
+        return inst_lines, pin_drives
+
+
+def generate_wrapper(wb_bus_code: str) -> str:
+    """Generates the top-level wrapper module 'user_project_wrapper'.
+
+    Args:
+        wb_bus_code (str): The Verilog code for the wb_bus module.
+
+    Returns:
+        str: The complete Verilog code with the wrapper.
+    """
+    return "".join(iter_wrapper([wb_bus_code]))
+
+
+def iter_wrapper(wb_bus_chunks: Iterable[str], design: Optional[BusDesign] = None) -> Iterator[str]:
+    """Emits the wb_bus module followed by the top-level wrapper module as text chunks.
+
+    Args:
+        wb_bus_chunks (Iterable[str]): Chunks of the Verilog code for the wb_bus module.
+        design (Optional[BusDesign]): The design, for wrapper templates that use it.
+
+    Returns:
+        Iterator[str]: Chunks of the complete Verilog code with the wrapper.
+    """
+    yield from wb_bus_chunks
+    yield "\n\n"
+    yield from render_template(design.backend if design else DEFAULT_BACKEND, "user_project_wrapper.v", design,
+                               design.template_dir if design else None)
+
+
+def convert_base_address_to_c_format(addr: str) -> str:
+    """Converts a base address string from Verilog style (e.g. 32'h30000000) to C hex format (e.g. 0x30000000).
+
+    Args:
+        addr (str): The base address string.
+
+    Returns:
+        str: The converted C-style hex string.
+    """
+    if addr.startswith("32'h") or addr.startswith("32'H"):
+        return "0x" + addr[4:]
+    elif addr.startswith("0x"):
+        return addr
+    else:
+        try:
+            num = int(addr, 0)
+            return hex(num)
+        except Exception:
+            return addr
+        
+def generate_c_header(generator: "BusGenerator", bus_yaml_file: str) -> str:
+    """Generates a C header file string with macros defining base addresses for each slave.
+
+    Args:
+        generator (BusGenerator): The BusGenerator instance with processed slaves.
+        bus_yaml_file (str): The YAML file name used, for generating the header guard.
+
+    Returns:
+        str: The C header file content.
+    """
+    output_header_filename = bus_yaml_file
+    if output_header_filename.lower().endswith(".yaml"):
+        output_header_filename = output_header_filename[:-5] + ".h"
+    elif output_header_filename.lower().endswith(".yml"):
+        output_header_filename = output_header_filename[:-4] + ".h"
+    else:
+        output_header_filename += ".h"
+    header_guard = "__" + os.path.basename(output_header_filename).replace(".", "_").upper() + "__"
+    lines: List[str] = []
+    lines.append(f"#ifndef {header_guard}")
+    lines.append(f"#define {header_guard}")
+    lines.append("")
+    for slave in generator.processed_slaves:
+        macro_name = slave.name.upper() + "_BASE"
+        base_addr_c = convert_base_address_to_c_format(slave.base_address)
+        lines.append(f"#define {macro_name} {base_addr_c}")
+    lines.append("")
+    lines.append(f"#endif // {header_guard}")
+    return "\n".join(lines)
+
+def output_filename(bus_yaml_file: str, extension: str) -> str:
+    """Derives an output file name by replacing the .yaml/.yml extension of a bus file.
+
+    Args:
+        bus_yaml_file (str): Path to the bus YAML file.
+        extension (str): The output extension, including the dot.
+
+    Returns:
+        str: The output file name.
+    """
+    if bus_yaml_file.lower().endswith(".yaml"):
+        return bus_yaml_file[:-5] + extension
+    if bus_yaml_file.lower().endswith(".yml"):
+        return bus_yaml_file[:-4] + extension
+    return bus_yaml_file + extension
+
+
+_tool_fingerprint_value: Optional[str] = None
+
+
+def tool_fingerprint() -> str:
+    """Returns the SHA-256 of this script, which identifies the generator version.
+
+    Any change to the code, and so to the generated output, gives a new fingerprint.
+    """
+    global _tool_fingerprint_value
+    if _tool_fingerprint_value is None:
+        _tool_fingerprint_value = _file_sha256(os.path.abspath(__file__))
+    return _tool_fingerprint_value
+
+
+_entry_hash_memo: "weakref.WeakKeyDictionary[IPLibrary, Dict[str, str]]" = weakref.WeakKeyDictionary()
+_entry_hash_memo_lock = threading.Lock()
+
+
+def library_entry_hash(ip_library: IPLibrary, name: str) -> str:
+    """Returns the SHA-256 of the normalized raw library entry of an IP.
+
+    The hashes are remembered for as long as the library object lives.
+
+    Args:
+        ip_library (IPLibrary): The IP library.
+        name (str): The IP name.
+
+    Returns:
+        str: The hex digest.
+    """
+    with _entry_hash_memo_lock:
+        hashes = _entry_hash_memo.setdefault(ip_library, {})
+        digest = hashes.get(name)
+    if digest is None:
+        entry_text = json.dumps(ip_library.raw_entry(name), sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(entry_text.encode()).hexdigest()
+        with _entry_hash_memo_lock:
+            hashes[name] = digest
+    return digest
+
+
+# Shared by the server's request threads; every access holds the lock.
+_block_cache_memo: Dict[str, Tuple[str, Dict[Any, Any]]] = {}
+_block_cache_memo_lock = threading.Lock()
+
+
+class BlockCache:
+    """Rendered instantiation blocks of the slaves of one output file, kept in memory.
+
+    A block is keyed by the slave's processed fields and bus position, the PIC flag, the request
+    signals and the hash of its library entry; the whole cache is dropped when the slave
+    template changes.
+    The blocks live as long as the process, so a resident process (--watch or the server)
+    re-renders only the slaves that changed since the previous generation of the same output.
+    Only the blocks used by the latest generation are kept.
+    """
+
+    def __init__(self, output_path: str) -> None:
+        """
+        Args:
+            output_path (str): The Verilog output file the blocks belong to.
+        """
+        self.output_path = os.path.abspath(output_path)
+        self._template = ""
+        self._blocks: Dict[Any, Any] = {}
+        self._used: Dict[Any, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def begin(self, template: str) -> None:
+        """Picks up the blocks of the previous generation if they used the same slave template.
+
+        Args:
+            template (str): Source of the slave template.
+        """
+        self._template = template
+        with _block_cache_memo_lock:
+            previous_template, blocks = _block_cache_memo.get(self.output_path, ("", {}))
+            if previous_template == template:
+                self._blocks = dict(blocks)
+
+    def key(self, idx: int, slave: ProcessedSlave, has_pic: bool, request: RequestSignals,
+            ip_library: IPLibrary) -> Any:
+        """Computes the key of a slave block.
+
+        Args:
+            idx (int): Position of the slave on the bus.
+            slave (ProcessedSlave): The slave.
+            has_pic (bool): Whether the bus includes the PIC.
+            request (RequestSignals): The request signals that drive the slave.
+            ip_library (IPLibrary): The IP library.
+
+        Returns:
+            Any: The key.
+        """
+        # The interfaces and cell count come from the library entry, so its hash stands in for them.
+        return (idx, slave.name, slave.type, slave.base_address, tuple(sorted(slave.io_pins.items())),
+                slave.irq, has_pic, request, library_entry_hash(ip_library, slave.type))
+
+    def get(self, key: Any) -> Optional[Tuple[List[str], str, List[Tuple[int, int, bool]]]]:
+        """Returns the (connections, block, pad drives) stored under a key, if any."""
+        stored = self._blocks.get(key)
+        if stored is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used[key] = stored
+        return stored
+
+    def put(self, key: Any, connections: List[str], block: str, drives: List[Tuple[int, int, bool]]) -> None:
+        """Stores a freshly rendered block."""
+        self._used[key] = (connections, block, drives)
+
+    def save(self) -> None:
+        """Keeps the blocks of this generation for the next one and drops the others."""
+        with _block_cache_memo_lock:
+            _block_cache_memo[self.output_path] = (self._template, dict(self._used))
+
+
+def generation_cache_key(bus_yaml_file: str, bus_data: Dict[str, Any], ip_library: IPLibrary,
+                         template_dir: Optional[str] = None) -> Optional[str]:
+    """Computes the content address of the outputs of one bus file.
+
+    The key covers everything the outputs depend on: the normalized bus YAML (including the
+    PIC flag), the library entries of the slave types actually used, the generator version, any
+    user templates and the output file name, which appears in the header guard.
+
+    Args:
+        bus_yaml_file (str): Path to the bus YAML file.
+        bus_data (Dict[str, Any]): The parsed bus YAML data.
+        ip_library (IPLibrary): The IP library.
+        template_dir (Optional[str]): Directory of user templates.
+
+    Returns:
+        Optional[str]: The key, or None if the outputs cannot be cached (e.g. an unknown type).
+    """
+    entries: Dict[str, str] = {}
+    try:
+        for slave in bus_data.get("slaves") or []:
+            slave_type = slave["type"]
+            if slave_type == "wb_pic_8" or slave_type in entries:
+                continue
+            if slave_type not in ip_library:
+                return None
+            entries[slave_type] = library_entry_hash(ip_library, slave_type)
+        material = json.dumps({
+            "tool": tool_fingerprint(),
+            "bus": bus_data,
+            "pic": bool(bus_data.get("PIC", False)),
+            "entries": entries,
+            "header": os.path.basename(output_filename(bus_yaml_file, ".h")),
+            "templates": templates_fingerprint(template_dir),
+        }, sort_keys=True, separators=(",", ":"), default=str)
+    except (TypeError, KeyError, AttributeError):
+        return None
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _generated_paths(key: str) -> Tuple[str, str, str]:
+    """Returns the generation cache (Verilog, C header, manifest) file paths for a key."""
+    base = os.path.join(cache_config.directory, "generated", key[:2], key)
+    return base + ".v", base + ".h", base + ".json"
+
+
+def _load_generated(key: str) -> Optional[Tuple[str, str]]:
+    """Returns the stored (Verilog, C header) output files of a generation key, if they are intact.
+
+    The manifest is written after both outputs and records their hashes, so entries that were
+    cut short or changed afterwards are regenerated rather than copied into the design.
+    """
+    verilog_path, header_path, manifest_path = _generated_paths(key)
+    manifest = _read_cache_meta(manifest_path)
+    if not manifest:
+        return None
+    try:
+        if _file_sha256(verilog_path) == manifest.get("verilog") and _file_sha256(header_path) == manifest.get("header"):
+            return verilog_path, header_path
+    except OSError:
+        pass
+    logging.warning(f"Ignoring corrupt generation cache entry {key[:12]}")
+    return None
+
+
+def _store_generated(key: str, verilog_filename: str, header_filename: str) -> None:
+    """Copies freshly generated output files into the generation cache."""
+    verilog_path, header_path, manifest_path = _generated_paths(key)
+    for source, path in ((header_filename, header_path), (verilog_filename, verilog_path)):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as tmp_f, open(source, "rb") as source_f:
+                    shutil.copyfileobj(source_f, tmp_f, STREAM_CHUNK_SIZE)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logging.warning(f"Could not write generation cache entry '{path}': {e}")
+            return
+    _write_cache_meta(manifest_path, {"verilog": _file_sha256(verilog_path), "header": _file_sha256(header_path)})
+
+
+def _read_umask() -> int:
+    """Returns the process umask.
+
+    os.umask can only read the mask by setting it, which races with files created by other
+    threads, so this runs once at import time, before the server starts any thread.
+    """
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK: int = _read_umask()
+
+
+def _new_file_mode(path: str) -> int:
+    """Returns the permission bits for (re)writing a file: its current ones, or the umask default."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def write_if_changed(path: str, chunks: Iterable[str]) -> bool:
+    """Streams a generated file to disk unless it already has exactly this content.
+
+    The chunks go through a buffered temporary file next to the target and are compared with
+    the existing file as they are written, so the content is never held in memory as a whole.
+    Leaving an unchanged file alone keeps its modification time, so make-style flows do not
+    rebuild downstream. A changed file is renamed into place and keeps its permissions. If
+    producing the chunks fails, the existing file is left untouched.
+
+    Args:
+        path (str): Output file path.
+        chunks (Iterable[str]): The generated content.
+
+    Returns:
+        bool: True if the file was written.
+    """
+    directory = os.path.dirname(path) or "."
+    try:
+        existing_f: Optional[BinaryIO] = open(path, "rb")
+    except FileNotFoundError:
+        existing_f = None
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        same = existing_f is not None
+        with os.fdopen(fd, "wb", buffering=STREAM_CHUNK_SIZE) as tmp_f:
+            for chunk in chunks:
+                data = chunk.encode()
+                tmp_f.write(data)
+                if same:
+                    same = existing_f.read(len(data)) == data
+            if same:
+                same = existing_f.read(1) == b""
+            if not same:
+                os.fchmod(tmp_f.fileno(), _new_file_mode(path))
+        if same:
+            os.unlink(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        return True
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        if existing_f is not None:
+            existing_f.close()
+
+
+def iter_file_chunks(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Reads a text file in chunks.
+
+    Args:
+        path (str): The file path.
+        chunk_size (int): Characters per chunk.
+
+    Returns:
+        Iterator[str]: The file content in chunks.
+    """
+    with open(path, "r", newline="") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def generate_bus_outputs(bus_yaml_file: str, bus_data: Dict[str, Any], ip_library: IPLibrary,
+                         template_dir: Optional[str] = None) -> List[str]:
+    """Generates the Verilog and C header files of one bus YAML file.
+
+    The Verilog is streamed from the emitters into the output file. Outputs already generated
+    for the same inputs are taken from the generation cache without running BusGenerator.
+
+    Args:
+        bus_yaml_file (str): Path to the bus YAML file; the outputs are named after it.
+        bus_data (Dict[str, Any]): The parsed bus YAML data.
+        ip_library (IPLibrary): The IP library.
+        template_dir (Optional[str]): Directory of user templates.
+
+    Returns:
+        List[str]: The files that were updated; outputs whose content did not change are
+        left untouched and not listed.
+    """
+    options = parse_bus_options(bus_data)
+    key = None
+    if cache_config.enabled and _cache_is_writable():
+        key = generation_cache_key(bus_yaml_file, bus_data, ip_library, template_dir)
+    cached = _load_generated(key) if key is not None else None
+    generator: Optional[BusGenerator] = None
+    if cached is not None:
+        logging.info(f"Using cached outputs for {bus_yaml_file}")
+        verilog_chunks: Iterable[str] = iter_file_chunks(cached[0])
+    else:
+        has_pic: bool = bus_data.get("PIC", False)
+        bus_slaves = parse_bus_slaves(bus_data)
+        generator = BusGenerator(bus_slaves, ip_library, has_pic, options, template_dir)
+        block_cache = BlockCache(output_filename(bus_yaml_file, ".v"))
+        try:
+            design = generator.build_design(has_pic, block_cache)
+        except TemplateError as e:
+            logging.error(f"Template error: {e}")
+            sys.exit(1)
+        for line in interconnect_report(design):
+            logging.info(line)
+        verilog_chunks = iter_wrapper(render_template(design.backend, "wb_bus.v", design, template_dir), design)
+    output_verilog_filename = output_filename(bus_yaml_file, ".v")
+    updated: List[str] = []
+    try:
+        if write_if_changed(output_verilog_filename, verilog_chunks):
+            updated.append(output_verilog_filename)
+            logging.info(f"Generated Verilog written to {output_verilog_filename}")
+        else:
+            logging.info(f"Generated Verilog unchanged, {output_verilog_filename} left as is")
+    except TemplateError as e:
+        logging.error(f"Template error: {e}")
+        sys.exit(1)
+    except OSError as e:
+        logging.error(f"Failed to write output file {output_verilog_filename}: {e}")
+        sys.exit(1)
 
-        for idx, slave in enumerate(self.processed_slaves):
-            if slave.type == "wb_pic_8":
-                continue
-            lines.append(f"    // Instantiate slave {slave.name} of type {slave.type}_WB")
-            inst_lines: List[str] = []
-            inst_lines.append(f".clk_i(wb_clk)")
-            inst_lines.append(f".rst_i(wb_rst)")
-            inst_lines.append(f".adr_i(wb_adr)")
-            inst_lines.append(f".dat_o(slave{idx}_dat)")
-            inst_lines.append(f".dat_i(wb_dat_i)")
-            inst_lines.append(f".we_i(wb_we)")
-            inst_lines.append(f".stb_i(wb_stb & cs{idx})")
-            inst_lines.append(f".cyc_i(wb_cyc & cs{idx})")
-            inst_lines.append(f".ack_o(slave{idx}_ack)")
-            # Connect external interfaces based on width and output_control property.
-            for iface in slave.external_interface:
-                iface_name: str = iface.name
-                port_name: str = iface.port
-                direction: str = iface.direction.lower()
-                skip_port = False
-                if iface_name not in slave.io_pins:
-                    if direction == "input":
-                        inst_lines.append(f".{port_name}(1'b0)")
-                        skip_port = True
-                    else:
-                        logging.error(f"Slave '{slave.name}' requires external interface '{iface_name}' but no mapping provided in io_pins.")
-                        sys.exit(1)
-                if not skip_port:
-                    try:
-                        pin_start: int = int(slave.io_pins[iface_name])
-                    except ValueError:
-                        logging.error(f"I/O pin for interface '{iface_name}' in slave '{slave.name}' must be an integer.")
-                        sys.exit(1)
-                    pin_end: int = pin_start + iface.width - 1
-                    if not all(0 <= p <= 37 for p in range(pin_start, pin_end + 1)):
-                        logging.error(f"I/O pins from {pin_start} to {pin_end} for interface '{iface_name}' in slave '{slave.name}' are out of range (0-37).")
-                        sys.exit(1)
-                    if direction == "input":
-                        inst_lines.append(f".{port_name}(io_in[{pin_end}:{pin_start}])")
-                        for p in range(pin_start, pin_end + 1):
-                            io_oen_assignments.setdefault(p, 0)
-                    elif direction == "output":
-                        if iface.output_control is True:
-                            inst_lines.append(f".{port_name}(io_oen[{pin_end}:{pin_start}])")
-                            for p in range(pin_start, pin_end + 1):
-                                io_oen_assignments[p]= 2
-                        else:
-                            inst_lines.append(f".{port_name}(io_out[{pin_end}:{pin_start}])")
-                            for p in range(pin_start, pin_end + 1):
-                                io_oen_assignments.setdefault(p, 1)
-                    else:
-                        logging.error(f"Unknown direction '{direction}' for interface '{iface_name}' in slave '{slave.name}'.")
-                        sys.exit(1)
-            #print(f"{slave.name} - {has_pic}")
-            if slave.irq is not None:
-                if has_pic == True:
-                    print(f"{slave.name}")
-                    if not (0 <= slave.irq <= 9):
-                        logging.error(f"IRQ {slave.irq} for slave '{slave.name}' out of range (0-9).")
-                        sys.exit(1)
-                    inst_lines.append(f".IRQ(pic_irq[{slave.irq}])")
-                else:
-                    if not (0 <= slave.irq <= 2):
-                        logging.error(f"IRQ {slave.irq} for slave '{slave.name}' out of range (0-2).")
-                        sys.exit(1)
-                    inst_lines.append(f".IRQ(user_irq[{slave.irq}])")
-
-            lines.append(f"    {slave.type}_WB {slave.name} (")
-            lines.append("        " + ",\n        ".join(inst_lines))
-            lines.append("    );")
-            lines.append("")
-        lines.append("    // Bus splitter: Multiplexer for slave outputs")
-        lines.append("    reg [31:0] selected_dat;")
-        lines.append("    reg        selected_ack;")
-        lines.append("    always @(*) begin")
-        for idx in range(len(self.processed_slaves)):
-            if idx == 0:
-                lines.append(f"        if (cs{idx}) begin")
-            else:
-                lines.append(f"        else if (cs{idx}) begin")
-            lines.append(f"            selected_dat = slave{idx}_dat;")
-            lines.append(f"            selected_ack = slave{idx}_ack;")
-            lines.append("        end")
-        lines.append("        else begin")
-        lines.append("            selected_dat = 32'h0;")
-        lines.append("            selected_ack = 1'b0;")
-        lines.append("        end")
-        lines.append("    end")
-        lines.append("")
-        lines.append("    assign wb_dat_o = selected_dat;")
-        lines.append("    assign wb_ack = selected_ack;")
-        lines.append("")
-        # Only assign default values to io_oen and io_out if the pin is not connected by an external interface.
-        for pin in range(0, 38):
-            if pin not in io_oen_assignments:
-                lines.append(f"    assign io_oen[{pin}] = 1'b1;")
-                lines.append(f"    assign io_out[{pin}] = 1'b0;")
-            elif io_oen_assignments[pin] == 0:
-                lines.append(f"    assign io_oen[{pin}] = 1'b0;")
-            elif io_oen_assignments[pin] == 1:
-                lines.append(f"    assign io_oen[{pin}] = 1'b1;")
-        lines.append("")
-        lines.append("endmodule")
-        return "\n".join(lines)
+    header_chunks = iter_file_chunks(cached[1]) if cached is not None \
+        else [generate_c_header(generator, bus_yaml_file)]
+    output_header_filename = output_filename(bus_yaml_file, ".h")
+    try:
+        if write_if_changed(output_header_filename, header_chunks):
+            updated.append(output_header_filename)
+            logging.info(f"Generated C header written to {output_header_filename}")
+        else:
+            logging.info(f"Generated C header unchanged, {output_header_filename} left as is")
+    except OSError as e:
+        logging.error(f"Failed to write header file {output_header_filename}: {e}")
+        sys.exit(1)
+    if cached is None:
+        block_cache.save()
+        if key is not None:
+            _store_generated(key, output_verilog_filename, output_header_filename)
+    return updated
 
 
-def generate_wrapper(wb_bus_code: str) -> str:
-    """Generates the top-level wrapper module 'user_project_wrapper'.
+BUS_FILE_EXTENSIONS: Tuple[str, ...] = (".yaml", ".yml")
+
+
+def is_bus_input(argument: str) -> bool:
+    """Tells whether a generate argument names bus files rather than an IP library.
 
     Args:
-        wb_bus_code (str): The Verilog code for the wb_bus module.
+        argument (str): A positional argument of the generate command.
 
     Returns:
-        str: The complete Verilog code with the wrapper.
+        bool: True for YAML files, directories and glob patterns.
     """
-    lines: List[str] = []
-    lines.append(wb_bus_code)
-    lines.append("")
-    lines.append("module user_project_wrapper #(")
-    lines.append("    parameter BITS = 32")
-    lines.append(") (")
-    lines.append("`ifdef USE_POWER_PINS")
-    lines.append("    inout vdda1,")
-    lines.append("    inout vdda2,")
-    lines.append("    inout vssa1,")
-    lines.append("    inout vssa2,")
-    lines.append("    inout vccd1,")
-    lines.append("    inout vccd2,")
-    lines.append("    inout vssd1,")
-    lines.append("    inout vssd2,")
-    lines.append("`endif")
-    lines.append("    input wb_clk_i,")
-    lines.append("    input wb_rst_i,")
-    lines.append("    input wbs_stb_i,")
-    lines.append("    input wbs_cyc_i,")
-    lines.append("    input wbs_we_i,")
-    lines.append("    input [3:0] wbs_sel_i,")
-    lines.append("    input [31:0] wbs_dat_i,")
-    lines.append("    input [31:0] wbs_adr_i,")
-    lines.append("    output wbs_ack_o,")
-    lines.append("    output [31:0] wbs_dat_o,")
-    lines.append("    input  [127:0] la_data_in,")
-    lines.append("    output [127:0] la_data_out,")
-    lines.append("    input  [127:0] la_oenb,")
-    lines.append("    input  [`MPRJ_IO_PADS-1:0] io_in,")
-    lines.append("    output [`MPRJ_IO_PADS-1:0] io_out,")
-    lines.append("    output [`MPRJ_IO_PADS-1:0] io_oeb,")
-    lines.append("    inout [`MPRJ_IO_PADS-10:0] analog_io,")
-    lines.append("    input   user_clock2,")
-    lines.append("    output [2:0] user_irq")
-    lines.append(");")
-    lines.append("    wire [31:0] wb_dat_bus;")
-    #lines.append("    assign wb_dat_bus = (wbs_we_i) ? wbs_dat_i : 32'bz;")
-    #lines.append("    assign wbs_dat_o = wb_dat_bus;")
-    lines.append("    wire [`MPRJ_IO_PADS-1:0] internal_io_oen;")
-    lines.append("    wb_bus u_wb_bus (")
-    lines.append("        .wb_clk(wb_clk_i),")
-    lines.append("        .wb_rst(wb_rst_i),")
-    lines.append("        .wb_adr(wbs_adr_i),")
-    lines.append("        .wb_dat_o(wbs_dat_o),")
-    lines.append("        .wb_dat_i(wbs_dat_i),")
-    lines.append("        .wb_we(wbs_we_i),")
-    lines.append("        .wb_stb(wbs_stb_i),")
-    lines.append("        .wb_cyc(wbs_cyc_i),")
-    lines.append("        .wb_ack(wbs_ack_o),")
-    lines.append("        .io_in(io_in),")
-    lines.append("        .io_out(io_out),")
-    lines.append("        .io_oen(internal_io_oen),")
-    lines.append("        .user_irq(user_irq)")
-    lines.append("    );")
-    lines.append("    assign io_oeb = ~internal_io_oen;")
-    lines.append("endmodule")
-    return "\n".join(lines)
+    if "://" in argument:
+        return False
+    return (argument.lower().endswith(BUS_FILE_EXTENSIONS) or os.path.isdir(argument)
+            or glob.has_magic(argument))
 
-def convert_base_address_to_c_format(addr: str) -> str:
-    """Converts a base address string from Verilog style (e.g. 32'h30000000) to C hex format (e.g. 0x30000000).
+
+def expand_bus_inputs(arguments: List[str]) -> Tuple[List[str], List[str]]:
+    """Expands directories and glob patterns into bus YAML files.
 
     Args:
-        addr (str): The base address string.
+        arguments (List[str]): Bus files, directories and glob patterns.
 
     Returns:
-        str: The converted C-style hex string.
+        Tuple[List[str], List[str]]: The bus files, in order and without duplicates, and the
+        arguments that matched no file.
     """
-    if addr.startswith("32'h") or addr.startswith("32'H"):
-        return "0x" + addr[4:]
-    elif addr.startswith("0x"):
-        return addr
-    else:
+    bus_files: List[str] = []
+    unmatched: List[str] = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            matches = sorted(os.path.join(argument, name) for name in os.listdir(argument)
+                             if name.lower().endswith(BUS_FILE_EXTENSIONS)
+                             and os.path.isfile(os.path.join(argument, name)))
+        elif glob.has_magic(argument):
+            matches = sorted(glob.glob(argument))
+        else:
+            matches = [argument]
+        if not matches:
+            unmatched.append(argument)
+        for match in matches:
+            if match not in bus_files:
+                bus_files.append(match)
+    return bus_files, unmatched
+
+
+@dataclass
+class GenerateResult:
+    """Outcome of generating one bus file in a batch.
+
+    Attributes:
+        bus_file (str): The bus YAML file.
+        outputs (List[str]): The files updated.
+        messages (List[Tuple[int, str]]): Log records (level, message) emitted while generating.
+        ok (bool): Whether generation succeeded.
+    """
+    bus_file: str
+    outputs: List[str] = field(default_factory=list)
+    messages: List[Tuple[int, str]] = field(default_factory=list)
+    ok: bool = True
+
+
+class _RecordingHandler(logging.Handler):
+    """Logging handler that keeps the records of the current batch item."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[Tuple[int, str]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append((record.levelno, record.getMessage()))
+
+
+_batch_library: Optional[IPLibrary] = None
+_batch_log: Optional[_RecordingHandler] = None
+# Set by serve_command: batches then start their workers from a fork server rather than by forking
+# the multithreaded server, whose other threads may hold locks (logging, caches) at fork time.
+_serving: bool = False
+
+
+def _init_batch_worker(ip_library: IPLibrary, cache: CacheConfig) -> None:
+    """Initialises a batch worker process with the shared IP library and the parent's cache settings."""
+    global _batch_library, _batch_log
+    cache_config.directory, cache_config.ttl, cache_config.enabled = cache.directory, cache.ttl, cache.enabled
+    _batch_library = ip_library
+    _batch_log = _RecordingHandler()
+    logging.getLogger().handlers = [_batch_log]
+
+
+def generate_isolated(bus_yaml_file: str, ip_library: IPLibrary,
+                      bus_data: Optional[Dict[str, Any]] = None, template_dir: Optional[str] = None) -> GenerateResult:
+    """Generates one bus file, turning fatal errors into a failed result.
+
+    Args:
+        bus_yaml_file (str): Path to the bus YAML file.
+        ip_library (IPLibrary): The IP library.
+        bus_data (Optional[Dict[str, Any]]): The parsed bus YAML data; read from the file if None.
+        template_dir (Optional[str]): Directory of user templates.
+
+    Returns:
+        GenerateResult: The outcome.
+    """
+    result = GenerateResult(bus_file=bus_yaml_file)
+    try:
+        if bus_data is None:
+            bus_data = load_yaml_file(bus_yaml_file)
+        result.outputs = generate_bus_outputs(bus_yaml_file, bus_data, ip_library, template_dir)
+    except SystemExit:
+        result.ok = False
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        result.ok = False
+    return result
+
+
+def _generate_batch_item(bus_yaml_file: str, bus_data: Dict[str, Any],
+                         template_dir: Optional[str] = None) -> GenerateResult:
+    """Generates one bus file of a batch in a worker process."""
+    _batch_log.records = []
+    result = generate_isolated(bus_yaml_file, _batch_library, bus_data, template_dir)
+    result.messages = _batch_log.records
+    return result
+
+
+def generate_batch(bus_files: List[str], ip_library: IPLibrary, jobs: int,
+                   template_dir: Optional[str] = None) -> List[GenerateResult]:
+    """Generates many bus files against one IP library.
+
+    The bus files are read and their IP entries built in this process, then the generation
+    is spread over a process pool that inherits the library. A failing file does not stop
+    the others.
+
+    Args:
+        bus_files (List[str]): The bus YAML files.
+        ip_library (IPLibrary): The IP library, loaded once for all files.
+        jobs (int): Maximum number of worker processes.
+        template_dir (Optional[str]): Directory of user templates.
+
+    Returns:
+        List[GenerateResult]: One result per bus file, in input order.
+    """
+    results: List[Optional[GenerateResult]] = [None] * len(bus_files)
+    pending: List[Tuple[int, str, Dict[str, Any]]] = []
+    for position, bus_yaml_file in enumerate(bus_files):
         try:
-            num = int(addr, 0)
-            return hex(num)
-        except Exception:
-            return addr
-        
-def generate_c_header(generator: "BusGenerator", bus_yaml_file: str) -> str:
-    """Generates a C header file string with macros defining base addresses for each slave.
+            bus_data = load_yaml_file(bus_yaml_file)
+        except SystemExit:
+            results[position] = GenerateResult(bus_file=bus_yaml_file, ok=False)
+            continue
+        if not isinstance(bus_data, dict):
+            logging.error(f"Bus YAML file '{bus_yaml_file}' does not contain a mapping.")
+            results[position] = GenerateResult(bus_file=bus_yaml_file, ok=False)
+            continue
+        # Build the entries once here so that the workers inherit them instead of decoding each on their own.
+        for slave in bus_data.get("slaves") or []:
+            if isinstance(slave, dict) and isinstance(slave.get("type"), str):
+                ip_library.get(slave["type"])
+        pending.append((position, bus_yaml_file, bus_data))
+
+    if pending:
+        context = multiprocessing.get_context("forkserver") if _serving else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(jobs, len(pending))),
+                                                    mp_context=context, initializer=_init_batch_worker,
+                                                    initargs=(ip_library, cache_config)) as pool:
+            futures = [(position, pool.submit(_generate_batch_item, bus_yaml_file, bus_data, template_dir))
+                       for position, bus_yaml_file, bus_data in pending]
+            for position, future in futures:
+                try:
+                    results[position] = future.result()
+                except Exception as e:
+                    results[position] = GenerateResult(bus_file=bus_files[position], ok=False,
+                                                       messages=[(logging.ERROR, f"Worker failed: {e}")])
+    return [result for result in results if result is not None]
+
+
+def bus_slave_types(bus_files: List[str], bus_data: Optional[Dict[str, Any]] = None) -> Optional[Set[str]]:
+    """Returns the IP types instantiated by some bus files.
 
     Args:
-        generator (BusGenerator): The BusGenerator instance with processed slaves.
-        bus_yaml_file (str): The YAML file name used, for generating the header guard.
+        bus_files (List[str]): Paths to the bus YAML files.
+        bus_data (Optional[Dict[str, Any]]): The parsed data of the only bus file, if already loaded.
 
     Returns:
-        str: The C header file content.
+        Optional[Set[str]]: The types, or None if a file cannot be read; its error is reported
+        when it is generated.
     """
-    output_header_filename = bus_yaml_file
-    if output_header_filename.lower().endswith(".yaml"):
-        output_header_filename = output_header_filename[:-5] + ".h"
-    elif output_header_filename.lower().endswith(".yml"):
-        output_header_filename = output_header_filename[:-4] + ".h"
-    else:
-        output_header_filename += ".h"
-    header_guard = "__" + os.path.basename(output_header_filename).replace(".", "_").upper() + "__"
-    lines: List[str] = []
-    lines.append(f"#ifndef {header_guard}")
-    lines.append(f"#define {header_guard}")
-    lines.append("")
-    for slave in generator.processed_slaves:
-        macro_name = slave.name.upper() + "_BASE"
-        base_addr_c = convert_base_address_to_c_format(slave.base_address)
-        lines.append(f"#define {macro_name} {base_addr_c}")
-    lines.append("")
-    lines.append(f"#endif // {header_guard}")
-    return "\n".join(lines)
+    types: Set[str] = set()
+    try:
+        for bus_yaml_file in bus_files:
+            data = bus_data if bus_data is not None else load_yaml_file(bus_yaml_file)
+            types.update(str(slave["type"]) for slave in data.get("slaves") or [])
+    except Exception:
+        return None
+    return types
+
 
 def generate_command(args: argparse.Namespace) -> None:
     """Executes the generate command.
 
+    A single bus file is generated directly. Several bus files, directories or glob patterns
+    are generated as a batch against a library loaded once, with a per-file report.
+
     Args:
         args (argparse.Namespace): Command-line arguments.
     """
-    bus_yaml_file: str = args.bus
-    ip_library_source: str = args.ip_library if args.ip_library else DEFAULT_IPS_URL
-    try:
-        bus_data = load_yaml_file(bus_yaml_file)
-    except Exception as e:
-        logging.error(f"Failed to load bus YAML file: {e}")
+    bus_inputs = [args.bus] + [argument for argument in args.ip_library if is_bus_input(argument)]
+    args.ip_library = [argument for argument in args.ip_library if not is_bus_input(argument)]
+    if args.watch:
+        watch_generate(bus_inputs, args)
+        return
+    if len(bus_inputs) == 1 and not os.path.isdir(args.bus) and not glob.has_magic(args.bus):
+        bus_yaml_file: str = args.bus
+        try:
+            bus_data = load_yaml_file(bus_yaml_file)
+        except Exception as e:
+            logging.error(f"Failed to load bus YAML file: {e}")
+            sys.exit(1)
+        ip_library = load_ip_libraries(library_sources(args), streaming=args.stream, random_access=True,
+                                       only=bus_slave_types([bus_yaml_file], bus_data) if args.stream else None)
+        generate_bus_outputs(bus_yaml_file, bus_data, ip_library, args.template_dir)
+        return
+
+    bus_files, unmatched = expand_bus_inputs(bus_inputs)
+    for argument in unmatched:
+        logging.error(f"No bus YAML files match '{argument}'.")
+    if not bus_files:
         sys.exit(1)
-    has_pic: bool = bus_data.get("PIC", False)
-    ip_json = load_json_file(ip_library_source)
-    bus_slaves = parse_bus_slaves(bus_data)
-    ip_library = parse_ip_library(ip_json)
-    generator = BusGenerator(bus_slaves, ip_library, has_pic)
-    verilog_code = generator.generate_verilog(has_pic)
-    wrapper_code = generate_wrapper(verilog_code)
-    # Determine output file name by replacing .yaml/.yml with .v
-    output_filename = bus_yaml_file
-    if output_filename.lower().endswith(".yaml"):
-        output_filename = output_filename[:-5] + ".v"
-    elif output_filename.lower().endswith(".yml"):
-        output_filename = output_filename[:-4] + ".v"
-    else:
-        output_filename += ".v"
-    try:
-        with open(output_filename, "w") as out_f:
-            out_f.write(wrapper_code)
-        logging.info(f"Generated Verilog written to {output_filename}")
-    except Exception as e:
-        logging.error(f"Failed to write output file {output_filename}: {e}")
+    ip_library = load_ip_libraries(library_sources(args), streaming=args.stream, random_access=True,
+                                   only=bus_slave_types(bus_files) if args.stream else None)
+    started = time.monotonic()
+    results = generate_batch(bus_files, ip_library, args.jobs, args.template_dir)
+    ok = report_generate_results(results, time.monotonic() - started)
+    if not ok or unmatched:
         sys.exit(1)
 
-    header_code = generate_c_header(generator, bus_yaml_file)
-    output_header_filename = bus_yaml_file
-    if output_header_filename.lower().endswith(".yaml"):
-        output_header_filename = output_header_filename[:-5] + ".h"
-    elif output_header_filename.lower().endswith(".yml"):
-        output_header_filename = output_header_filename[:-4] + ".h"
-    else:
-        output_header_filename += ".h"
+
+def report_generate_results(results: List[GenerateResult], elapsed: float) -> bool:
+    """Prints the per-file outcome of a batch.
+
+    Args:
+        results (List[GenerateResult]): The batch results.
+        elapsed (float): Generation time in seconds.
+
+    Returns:
+        bool: True if every file was generated.
+    """
+    failed = [result for result in results if not result.ok]
+    for result in results:
+        for level, message in result.messages:
+            if level >= logging.WARNING:
+                logging.log(level, f"{result.bus_file}: {message}")
+        if result.ok:
+            print(f"OK      {result.bus_file} -> {', '.join(result.outputs) or 'up to date'}")
+        else:
+            print(f"FAILED  {result.bus_file}")
+    updated = sum(len(result.outputs) for result in results)
+    print(f"Generated {len(results) - len(failed)} of {len(results)} bus files in {elapsed:.2f}s; "
+          f"{updated} output file(s) updated.")
+    return not failed
+
+
+WATCH_POLL_INTERVAL: float = 0.1
+WATCH_SETTLE_TIME: float = 0.15
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """Returns the (mtime, size) stamp of a file, or None if it does not exist."""
     try:
-        with open(output_header_filename, "w") as header_f:
-            header_f.write(header_code)
-        logging.info(f"Generated C header written to {output_header_filename}")
-    except Exception as e:
-        logging.error(f"Failed to write header file {output_header_filename}: {e}")
-        sys.exit(1)
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _watch_stamps(paths: Iterable[str]) -> Dict[str, Optional[Tuple[int, int]]]:
+    return {path: _file_stamp(path) for path in paths}
+
+
+def watch_generate(bus_inputs: List[str], args: argparse.Namespace) -> None:
+    """Regenerates the outputs of the bus files whenever they or a local library change.
+
+    Files are polled for modification time and size changes. A burst of saves is coalesced
+    into one rebuild once the files have been quiet for WATCH_SETTLE_TIME. A changed bus file
+    regenerates only its own outputs; a changed library or user template regenerates all of
+    them. Directories and glob patterns are expanded again on every poll, so new files are
+    picked up. Errors are reported and watching continues.
+
+    Args:
+        bus_inputs (List[str]): Bus files, directories and glob patterns.
+        args (argparse.Namespace): Command-line arguments.
+    """
+    sources = library_sources(args)
+    library_files = [source for source in sources if "://" not in source and os.path.isfile(source)]
+    if args.template_dir and os.path.isdir(args.template_dir):
+        library_files += sorted(os.path.join(root, name) for root, _, names in os.walk(args.template_dir)
+                                for name in names if name.endswith(".tmpl"))
+    ip_library = load_ip_libraries(sources, streaming=args.stream, random_access=True)
+
+    def regenerate(bus_files: List[str]) -> None:
+        started = time.monotonic()
+        try:
+            if len(bus_files) > 1 and args.jobs > 1:
+                results = generate_batch(bus_files, ip_library, args.jobs, args.template_dir)
+            else:
+                results = [generate_isolated(bus_yaml_file, ip_library, template_dir=args.template_dir)
+                           for bus_yaml_file in bus_files]
+        except SystemExit:
+            logging.error("Regeneration failed; waiting for the next change.")
+            return
+        except Exception as e:
+            logging.error(f"Regeneration failed ({e}); waiting for the next change.")
+            return
+        report_generate_results(results, time.monotonic() - started)
+
+    bus_files, _ = expand_bus_inputs(bus_inputs)
+    bus_stamps = _watch_stamps(bus_files)
+    library_stamps = _watch_stamps(library_files)
+    regenerate(bus_files)
+    logging.info(f"Watching {len(bus_files)} bus file(s) and {len(library_files)} library file(s); press Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(WATCH_POLL_INTERVAL)
+            bus_files, _ = expand_bus_inputs(bus_inputs)
+            if _watch_stamps(bus_files) == bus_stamps and _watch_stamps(library_files) == library_stamps:
+                continue
+            # Wait until the files stop changing so that a burst of saves triggers a single rebuild.
+            while True:
+                current_bus, current_library = _watch_stamps(bus_files), _watch_stamps(library_files)
+                time.sleep(WATCH_SETTLE_TIME)
+                bus_files, _ = expand_bus_inputs(bus_inputs)
+                if _watch_stamps(bus_files) == current_bus and _watch_stamps(library_files) == current_library:
+                    break
+            reloaded = False
+            if current_library != library_stamps:
+                logging.info("IP library or templates changed; reloading.")
+                try:
+                    ip_library = load_ip_libraries(sources, streaming=args.stream, random_access=True)
+                    reloaded = True
+                except SystemExit:
+                    # The error has been logged; a half-written library must not end the watch.
+                    logging.error("Keeping the previously loaded IP library.")
+                except Exception as e:
+                    logging.error(f"Could not reload the IP library ({e}); keeping the previous one.")
+            if reloaded:
+                changed = [path for path in bus_files if current_bus[path] is not None]
+            else:
+                changed = [path for path in bus_files
+                           if current_bus[path] is not None and current_bus[path] != bus_stamps.get(path)]
+            bus_stamps, library_stamps = current_bus, current_library
+            if changed:
+                regenerate(changed)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching.")
 
 
 def list_command(args: argparse.Namespace) -> None:
@@ -632,11 +4093,9 @@ def list_command(args: argparse.Namespace) -> None:
     Args:
         args (argparse.Namespace): Command-line arguments.
     """
-    ip_library_source: str = args.ip_library if args.ip_library else DEFAULT_IPS_URL
-    ip_json = load_json_file(ip_library_source)
-    ip_library = parse_ip_library(ip_json)
+    ip_library = load_ip_libraries(library_sources(args), streaming=args.stream)
     logging.info("Available slave types in the IP library:")
-    for ip_name in ip_library.ip_dict.keys():
+    for ip_name in ip_library.names():
         print(f"  - {ip_name}")
 
 
@@ -647,10 +4106,9 @@ def info_command(args: argparse.Namespace) -> None:
         args (argparse.Namespace): Command-line arguments.
     """
     slave_type: str = args.slave_type
-    ip_library_source: str = args.ip_library if args.ip_library else DEFAULT_IPS_URL
-    ip_json = load_json_file(ip_library_source)
-    ip_library = parse_ip_library(ip_json)
-    entry = ip_library.ip_dict.get(slave_type)
+    ip_library = load_ip_libraries(library_sources(args), streaming=args.stream, random_access=True,
+                                   only={slave_type} if args.stream else None)
+    entry = ip_library.get(slave_type)
     if entry is None:
         logging.error(f"Slave type '{slave_type}' not found in the IP library.")
         sys.exit(1)
@@ -676,6 +4134,99 @@ def info_command(args: argparse.Namespace) -> None:
         print(f"  Description: {info.description}")
 
 
+def query_command(args: argparse.Namespace) -> None:
+    """Executes the query command.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+    """
+    ip_library = load_ip_libraries(library_sources(args), streaming=args.stream)
+    matches = ip_library.catalogue.query(bus=args.bus, category=args.category, tags=args.tag,
+                                         interrupts=args.irq, fifos=args.fifo,
+                                         min_cells=args.min_cells, max_cells=args.max_cells)
+    logging.info(f"{len(matches)} matching slave type(s):")
+    for summary in matches:
+        cells = summary.wb_cell_count if summary.wb_cell_count is not None else "N/A"
+        print(f"  - {summary.name} (cells: {cells}, bus: {', '.join(summary.bus) or 'N/A'}, "
+              f"interrupts: {'Yes' if summary.interrupts else 'No'}, FIFOs: {'Yes' if summary.fifos else 'No'})")
+
+
+def search_command(args: argparse.Namespace) -> None:
+    """Executes the search command.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+    """
+    ip_library = load_ip_libraries(library_sources(args), streaming=args.stream)
+    results = load_search_index(ip_library).search(args.text, args.limit)
+    if not results:
+        logging.info(f"No slave types match '{args.text}'.")
+        return
+    logging.info(f"Slave types matching '{args.text}':")
+    for rank, (name, score) in enumerate(results, start=1):
+        description = (ip_library.raw_entry(name) or {}).get("info", {}).get("description", "")
+        first_line = str(description).strip().split("\n", 1)[0]
+        if len(first_line) > 72:
+            first_line = first_line[:69] + "..."
+        print(f"  {rank}. {name} (score {score:.2f}): {first_line}")
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def cache_command(args: argparse.Namespace) -> None:
+    """Executes the cache command.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+    """
+    libraries_dir = os.path.join(cache_config.directory, "libraries")
+    snapshots_dir = os.path.join(cache_config.directory, "snapshots")
+    if args.action == "purge":
+        # Only the subdirectories the tool creates are removed, so a cache directory shared
+        # with other files (e.g. --cache-dir .) keeps them.
+        subdirectories = ["snapshots"] if args.snapshots else CACHE_SUBDIRECTORIES
+        for subdirectory in subdirectories:
+            target = os.path.join(cache_config.directory, subdirectory)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+        if not args.snapshots:
+            try:
+                os.rmdir(cache_config.directory)
+            except OSError:
+                pass
+        logging.info(f"Purged {'library snapshots' if args.snapshots else 'cache'} in {cache_config.directory}")
+        return
+
+    print(f"Cache directory: {cache_config.directory}")
+    print(f"  TTL: {cache_config.ttl} s{'' if cache_config.enabled else ' (disabled)'}")
+    meta_files = sorted(f for f in os.listdir(libraries_dir) if f.endswith(".meta.json")) \
+        if os.path.isdir(libraries_dir) else []
+    print(f"  Cached libraries: {len(meta_files)}")
+    now = time.time()
+    for meta_file in meta_files:
+        meta = _read_cache_meta(os.path.join(libraries_dir, meta_file))
+        data_file = os.path.join(libraries_dir, meta_file[:-len(".meta.json")] + ".json")
+        age = int(now - meta.get("fetched_at", 0))
+        state = "fresh" if age < cache_config.ttl else "stale"
+        print(f"    - {meta.get('url', '?')} ({_file_size(data_file)} bytes, checked {age} s ago, {state})")
+    snapshots = sorted(f for f in os.listdir(snapshots_dir) if f.endswith(".pickle")) \
+        if os.path.isdir(snapshots_dir) else []
+    print(f"  Library snapshots: {len(snapshots)}")
+    for snapshot in snapshots:
+        print(f"    - {snapshot[:-len('.pickle')]} ({_file_size(os.path.join(snapshots_dir, snapshot))} bytes)")
+    search_dir = os.path.join(cache_config.directory, "search")
+    search_indexes = sorted(os.listdir(search_dir)) if os.path.isdir(search_dir) else []
+    print(f"  Search indexes: {len(search_indexes)}")
+    generated_dir = os.path.join(cache_config.directory, "generated")
+    generated = [name for _, _, names in os.walk(generated_dir) for name in names if name.endswith(".v")]
+    print(f"  Generated outputs: {len(generated)}")
+
+
 def help_command(parser: argparse.ArgumentParser) -> None:
     """Executes the help command.
 
@@ -686,43 +4237,296 @@ def help_command(parser: argparse.ArgumentParser) -> None:
     sys.exit(0)
 
 
-def main() -> None:
+class _ThreadLocalStream(io.TextIOBase):
+    """Text stream that writes to a per-thread buffer while one is set, and to a fallback stream otherwise.
+
+    The resident server installs it as sys.stdout/sys.stderr so that the
+    output of concurrently served commands is returned to the right client.
+    """
+
+    def __init__(self, fallback: Any) -> None:
+        self._fallback = fallback
+        self._local = threading.local()
+
+    def capture(self) -> io.StringIO:
+        """Starts capturing the current thread's output and returns the buffer."""
+        self._local.buffer = io.StringIO()
+        return self._local.buffer
+
+    def release(self) -> None:
+        """Stops capturing the current thread's output."""
+        self._local.buffer = None
+
+    def _target(self) -> Any:
+        return getattr(self._local, "buffer", None) or self._fallback
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+
+def _resolve_client_paths(args: argparse.Namespace, cwd: str) -> None:
+    """Makes the file arguments of a forwarded command relative to the client's working directory."""
+    def resolve(path: str) -> str:
+        if "://" in path or os.path.isabs(path):
+            return path
+        return os.path.join(cwd, path)
+
+    if getattr(args, "bus", None):
+        args.bus = resolve(args.bus)
+    if getattr(args, "template_dir", None):
+        args.template_dir = resolve(args.template_dir)
+    if getattr(args, "ip_library", None):
+        args.ip_library = [source if source == "default" and not os.path.exists(os.path.join(cwd, source))
+                           else resolve(source) for source in args.ip_library]
+
+
+def run_forwarded_command(argv: List[str], cwd: str) -> Dict[str, Any]:
+    """Runs a command forwarded by a client inside the resident server.
+
+    Cache options in the forwarded arguments are ignored; the server's own
+    settings apply to every client.
+
+    Args:
+        argv (List[str]): The client's command-line arguments.
+        cwd (str): The client's working directory.
+
+    Returns:
+        Dict[str, Any]: The captured 'stdout' and 'stderr' and the 'exit_code'.
+    """
+    stdout = sys.stdout.capture() if isinstance(sys.stdout, _ThreadLocalStream) else io.StringIO()
+    stderr = sys.stderr.capture() if isinstance(sys.stderr, _ThreadLocalStream) else io.StringIO()
+    exit_code = 0
+    try:
+        parser = build_parser()
+        args = parser.parse_args(argv)
+        if args.command == "serve":
+            logging.error("The 'serve' command cannot be forwarded to a server.")
+            sys.exit(2)
+        _resolve_client_paths(args, cwd)
+        run_command(args, parser)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        exit_code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            if isinstance(stream, _ThreadLocalStream):
+                stream.release()
+    return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "exit_code": exit_code}
+
+
+class _CLIRequestHandler(socketserver.StreamRequestHandler):
+    """Serves one forwarded command: a JSON request line in, a JSON response line out."""
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            response = run_forwarded_command(list(request["argv"]), str(request.get("cwd", "/")))
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"stdout": "", "stderr": f"ERROR: Invalid request: {e}\n", "exit_code": 2}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _CLIServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def default_socket_path() -> str:
+    """Returns the default Unix socket path of the resident server."""
+    return os.environ.get("CUPRJ_SOCKET", os.path.join(cache_config.directory, "server.sock"))
+
+
+def serve_command(args: argparse.Namespace) -> None:
+    """Executes the serve command.
+
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+    """
+    global _library_memo, _serving
+    socket_path = args.socket or default_socket_path()
+    if os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            logging.error(f"A server is already listening on {socket_path}.")
+            sys.exit(1)
+        except OSError:
+            os.unlink(socket_path)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    _library_memo = {}
+    _serving = True
+    sys.stdout = _ThreadLocalStream(sys.stdout)
+    sys.stderr = _ThreadLocalStream(sys.stderr)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sys.stderr)
+    server = _CLIServer(socket_path, _CLIRequestHandler)
+    os.chmod(socket_path, 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info(f"Serving on {socket_path} (Ctrl-C or SIGTERM to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def forward_to_server(socket_path: str, argv: List[str]) -> int:
+    """Runs a command in the resident server and relays its output.
+
+    Falls back to running the command locally if the server cannot be reached.
+
+    Args:
+        socket_path (str): Unix socket of the server.
+        argv (List[str]): Command-line arguments to forward.
+
+    Returns:
+        int: The command's exit code.
+    """
+    try:
+        response = _request_server(socket_path, argv)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not use server at {socket_path} ({e}); running locally.")
+        parser = build_parser()
+        try:
+            run_command(parser.parse_args(argv), parser)
+        except SystemExit as exit_e:
+            return exit_e.code if isinstance(exit_e.code, int) else (0 if exit_e.code is None else 1)
+        return 0
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exit_code"]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command-line parser.
+
+    Returns:
+        argparse.ArgumentParser: The top-level parser.
+    """
     parser = argparse.ArgumentParser(
         description="CLI for generating Wishbone bus Verilog code and querying the slave library.",
         add_help=False
     )
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help=f"Directory for cached remote IP libraries (default: $CUPRJ_CACHE_DIR or {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--cache-ttl", type=int, default=None,
+                        help="Seconds a cached library is used before revalidating it "
+                             f"(default: $CUPRJ_CACHE_TTL or {DEFAULT_CACHE_TTL}).")
+    parser.add_argument("--no-cache", action="store_true", help="Always download remote IP libraries.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse IP libraries incrementally, keeping only the fields the CLI uses.")
+    parser.add_argument("--server", type=str, default=os.environ.get("CUPRJ_SERVER"),
+                        help="Forward the command to a resident server listening on this Unix socket "
+                             "(default: $CUPRJ_SERVER).")
     subparsers = parser.add_subparsers(dest="command", required=True, help="Sub-commands")
     gen_parser = subparsers.add_parser("generate", add_help=False,
                                          help="Generate Verilog code from bus YAML and IP library.\n"
-                                              "Arguments:\n  bus: Path to bus YAML file listing attached slaves.\n"
-                                              "  ip_library: (Optional) Path or URL for IP library JSON (default: GitHub URL).")
-    gen_parser.add_argument("bus", type=str, help="Path to bus YAML file listing attached slaves.")
-    gen_parser.add_argument("ip_library", nargs="?", type=str, default=DEFAULT_IPS_URL,
-                            help="Path or URL for IP library JSON (default: GitHub URL).")
+                                              "Arguments:\n  bus: Path to bus YAML file listing attached slaves; more YAML files, directories or globs make a batch.\n"
+                                              "  ip_library: (Optional) Paths or URLs for IP library JSON files, lowest precedence first (default: GitHub URL).\n"
+                                              "  -j, --jobs: Worker processes for a batch (default: number of CPUs).\n"
+                                              "  --watch: Regenerate whenever a bus file or local IP library changes.\n"
+                                              "  --template-dir: Directory of user templates overriding the built-in ones.")
+    gen_parser.add_argument("bus", type=str,
+                            help="Path to bus YAML file listing attached slaves. Further YAML files, "
+                                 "directories or glob patterns may follow to generate a batch.")
+    gen_parser.add_argument("ip_library", nargs="*", type=str, default=[],
+                            help=IP_LIBRARY_ARG_HELP)
+    gen_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes for a batch of bus files (default: number of CPUs).")
+    gen_parser.add_argument("--watch", action="store_true",
+                            help="Keep running and regenerate whenever a bus file or local IP library changes.")
+    gen_parser.add_argument("--template-dir", type=str, default=None,
+                            help="Directory of user templates (wb_bus.v.tmpl, user_project_wrapper.v.tmpl) "
+                                 "overriding the built-in ones.")
     list_parser = subparsers.add_parser("list", add_help=False,
                                           help="List all slave types in the IP library.\n"
-                                               "Arguments:\n  ip_library: (Optional) Path or URL for IP library JSON (default: GitHub URL).")
-    list_parser.add_argument("ip_library", nargs="?", type=str, default=DEFAULT_IPS_URL,
-                             help="Path or URL for IP library JSON (default: GitHub URL).")
+                                               "Arguments:\n  ip_library: (Optional) Paths or URLs for IP library JSON files, lowest precedence first (default: GitHub URL).")
+    list_parser.add_argument("ip_library", nargs="*", type=str, default=[],
+                             help=IP_LIBRARY_ARG_HELP)
     info_parser = subparsers.add_parser("info", add_help=False,
                                           help="Show basic info about a slave type from the IP library.\n"
                                                "Arguments:\n  slave_type: The slave type (IP name) to display info for.\n"
-                                               "  ip_library: (Optional) Path or URL for IP library JSON (default: GitHub URL).\n"
+                                               "  ip_library: (Optional) Paths or URLs for IP library JSON files, lowest precedence first (default: GitHub URL).\n"
                                                "  --full: Show full description.")
     info_parser.add_argument("slave_type", type=str, help="The slave type (IP name) to display info for.")
-    info_parser.add_argument("ip_library", nargs="?", type=str, default=DEFAULT_IPS_URL,
-                             help="Path or URL for IP library JSON (default: GitHub URL).")
+    info_parser.add_argument("ip_library", nargs="*", type=str, default=[],
+                             help=IP_LIBRARY_ARG_HELP)
     info_parser.add_argument("--full", action="store_true", help="Show full description.")
+    query_parser = subparsers.add_parser("query", add_help=False,
+                                         help="List the slave types matching all given criteria.\n"
+                                              "Arguments:\n  ip_library: (Optional) Paths or URLs for IP library JSON files, lowest precedence first (default: GitHub URL).\n"
+                                              "  --bus, --category, --tag, --irq/--no-irq, --fifo/--no-fifo, --min-cells, --max-cells.")
+    query_parser.add_argument("ip_library", nargs="*", type=str, default=[],
+                              help=IP_LIBRARY_ARG_HELP)
+    query_parser.add_argument("--bus", type=str, help="Supported bus (e.g. WB); 'generic' IPs support every bus.")
+    query_parser.add_argument("--category", type=str, help="IP category (e.g. digital).")
+    query_parser.add_argument("--tag", action="append", default=[], help="Required tag; may be repeated.")
+    query_parser.add_argument("--irq", action=argparse.BooleanOptionalAction, default=None,
+                              help="Only IPs with (or without) interrupt support.")
+    query_parser.add_argument("--fifo", action=argparse.BooleanOptionalAction, default=None,
+                              help="Only IPs with (or without) FIFOs.")
+    query_parser.add_argument("--min-cells", type=int, help="Minimum WB cell count.")
+    query_parser.add_argument("--max-cells", type=int, help="Maximum WB cell count.")
+    search_parser = subparsers.add_parser("search", add_help=False,
+                                          help="Full-text search over slave descriptions, tags, registers and flags.\n"
+                                               "Arguments:\n  text: Search terms.\n"
+                                               "  ip_library: (Optional) Paths or URLs for IP library JSON files, lowest precedence first (default: GitHub URL).\n"
+                                               "  --limit: Maximum number of results (default: 10).")
+    search_parser.add_argument("text", type=str, help="Search terms.")
+    search_parser.add_argument("ip_library", nargs="*", type=str, default=[],
+                               help=IP_LIBRARY_ARG_HELP)
+    search_parser.add_argument("--limit", type=int, default=10, help="Maximum number of results (default: 10).")
+    cache_parser = subparsers.add_parser("cache", add_help=False,
+                                         help="Inspect or purge the IP library cache.\n"
+                                              "Arguments:\n  action: 'info' (default) or 'purge'.\n"
+                                              "  --snapshots: With 'purge', remove only parsed library snapshots.")
+    cache_parser.add_argument("action", nargs="?", choices=["info", "purge"], default="info",
+                              help="'info' lists cached libraries and snapshots, 'purge' deletes them.")
+    cache_parser.add_argument("--snapshots", action="store_true",
+                              help="With 'purge', remove only parsed library snapshots.")
     help_parser = subparsers.add_parser("help", add_help=False,
                                         help="Show this help message and exit.\nNo additional arguments are required.")
-    args = parser.parse_args()
+    serve_parser = subparsers.add_parser("serve", add_help=False,
+                                         help="Run a resident server that keeps parsed IP libraries in memory.\n"
+                                              "Arguments:\n  --socket: Unix socket path (default: $CUPRJ_SOCKET or <cache dir>/server.sock).\n"
+                                              "Clients forward commands to it with --server <socket>.")
+    serve_parser.add_argument("--socket", type=str, default=None,
+                              help="Unix socket path (default: $CUPRJ_SOCKET or <cache dir>/server.sock).")
+    return parser
+
+
+def run_command(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """Runs the command selected on the command line.
 
+    Args:
+        args (argparse.Namespace): Command-line arguments.
+        parser (argparse.ArgumentParser): The top-level argument parser.
+    """
     if args.command == "generate":
         generate_command(args)
     elif args.command == "list":
         list_command(args)
     elif args.command == "info":
         info_command(args)
+    elif args.command == "query":
+        query_command(args)
+    elif args.command == "search":
+        search_command(args)
+    elif args.command == "cache":
+        cache_command(args)
+    elif args.command == "serve":
+        serve_command(args)
     elif args.command == "help":
         help_command(parser)
     else:
@@ -731,5 +4535,20 @@ def main() -> None:
         sys.exit(1)
 
 
+def main() -> None:
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.cache_dir:
+        cache_config.directory = args.cache_dir
+    if args.cache_ttl is not None:
+        cache_config.ttl = args.cache_ttl
+    if args.no_cache:
+        cache_config.enabled = False
+    # A watch never finishes, so it always runs in this process with its own resident library.
+    if args.server and args.command != "serve" and not getattr(args, "watch", False):
+        sys.exit(forward_to_server(args.server, _strip_option(sys.argv[1:], "--server")))
+    run_command(args, parser)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,231 @@
+"""Tests for the generation cache key and for rejecting stale or corrupt cache files."""
+import copy
+import http.server
+import importlib.util
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+EXAMPLES = os.path.join(ROOT, "examples")
+
+# The script is not a package module; load it once under an importable name so pickles resolve.
+if "cuprj_cli" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("cuprj_cli", os.path.join(ROOT, "cuprj-cli.py"))
+    sys.modules["cuprj_cli"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["cuprj_cli"])
+cuprj_cli = sys.modules["cuprj_cli"]
+
+with open(os.path.join(ROOT, "ip-lib.json"), encoding="utf-8") as f:
+    LIBRARY_DATA = json.load(f)
+with open(os.path.join(EXAMPLES, "esw.yaml"), encoding="utf-8") as f:
+    BUS_DATA = yaml.safe_load(f)
+
+
+def library(changes=None):
+    """Parses a copy of ip-lib.json with some entries' descriptions changed."""
+    data = copy.deepcopy(LIBRARY_DATA)
+    for entry in data["slaves"]:
+        if entry["info"]["name"] in (changes or {}):
+            entry["info"]["description"] = changes[entry["info"]["name"]]
+    return cuprj_cli.parse_ip_library(data)
+
+
+class CacheTestCase(unittest.TestCase):
+    """Points the cache at a fresh temporary directory."""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.saved_cache = (cuprj_cli.cache_config.directory, cuprj_cli.cache_config.ttl,
+                            cuprj_cli.cache_config.enabled)
+        cuprj_cli.cache_config.directory = os.path.join(self.workdir.name, "cache")
+        cuprj_cli.cache_config.ttl = 3600
+        cuprj_cli.cache_config.enabled = True
+
+    def tearDown(self):
+        (cuprj_cli.cache_config.directory, cuprj_cli.cache_config.ttl,
+         cuprj_cli.cache_config.enabled) = self.saved_cache
+        self.workdir.cleanup()
+
+
+class GenerationCacheKeyTest(CacheTestCase):
+
+    def key(self, bus_data=BUS_DATA, ip_library=None, template_dir=None):
+        return cuprj_cli.generation_cache_key("esw.yaml", bus_data, ip_library or library(), template_dir)
+
+    def test_key_is_stable(self):
+        self.assertIsNotNone(self.key())
+        self.assertEqual(self.key(), self.key())
+
+    def test_used_library_entry_changes_key(self):
+        self.assertNotEqual(self.key(ip_library=library({"EF_TMR32": "changed"})), self.key())
+
+    def test_unused_library_entry_keeps_key(self):
+        used = {slave["type"] for slave in BUS_DATA["slaves"]}
+        unused = next(entry["info"]["name"] for entry in LIBRARY_DATA["slaves"] if entry["info"]["name"] not in used)
+        self.assertEqual(self.key(ip_library=library({unused: "changed"})), self.key())
+
+    def test_pic_flag_changes_key(self):
+        bus_data = dict(BUS_DATA, PIC=not BUS_DATA.get("PIC", False))
+        self.assertNotEqual(self.key(bus_data=bus_data), self.key())
+
+    def test_template_directory_changes_key(self):
+        template_dir = os.path.join(self.workdir.name, "templates")
+        os.makedirs(template_dir)
+        template = os.path.join(template_dir, "wb_bus.v.tmpl")
+        with open(template, "w") as f:
+            f.write("// one\n")
+        first = self.key(template_dir=template_dir)
+        self.assertNotEqual(first, self.key())
+        with open(template, "w") as f:
+            f.write("// two\n")
+        self.assertNotEqual(self.key(template_dir=template_dir), first)
+
+    def test_tool_version_changes_key(self):
+        key = self.key()
+        saved = cuprj_cli._tool_fingerprint_value
+        cuprj_cli._tool_fingerprint_value = "0" * 64
+        try:
+            self.assertNotEqual(self.key(), key)
+        finally:
+            cuprj_cli._tool_fingerprint_value = saved
+
+    def test_unknown_type_is_not_cached(self):
+        bus_data = dict(BUS_DATA, slaves=BUS_DATA["slaves"] + [{"name": "X", "type": "NO_SUCH_IP"}])
+        self.assertIsNone(self.key(bus_data=bus_data))
+
+
+class SnapshotTest(CacheTestCase):
+
+    def test_round_trip(self):
+        cuprj_cli._store_snapshot("abc", library())
+        self.assertIsInstance(cuprj_cli._load_snapshot("abc"), cuprj_cli.IPLibrary)
+
+    def test_corrupt_snapshot_is_ignored(self):
+        cuprj_cli._store_snapshot("abc", library())
+        with open(cuprj_cli._snapshot_path("abc"), "r+b") as f:
+            f.truncate(100)
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(cuprj_cli._load_snapshot("abc"))
+
+    def test_snapshot_of_other_version_or_type_is_ignored(self):
+        os.makedirs(os.path.dirname(cuprj_cli._snapshot_path("abc")))
+        for content in ((cuprj_cli.SNAPSHOT_VERSION + 1, library()), (cuprj_cli.SNAPSHOT_VERSION, {"slaves": []})):
+            with open(cuprj_cli._snapshot_path("abc"), "wb") as f:
+                pickle.dump(content, f)
+            self.assertIsNone(cuprj_cli._load_snapshot("abc"))
+
+
+class GeneratedOutputsTest(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bus_file = os.path.join(self.workdir.name, "esw.yaml")
+        shutil.copy(os.path.join(EXAMPLES, "esw.yaml"), self.bus_file)
+        self.ip_library = library()
+        self.key = cuprj_cli.generation_cache_key(self.bus_file, BUS_DATA, self.ip_library)
+
+    def generate(self):
+        with self.assertLogs(level="INFO") as logs:
+            cuprj_cli.generate_bus_outputs(self.bus_file, BUS_DATA, self.ip_library)
+        with open(os.path.join(self.workdir.name, "esw.v"), encoding="utf-8") as f:
+            verilog = f.read()
+        with open(os.path.join(EXAMPLES, "esw.v"), encoding="utf-8") as f:
+            self.assertEqual(verilog, f.read())
+        return any("Using cached outputs" in line for line in logs.output)
+
+    def test_repeated_key_uses_stored_outputs(self):
+        self.assertFalse(self.generate())
+        self.assertIsNotNone(cuprj_cli._load_generated(self.key))
+        os.remove(os.path.join(self.workdir.name, "esw.v"))
+        self.assertTrue(self.generate())
+
+    def test_corrupt_output_is_regenerated(self):
+        self.generate()
+        verilog_path = cuprj_cli._generated_paths(self.key)[0]
+        with open(verilog_path, "r+b") as f:
+            f.truncate(os.path.getsize(verilog_path) // 2)
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(cuprj_cli._load_generated(self.key))
+        self.assertFalse(self.generate())
+        self.assertIsNotNone(cuprj_cli._load_generated(self.key))
+
+    def test_entry_without_manifest_is_ignored(self):
+        self.generate()
+        os.remove(cuprj_cli._generated_paths(self.key)[2])
+        self.assertIsNone(cuprj_cli._load_generated(self.key))
+        self.assertFalse(self.generate())
+
+
+class LibraryMetaTest(CacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.requests = []
+        content_dir = os.path.join(self.workdir.name, "www")
+        os.makedirs(content_dir)
+        with open(os.path.join(content_dir, "lib.json"), "w") as f:
+            f.write('{"slaves": []}')
+        test = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=content_dir, **kwargs)
+
+            def send_head(self):
+                test.requests.append(self.headers.get("If-Modified-Since"))
+                return super().send_head()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/lib.json"
+        self.meta_path = cuprj_cli._library_cache_paths(self.url)[1]
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        super().tearDown()
+
+    def fetch(self):
+        with open(cuprj_cli.fetch_remote_file(self.url), encoding="utf-8") as f:
+            self.assertEqual(f.read(), '{"slaves": []}')
+
+    def test_fresh_meta_needs_no_request(self):
+        self.fetch()
+        self.fetch()
+        self.assertEqual(len(self.requests), 1)
+
+    def test_stale_meta_is_revalidated(self):
+        self.fetch()
+        meta = cuprj_cli._read_cache_meta(self.meta_path)
+        meta["fetched_at"] = time.time() - 2 * cuprj_cli.cache_config.ttl
+        cuprj_cli._write_cache_meta(self.meta_path, meta)
+        self.fetch()
+        self.assertEqual(len(self.requests), 2)
+        self.assertIsNotNone(self.requests[1])
+
+    def test_corrupt_meta_is_refetched(self):
+        for content in ("{not json", "[]", '{"fetched_at": "yesterday"}'):
+            with self.subTest(content=content):
+                self.requests.clear()
+                self.fetch()
+                with open(self.meta_path, "w") as f:
+                    f.write(content)
+                self.assertEqual(cuprj_cli._read_cache_meta(self.meta_path), {})
+                self.fetch()
+                self.assertEqual(self.requests[-1], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
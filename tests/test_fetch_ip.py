@@ -0,0 +1,136 @@
+"""Tests for utils/fetch-ip.py against a local stand-in for raw.githubusercontent.com."""
+import http.server
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import yaml
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils", "fetch-ip.py")
+REQUEST_DELAY = 0.2
+PER_HOST = 4
+
+
+def ip_yaml(name, version="1.0"):
+    return yaml.safe_dump({"info": {"name": name, "description": f"{name} v{version}", "bus": ["WB"],
+                                    "cell_count": [{"WB": 100}]}})
+
+
+class StandInServer:
+    """Serves '/<owner>/<repo>/<branch>/<repo>.yaml' with ETags, a fixed delay and request accounting."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append((self.path, self.headers.get("If-None-Match")))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(REQUEST_DELAY)
+                    content = server.files.get(self.path)
+                    if content is None:
+                        self._reply(404, b"")
+                        return
+                    etag = '"%d"' % hash(content)
+                    if self.headers.get("If-None-Match") == etag:
+                        self._reply(304, b"", etag)
+                    else:
+                        self._reply(200, content.encode(), etag)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _reply(self, status, body, etag=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = []
+            self.max_in_flight = 0
+
+
+class FetchIPTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.repos = [f"IP{i}" for i in range(12)]
+        with open(os.path.join(self.workdir.name, "ip-list.txt"), "w") as f:
+            f.write("".join(f"github.com/acme/{repo}\n" for repo in self.repos))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def run_fetch(self, server):
+        subprocess.run([sys.executable, SCRIPT, "ip-list.txt", "--base-url", server.base_url,
+                        "--jobs", "8", "--per-host", str(PER_HOST), "--retries", "0"],
+                       cwd=self.workdir.name, check=True, capture_output=True, text=True)
+        with open(os.path.join(self.workdir.name, "aggregated_slaves.json"), encoding="utf-8") as f:
+            return f.read()
+
+    def publish(self, server, versions):
+        for position, repo in enumerate(self.repos):
+            # Every third repository only has a 'master' branch.
+            branch = "master" if position % 3 == 0 else "main"
+            server.files[f"/acme/{repo}/{branch}/{repo}.yaml"] = ip_yaml(repo, versions.get(repo, "1.0"))
+
+    def test_parallel_fetch_and_incremental_refresh(self):
+        with StandInServer() as server:
+            self.publish(server, {})
+            text = self.run_fetch(server)
+
+            # Deterministic output: input order, byte-for-byte what json.dump(indent=4) writes.
+            expected = {"slaves": [yaml.safe_load(ip_yaml(repo)) for repo in self.repos]}
+            self.assertEqual(text, json.dumps(expected, indent=4))
+            # 12 repositories + 4 'main' misses, fetched concurrently but within the per-host limit.
+            self.assertEqual(len(server.requests), len(self.repos) + len(self.repos) // 3)
+            self.assertGreater(server.max_in_flight, 1)
+            self.assertLessEqual(server.max_in_flight, PER_HOST)
+
+            # Second run: one conditional request per repository, straight to the known branch.
+            server.reset_counters()
+            self.publish(server, {"IP5": "2.0"})
+            refreshed = self.run_fetch(server)
+            self.assertEqual(len(server.requests), len(self.repos))
+            self.assertTrue(all(etag for _, etag in server.requests))
+            self.assertFalse(any(path.startswith("/acme/IP0/main/") for path, _ in server.requests))
+            expected["slaves"][5] = yaml.safe_load(ip_yaml("IP5", "2.0"))
+            self.assertEqual(refreshed, json.dumps(expected, indent=4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Tests for the Verilog template engine and the RTL rendered from the built-in templates."""
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "cuprj-cli.py")
+EXAMPLES = os.path.join(ROOT, "examples")
+
+# The script is not a package module; load it once under an importable name so pickles resolve.
+if "cuprj_cli" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("cuprj_cli", SCRIPT)
+    sys.modules["cuprj_cli"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["cuprj_cli"])
+cuprj_cli = sys.modules["cuprj_cli"]
+
+
+class Design:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def render(source, design=None):
+    return "".join(cuprj_cli.compile_template(source, "test.tmpl")(design))
+
+
+class TemplateSyntaxTest(unittest.TestCase):
+
+    def test_expressions(self):
+        self.assertEqual(render("wire [{{ design.width - 1 }}:0] {{ design.name }};", Design(width=32, name="dat")),
+                         "wire [31:0] dat;")
+        self.assertEqual(render("{{ '%d' % 5 }}"), "5")
+
+    def test_percent_signs_in_text_are_literal(self):
+        self.assertEqual(render("100% {{ 1 }} %s %%"), "100% 1 %s %%")
+
+    def test_for_if_elif_else(self):
+        source = ("{% for n in design %}"
+                  "{% if n == 0 %}zero{% elif n == 1 %}one{% else %}{{ n }}{% endif %};"
+                  "{% endfor %}")
+        self.assertEqual(render(source, [0, 1, 2]), "zero;one;2;")
+
+    def test_set_and_comment(self):
+        self.assertEqual(render("{% set x = design * 2 %}{# not emitted #}{{ x }}", 21), "42")
+
+    def test_statement_alone_on_a_line_emits_nothing(self):
+        source = ("begin\n"
+                  "  {% for n in design %}  \n"
+                  "  {# comment #}\n"
+                  "  x{{ n }}\n"
+                  "  {% endfor %}\n"
+                  "end\n")
+        self.assertEqual(render(source, [1, 2]), "begin\n  x1\n  x2\nend\n")
+
+    def test_statement_sharing_a_line_keeps_the_line(self):
+        self.assertEqual(render("a {% if design %}b{% endif %}\nc\n", True), "a b\nc\n")
+        self.assertEqual(render("a {% if design %}b{% endif %}\nc\n", False), "a \nc\n")
+
+    def test_statement_on_the_last_line_without_newline(self):
+        self.assertEqual(render("x\n{% if design %}y{% endif %}", True), "x\ny")
+
+    def test_large_loops_are_streamed_in_chunks(self):
+        chunks = list(cuprj_cli.compile_template("{% for n in design %}{{ n }}\n{% endfor %}", "t")(
+            range(cuprj_cli.TEMPLATE_FLUSH_PIECES * 3)))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), "".join(f"{n}\n" for n in range(cuprj_cli.TEMPLATE_FLUSH_PIECES * 3)))
+
+
+class TemplateErrorTest(unittest.TestCase):
+
+    def assertTemplateError(self, source, message):
+        with self.assertRaises(cuprj_cli.TemplateError) as context:
+            cuprj_cli.compile_template(source, "bad.tmpl")
+        self.assertEqual(str(context.exception), message)
+
+    def test_unclosed_block(self):
+        self.assertTemplateError("{% for x in y %}\nx\n", "bad.tmpl: unclosed 'for' block")
+
+    def test_mismatched_end(self):
+        self.assertTemplateError("a\n{% if x %}\n{% endfor %}\n", "bad.tmpl:3: unexpected 'endfor'")
+
+    def test_else_outside_if(self):
+        self.assertTemplateError("{% for x in y %}{% else %}{% endfor %}", "bad.tmpl:1: 'else' outside of an if block")
+
+    def test_unknown_statement(self):
+        self.assertTemplateError("\n\n{% include 'x' %}", "bad.tmpl:3: unknown statement 'include'")
+
+    def test_invalid_expression_reports_its_line(self):
+        with self.assertRaises(cuprj_cli.TemplateError) as context:
+            cuprj_cli.compile_template("one\ntwo\n{{ design. }}\n", "bad.tmpl")
+        self.assertTrue(str(context.exception).startswith("bad.tmpl:3: invalid expression"), context.exception)
+
+    def test_render_error_names_the_template(self):
+        template = cuprj_cli.Template("{{ design.missing }}", "user/wb_bus.v.tmpl")
+        with self.assertRaises(cuprj_cli.TemplateError) as context:
+            "".join(template.render(Design()))
+        self.assertTrue(str(context.exception).startswith("user/wb_bus.v.tmpl: AttributeError"), context.exception)
+
+
+class GeneratedRTLTest(unittest.TestCase):
+    """Regenerates the examples and compares them with the committed RTL."""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def generate(self, design, *options):
+        shutil.copy(os.path.join(EXAMPLES, design + ".yaml"), self.workdir.name)
+        return subprocess.run([sys.executable, SCRIPT, "--no-cache", "generate", design + ".yaml",
+                               os.path.join(ROOT, "ip-lib.json"), *options],
+                              cwd=self.workdir.name, capture_output=True, text=True)
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_examples_match_committed_rtl(self):
+        for design in ("esw", "example1", "example2"):
+            with self.subTest(design=design):
+                result = self.generate(design)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                for extension in (".v", ".h"):
+                    self.assertEqual(self.read(os.path.join(self.workdir.name, design + extension)),
+                                     self.read(os.path.join(EXAMPLES, design + extension)))
+
+    def test_user_template_directory(self):
+        template_dir = os.path.join(self.workdir.name, "templates")
+        os.makedirs(template_dir)
+        with open(os.path.join(template_dir, "user_project_wrapper.v.tmpl"), "w") as f:
+            f.write("// custom wrapper for {{ len(design.slaves) }} slaves\n")
+        result = self.generate("esw", "--template-dir", template_dir)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        verilog = self.read(os.path.join(self.workdir.name, "esw.v"))
+        self.assertIn("module wb_bus", verilog)
+        self.assertIn("// custom wrapper for ", verilog)
+        self.assertNotIn("module user_project_wrapper", verilog)
+
+    def test_broken_user_template_fails_with_its_path(self):
+        template_dir = os.path.join(self.workdir.name, "templates")
+        os.makedirs(template_dir)
+        with open(os.path.join(template_dir, "wb_bus.v.tmpl"), "w") as f:
+            f.write("module wb_bus;\n{% if design.has_pic %}\nendmodule\n")
+        result = self.generate("esw", "--template-dir", template_dir)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(os.path.join(template_dir, "wb_bus.v.tmpl") + ": unclosed 'if' block", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
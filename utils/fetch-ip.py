@@ -1,8 +1,18 @@
 import argparse
 import requests
 import os
+import re
 import yaml
 import json
+import hashlib
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RAW_BASE_URL = "https://raw.githubusercontent.com"
+MANIFEST_VERSION = 1
 
 def parse_repo_url(url):
     """
@@ -20,36 +30,440 @@ def parse_repo_url(url):
         return parts[0], parts[1]
     return None, None
 
-def fetch_yaml_from_repo(owner, repo):
+def make_session(pool_size, retries):
+    """
+    Creates a requests session whose connections are kept alive and shared
+    by all worker threads. Connection errors and transient server errors
+    (429 and 5xx) are retried with exponential backoff; a 404 is an answer
+    (the branch does not exist) and is not retried.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class HostLimiter:
+    """
+    Caps the number of concurrent requests sent to each host.
+    """
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+def http_get(session, url, host_limiter=None, headers=None):
+    """
+    Sends a GET request, holding the host's concurrency slot while it runs.
+    """
+    if host_limiter is None:
+        return session.get(url, headers=headers, timeout=30)
+    with host_limiter(url):
+        return session.get(url, headers=headers, timeout=30)
+
+def fetch_yaml_from_repo(owner, repo, session=None, base_url=RAW_BASE_URL, host_limiter=None, log=print, known=None):
     """
     Attempts to fetch the YAML file named '<repo>.yaml' from the repository's root.
     It tries the 'main' branch first and then 'master' if needed.
-    Returns a tuple (filename, content) if successful, otherwise None.
+    If 'known' holds the URL and ETag from a previous run, that URL is tried
+    first with a conditional request.
+    Returns a tuple (filename, content, url, etag) if successful, otherwise None.
+    The content is None when the server reports the file as not modified.
     """
     filename = f"{repo}.yaml"
     branches = ["main", "master"]
+    session = session or requests
+
+    if known and known.get("url"):
+        raw_url = known["url"]
+        headers = {"If-None-Match": known["etag"]} if known.get("etag") else None
+        try:
+            response = http_get(session, raw_url, host_limiter, headers)
+            if response.status_code == 304:
+                log(f"Not modified: {raw_url}")
+                return filename, None, raw_url, known.get("etag")
+            if response.status_code == 200:
+                log(f"Found YAML file at: {raw_url}")
+                return filename, response.text, raw_url, response.headers.get("ETag")
+        except requests.RequestException as e:
+            log(f"Could not fetch {raw_url}: {e}")
     
     for branch in branches:
-        raw_url = f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{filename}"
-        response = requests.get(raw_url)
+        raw_url = f"{base_url}/{owner}/{repo}/{branch}/{filename}"
+        if known and raw_url == known.get("url"):
+            continue
+        try:
+            response = http_get(session, raw_url, host_limiter)
+        except requests.RequestException as e:
+            log(f"Could not fetch {raw_url}: {e}")
+            continue
         if response.status_code == 200:
-            print(f"Found YAML file at: {raw_url}")
-            return filename, response.text
+            log(f"Found YAML file at: {raw_url}")
+            return filename, response.text, raw_url, response.headers.get("ETag")
         else:
-            print(f"Could not find file at {raw_url} (HTTP {response.status_code}).")
-    print(f"YAML file {filename} not found in repository {owner}/{repo}.")
+            log(f"Could not find file at {raw_url} (HTTP {response.status_code}).")
+    log(f"YAML file {filename} not found in repository {owner}/{repo}.")
+    return None
+
+def serialize_entry(entry):
+    """
+    Serializes one library entry the way json.dump(..., indent=4) writes it
+    at the top level. Entries are stored in this form in the manifest and
+    spliced into the output unchanged.
+    """
+    return json.dumps(entry, indent=4, default=str)
+
+def process_repo(url, session, base_url, host_limiter, known=None):
+    """
+    Fetches and parses the YAML file of one repository.
+    'known' is the repository's record from the previous run's manifest, if any.
+    Returns a tuple (record or None, log_lines), where the record holds the
+    file's URL, ETag, content hash and serialized entry. If the file is not
+    modified, or its content hash is unchanged, the previous entry is carried
+    forward without parsing the YAML again. The log lines are printed by the
+    caller so the output of concurrent workers does not interleave.
+    """
+    lines = []
+    owner, repo = parse_repo_url(url)
+    if not owner or not repo:
+        lines.append(f"Could not parse repository information from URL: {url}")
+        return None, lines
+
+    lines.append(f"Processing repository: {owner}/{repo}")
+    result = fetch_yaml_from_repo(owner, repo, session, base_url, host_limiter, log=lines.append, known=known)
+    if not result:
+        return None, lines
+    file_name, content, raw_url, etag = result
+    if content is None:
+        lines.append(f"Unchanged: {owner}/{repo} ({file_name}).")
+        return dict(known, url=raw_url, etag=etag), lines
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    if known and known.get("sha256") == content_hash:
+        lines.append(f"Unchanged: {owner}/{repo} ({file_name}).")
+        return dict(known, url=raw_url, etag=etag), lines
+    try:
+        parsed_yaml = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        lines.append(f"Error parsing YAML from {owner}/{repo} ({file_name}): {e}")
+        return None, lines
+    lines.append(f"Parsed YAML from {owner}/{repo} ({file_name}).")
+    return {"url": raw_url, "etag": etag, "sha256": content_hash, "entry": serialize_entry(parsed_yaml)}, lines
+
+def assemble_library(entry_texts):
+    """
+    Builds the aggregated JSON file from serialized entries. The result is
+    byte-for-byte what json.dump({"slaves": entries}, indent=4) would write.
+    """
+    if not entry_texts:
+        return '{\n    "slaves": []\n}'
+    items = [" " * 8 + text.replace("\n", "\n" + " " * 8) for text in entry_texts]
+    return '{\n    "slaves": [\n' + ",\n".join(items) + '\n    ]\n}'
+
+def load_manifest(path):
+    """
+    Loads the per-repository manifest of a previous run, or returns an empty
+    one if it is missing, unreadable or from another manifest version.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("repos", {})
+
+# The fields of each entry that cuprj-cli.py reads. Everything else goes to the detail file.
+RUNTIME_INFO_KEYS = ("name", "description", "category", "tags", "bus", "cell_count")
+RUNTIME_INTERFACE_KEYS = ("name", "port", "direction", "width", "description", "output_control")
+RUNTIME_FLAG_KEYS = ("name", "description")
+RUNTIME_FIFO_KEYS = ("name", "type")
+
+def clean_keys(value):
+    """
+    Recursively strips stray quotes and whitespace from mapping keys, e.g.
+    the malformed 'width"' key some IP YAML files carry.
+    """
+    if isinstance(value, dict):
+        return {str(k).strip().strip("\"'").strip(): clean_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clean_keys(v) for v in value]
+    return value
+
+def _pick(mapping, keys):
+    return {k: mapping[k] for k in keys if k in mapping}
+
+def normalize_entry(entry):
+    """
+    Validates one library entry and splits it into the runtime part read by
+    the CLI and the detail part holding everything else.
+    Returns a tuple (runtime_entry, detail_entry, problems). If the entry is
+    invalid, runtime_entry and detail_entry are None and 'problems' says why.
+    """
+    problems = []
+    if not isinstance(entry, dict):
+        return None, None, ["entry is not a mapping"]
+    entry = clean_keys(entry)
+    info = entry.get("info")
+    if not isinstance(info, dict) or not isinstance(info.get("name"), str) or not info["name"]:
+        return None, None, ["missing 'info.name'"]
+    name = info["name"]
+
+    bus = info.get("bus", [])
+    if isinstance(bus, str):
+        bus = [bus]
+    if not isinstance(bus, list) or not all(isinstance(b, str) for b in bus):
+        problems.append("'info.bus' is not a list of strings")
+        bus = []
+    cell_count = info.get("cell_count", [])
+    if not isinstance(cell_count, list) or not all(isinstance(c, dict) and len(c) == 1 for c in cell_count):
+        problems.append("'info.cell_count' is not a list of single-key mappings")
+        cell_count = []
+    tags = info.get("tags", [])
+    if not isinstance(tags, list):
+        problems.append("'info.tags' is not a list")
+        tags = []
+    runtime_info = _pick(dict(info, bus=bus, cell_count=cell_count, tags=[str(t) for t in tags]), RUNTIME_INFO_KEYS)
+
+    interfaces = []
+    for iface in entry.get("external_interface", []) or []:
+        if not isinstance(iface, dict) or not all(k in iface for k in ("name", "port", "direction", "width")):
+            return None, None, ["an external interface lacks name, port, direction or width"]
+        direction = str(iface["direction"]).lower()
+        if direction not in ("input", "output"):
+            return None, None, [f"external interface '{iface['name']}' has direction '{iface['direction']}'"]
+        try:
+            width = int(iface["width"])
+        except (TypeError, ValueError):
+            return None, None, [f"external interface '{iface['name']}' has non-integer width '{iface['width']}'"]
+        interfaces.append(_pick(dict(iface, direction=direction, width=width), RUNTIME_INTERFACE_KEYS))
+
+    runtime = {"info": runtime_info}
+    if interfaces:
+        runtime["external_interface"] = interfaces
+    if entry.get("flags") is not None:
+        runtime["flags"] = [_pick(f, RUNTIME_FLAG_KEYS) for f in entry["flags"] if isinstance(f, dict)]
+    if entry.get("fifos"):
+        runtime["fifos"] = [_pick(f, RUNTIME_FIFO_KEYS) for f in entry["fifos"] if isinstance(f, dict)]
+    if entry.get("registers"):
+        runtime["registers"] = [{"name": r["name"]} for r in entry["registers"] if isinstance(r, dict) and "name" in r]
+
+    detail = {k: v for k, v in entry.items() if k not in ("info", "external_interface", "flags", "fifos")}
+    detail["info"] = {k: v for k, v in info.items() if k not in RUNTIME_INFO_KEYS or k == "name"}
+    for key in ("external_interface", "flags", "fifos"):
+        if key in entry:
+            detail[key] = entry[key]
+    return runtime, detail, problems
+
+def write_runtime_library(slaves, runtime_filename, detail_filename):
+    """
+    Writes the normalized runtime library as compact JSON with sorted keys,
+    and the fields the CLI does not read into a detail file keyed by IP name.
+    Invalid entries are reported and left out of both files.
+    """
+    runtime_slaves = []
+    details = {}
+    for slave in slaves:
+        runtime, detail, problems = normalize_entry(slave)
+        label = slave.get("info", {}).get("name", "?") if isinstance(slave, dict) else "?"
+        for problem in problems:
+            print(f"{'Skipping' if runtime is None else 'Warning for'} {label}: {problem}")
+        if runtime is None:
+            continue
+        runtime_slaves.append(runtime)
+        details[runtime["info"]["name"]] = detail
+    for filename in (runtime_filename, detail_filename):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(runtime_filename, "w", encoding="utf-8") as runtime_file:
+        json.dump({"slaves": runtime_slaves}, runtime_file, sort_keys=True, separators=(",", ":"), default=str)
+    with open(detail_filename, "w", encoding="utf-8") as detail_file:
+        json.dump({"slaves": details}, detail_file, sort_keys=True, separators=(",", ":"), default=str)
+    print(f"Runtime library saved as: {runtime_filename} ({len(runtime_slaves)} entries)")
+    print(f"Detail file saved as: {detail_filename}")
+    write_offset_index(runtime_filename)
+
+OFFSET_INDEX_FORMAT = "cuprj-offset-index"
+OFFSET_INDEX_VERSION = 1
+
+def write_offset_index(library_filename):
+    """
+    Writes '<library>.offsets.json', mapping each IP name to the byte range
+    [start, end) of its entry in the library file, plus the file's size and
+    SHA-256. The CLI uses it to decode single entries with a seek or an HTTP
+    Range request instead of parsing the whole library.
+    """
+    with open(library_filename, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8")
+    decoder = json.JSONDecoder()
+    entries = {}
+    pos = text.index("[", text.index('"slaves"')) + 1
+    byte_pos = len(text[:pos].encode("utf-8"))
+    while True:
+        while text[pos] in " \t\r\n,":
+            pos += 1
+            byte_pos += 1
+        if text[pos] == "]":
+            break
+        entry, end = decoder.raw_decode(text, pos)
+        byte_end = byte_pos + len(text[pos:end].encode("utf-8"))
+        name = entry.get("info", {}).get("name") if isinstance(entry, dict) else None
+        if name:
+            entries[name] = [byte_pos, byte_end]
+        pos, byte_pos = end, byte_end
+    index = {
+        "format": OFFSET_INDEX_FORMAT,
+        "version": OFFSET_INDEX_VERSION,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "entries": entries,
+    }
+    index_filename = os.path.splitext(library_filename)[0] + ".offsets.json"
+    with open(index_filename, "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, indent=4)
+    print(f"Offset index saved as: {index_filename}")
+
+SHARDED_LIBRARY_FORMAT = "cuprj-sharded-library"
+SHARDED_LIBRARY_VERSION = 1
+
+def wb_cell_count(info):
+    """
+    Returns the WB cell count from an IP's 'info' section, or None if it is
+    missing or not a number (e.g. "TBD").
+    """
+    for entry in info.get("cell_count", []) or []:
+        if isinstance(entry, dict) and "WB" in entry:
+            value = str(entry["WB"])
+            return int(value) if value.isdigit() else None
     return None
 
+def shard_filename(name):
+    """
+    Returns the shard file name of an IP. Plain names (letters, digits, '_',
+    '-' and '.') are used as they are; any other name, e.g. one containing
+    '/' or starting with '..', is reduced to those characters and made unique
+    with a hash, so every shard stays inside 'shards/'.
+    """
+    if re.fullmatch(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*", name):
+        return f"{name}.json"
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", name).lstrip(".")
+    return f"{safe}-{hashlib.sha256(name.encode()).hexdigest()[:12]}.json"
+
+def write_sharded_library(slaves, shard_dir):
+    """
+    Writes the library as a manifest ('index.json') plus one JSON shard per IP
+    under '<shard_dir>/shards/'. The CLI reads only the manifest for 'list' and
+    fetches the shards of the IPs that 'info' and 'generate' actually use.
+    """
+    os.makedirs(os.path.join(shard_dir, "shards"), exist_ok=True)
+    manifest_entries = []
+    for slave in slaves:
+        info = slave.get("info", {}) if isinstance(slave, dict) else {}
+        name = info.get("name")
+        if not name:
+            print("Skipping a library entry without 'info.name' in the sharded output.")
+            continue
+        shard_path = f"shards/{shard_filename(str(name))}"
+        with open(os.path.join(shard_dir, shard_path), "w", encoding="utf-8") as shard_file:
+            json.dump(slave, shard_file, indent=4, default=str)
+        manifest_entries.append({
+            "name": name,
+            "bus": info.get("bus", []),
+            "wb_cell_count": wb_cell_count(info),
+            "category": info.get("category", ""),
+            "tags": info.get("tags", []),
+            "interrupts": slave.get("flags") is not None,
+            "fifos": bool(slave.get("fifos")),
+            "shard": shard_path,
+        })
+    manifest = {
+        "format": SHARDED_LIBRARY_FORMAT,
+        "version": SHARDED_LIBRARY_VERSION,
+        "slaves": manifest_entries,
+    }
+    manifest_filename = os.path.join(shard_dir, "index.json")
+    with open(manifest_filename, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    print(f"Sharded library manifest saved as: {manifest_filename}")
+
 def main():
     parser = argparse.ArgumentParser(
         description="Download YAML files (named after the repo) from GitHub repositories, parse them, and aggregate into a JSON file."
     )
     parser.add_argument(
-        "input_file", 
+        "input_file", nargs="?",
         help="Path to the text file containing GitHub repository URLs (one per line, e.g., 'github.com/owner/repo' or 'owner/repo')."
     )
+    parser.add_argument(
+        "--shard-dir",
+        help="Also write the library as a manifest (index.json) plus one JSON shard per IP into this directory."
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=8,
+        help="Number of repositories fetched concurrently (default: 8)."
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=6,
+        help="Maximum concurrent requests to one host (default: 6)."
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3,
+        help="Retries, with exponential backoff, for connection errors and 429/5xx responses (default: 3)."
+    )
+    parser.add_argument(
+        "--base-url", default=RAW_BASE_URL,
+        help=f"Base URL for raw repository files (default: {RAW_BASE_URL})."
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Per-repository refresh manifest (default: aggregated_slaves.manifest.json)."
+    )
+    parser.add_argument(
+        "--full-refresh", action="store_true",
+        help="Ignore the refresh manifest and re-download and re-parse every repository."
+    )
+    parser.add_argument(
+        "--runtime-output",
+        help="Also write a validated, compact runtime library holding only the fields the CLI reads "
+             "(e.g. ip-lib.json); the other fields go to a '.detail.json' file next to it."
+    )
+    parser.add_argument(
+        "--from-json",
+        help="Index, normalize or shard an existing aggregated JSON file instead of fetching repositories."
+    )
+    parser.add_argument(
+        "--index-input", action="store_true",
+        help="With --from-json, also (re)write the byte-offset sidecar of the input file next to it."
+    )
     args = parser.parse_args()
 
+    if args.from_json:
+        if not (args.index_input or args.runtime_output or args.shard_dir):
+            parser.error("--from-json needs --runtime-output, --shard-dir or --index-input.")
+        with open(args.from_json, "r", encoding="utf-8") as f:
+            slaves = json.load(f).get("slaves", [])
+        # The input may be a tracked file (e.g. ip-lib.json); its sidecar is only rewritten on request.
+        if args.index_input:
+            write_offset_index(args.from_json)
+        write_outputs(slaves, args)
+        return
+    if not args.input_file:
+        parser.error("input_file is required unless --from-json is given.")
+
     if not os.path.exists(args.input_file):
         print(f"Input file '{args.input_file}' not found.")
         return
@@ -57,34 +471,55 @@ def main():
     with open(args.input_file, "r") as f:
         repo_urls = [line.strip() for line in f if line.strip()]
     
-    aggregated_slaves = []  # This list will store the parsed YAML content from each repo
+    output_filename = "aggregated_slaves.json"
+    manifest_filename = args.manifest or os.path.splitext(output_filename)[0] + ".manifest.json"
+    previous = {} if args.full_refresh else load_manifest(manifest_filename)
+
+    jobs = max(1, args.jobs)
+    session = make_session(jobs, args.retries)
+    host_limiter = HostLimiter(max(1, args.per_host))
+    base_url = args.base_url.rstrip("/")
 
-    for url in repo_urls:
+    def work(url):
         owner, repo = parse_repo_url(url)
-        if not owner or not repo:
-            print(f"Could not parse repository information from URL: {url}")
-            continue
+        key = f"{owner}/{repo}"
+        return key, process_repo(url, session, base_url, host_limiter, previous.get(key))
 
-        print(f"Processing repository: {owner}/{repo}")
-        result = fetch_yaml_from_repo(owner, repo)
-        if result:
-            file_name, content = result
-            try:
-                parsed_yaml = yaml.safe_load(content)
-                aggregated_slaves.append(parsed_yaml)
-                print(f"Parsed YAML from {owner}/{repo} ({file_name}).")
-            except yaml.YAMLError as e:
-                print(f"Error parsing YAML from {owner}/{repo} ({file_name}): {e}")
-        print("-" * 40)
-    
-    # Aggregate the parsed YAML into a JSON structure under the key 'slaves'
-    aggregated_data = {"slaves": aggregated_slaves}
+    repos = {}
+    entry_texts = []  # This list will store the serialized entry of each repo
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # map() returns results in input order, so the output does not depend on completion order.
+        for key, (record, lines) in pool.map(work, repo_urls):
+            for line in lines:
+                print(line)
+            if record is not None:
+                repos[key] = record
+                entry_texts.append(record["entry"])
+            print("-" * 40)
     
-    output_filename = "aggregated_slaves.json"
+    # Aggregate the entries into a JSON structure under the key 'slaves'
     with open(output_filename, "w", encoding="utf-8") as out_file:
-        json.dump(aggregated_data, out_file, indent=4, default=str)
+        out_file.write(assemble_library(entry_texts))
     
     print(f"\nAggregated JSON file saved as: {output_filename}")
+    write_offset_index(output_filename)
+
+    with open(manifest_filename, "w", encoding="utf-8") as manifest_file:
+        json.dump({"version": MANIFEST_VERSION, "repos": repos}, manifest_file, indent=4)
+    print(f"Refresh manifest saved as: {manifest_filename}")
+
+    if args.shard_dir or args.runtime_output:
+        write_outputs([json.loads(text) for text in entry_texts], args)
+
+def write_outputs(slaves, args):
+    """
+    Writes the optional derived outputs (runtime library, sharded library).
+    """
+    if args.runtime_output:
+        detail_filename = os.path.splitext(args.runtime_output)[0] + ".detail.json"
+        write_runtime_library(slaves, args.runtime_output, detail_filename)
+    if args.shard_dir:
+        write_sharded_library(slaves, args.shard_dir)
 
 if __name__ == "__main__":
     main()